@@ -0,0 +1,158 @@
+import asyncio
+import time
+from datetime import datetime
+from typing import Any, Dict, List, Optional, Tuple
+
+from app.config import settings
+
+AuditRecord = Tuple[int, str, datetime]  # (user_id, action, timestamp)
+
+
+class AuditLogWriter:
+    """
+    Фоновая пакетная запись аудита в таблицу logs.
+
+    Записи копятся в ограниченной очереди и сбрасываются одним INSERT, когда
+    набирается batch_size записей или проходит flush_interval секунд с первой
+    записи пакета. При заполненной очереди write() ждёт освобождения места
+    (обратное давление на обработчики запросов). stop() дописывает всё, что
+    осталось в очереди. Пока писатель не запущен, write() пишет сразу.
+
+    Неудачный пакет повторяется до max_retries раз. Если ошибка не проходит
+    (например, слишком длинный action или нарушение внешнего ключа), пакет
+    делится пополам до отдельных записей: плохие отбрасываются, остальные
+    пишутся, и очередь не останавливается.
+    """
+
+    def __init__(self, batch_size: int, flush_interval: float, max_queue: int, max_retries: int = 3):
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.max_queue = max_queue
+        self.max_retries = max_retries
+        self._queue: Optional[asyncio.Queue] = None
+        self._task: Optional[asyncio.Task] = None
+        self._stats = {
+            "records_written": 0,
+            "batches_written": 0,
+            "records_lost": 0,
+            "flush_errors": 0,
+            "batches_split": 0,
+            "backpressure_waits": 0,
+            "flush_ms_max": 0.0,
+        }
+
+    @property
+    def running(self) -> bool:
+        return self._task is not None
+
+    def start(self):
+        if self._task is None:
+            self._queue = asyncio.Queue(maxsize=self.max_queue)
+            self._task = asyncio.create_task(self._run(), name="audit-log-writer")
+
+    async def stop(self):
+        """Остановить приём записей и дописать очередь"""
+        if self._task is None:
+            return
+        await self._queue.put(None)
+        await self._task
+        self._task = None
+        self._queue = None
+
+    async def write(self, user_id: int, action: str, timestamp: datetime):
+        """Поставить запись в очередь (или записать сразу, если писатель не запущен)"""
+        record = (user_id, action, timestamp)
+        if self._task is None:
+            await self._flush([record])
+            return
+        if self._queue.full():
+            self._stats["backpressure_waits"] += 1
+        await self._queue.put(record)
+
+    async def _run(self):
+        stopping = False
+        while not stopping:
+            item = await self._queue.get()
+            if item is None:
+                break
+            batch: List[AuditRecord] = [item]
+            deadline = time.monotonic() + self.flush_interval
+            while len(batch) < self.batch_size:
+                timeout = deadline - time.monotonic()
+                if timeout <= 0:
+                    break
+                try:
+                    item = await asyncio.wait_for(self._queue.get(), timeout)
+                except asyncio.TimeoutError:
+                    break
+                if item is None:
+                    stopping = True
+                    break
+                batch.append(item)
+            await self._flush_with_retry(batch, final=stopping)
+
+    async def _flush_with_retry(self, batch: List[AuditRecord], final: bool):
+        """
+        Записать пакет; при ошибке повторять раз в flush_interval, но не больше
+        max_retries раз (при остановке — одна попытка), затем делить пакет
+        """
+        attempts = 0
+        while True:
+            try:
+                await self._flush(batch)
+                return
+            except Exception as e:
+                self._stats["flush_errors"] += 1
+                attempts += 1
+                print(f"✗ Audit log flush failed ({len(batch)} records, attempt {attempts}): {e}")
+                if final:
+                    self._stats["records_lost"] += len(batch)
+                    return
+                if attempts >= self.max_retries:
+                    break
+                await asyncio.sleep(self.flush_interval)
+        await self._flush_split(batch)
+
+    async def _flush_split(self, batch: List[AuditRecord]):
+        """Записать половины пакета по отдельности; запись, не проходящая и одна, теряется"""
+        if len(batch) == 1:
+            self._stats["records_lost"] += 1
+            print(f"✗ Audit record dropped: user {batch[0][0]}, action {batch[0][1][:80]!r}")
+            return
+        self._stats["batches_split"] += 1
+        middle = len(batch) // 2
+        for half in (batch[:middle], batch[middle:]):
+            try:
+                await self._flush(half)
+            except Exception:
+                self._stats["flush_errors"] += 1
+                await self._flush_split(half)
+
+    async def _flush(self, batch: List[AuditRecord]):
+        from app.sql import queries
+        started = time.monotonic()
+        await queries.insert_logs_batch(batch)
+        elapsed_ms = (time.monotonic() - started) * 1000
+        self._stats["records_written"] += len(batch)
+        self._stats["batches_written"] += 1
+        self._stats["flush_ms_max"] = max(self._stats["flush_ms_max"], round(elapsed_ms, 3))
+
+    def get_stats(self) -> Dict[str, Any]:
+        """Счётчики писателя и текущая длина очереди"""
+        return {
+            **self._stats,
+            "mode": settings.AUDIT_LOG_MODE,
+            "running": self.running,
+            "queued": self._queue.qsize() if self._queue is not None else 0,
+            "max_queue": self.max_queue,
+            "batch_size": self.batch_size,
+            "flush_interval": self.flush_interval,
+        }
+
+
+audit_writer = AuditLogWriter(
+    batch_size=settings.AUDIT_LOG_BATCH_SIZE,
+    flush_interval=settings.AUDIT_LOG_FLUSH_INTERVAL,
+    max_queue=settings.AUDIT_LOG_QUEUE_SIZE,
+    max_retries=settings.AUDIT_LOG_MAX_RETRIES,
+)
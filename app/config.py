@@ -8,7 +8,78 @@ class Settings(BaseSettings):
     DATABASE_NAME: str = "smart_home"
     DATABASE_USER: str = "smart_user"
     DATABASE_PASSWORD: str = "smart_password"
-    
+
+    # Пул подключений (таймауты и интервалы — в секундах)
+    DATABASE_POOL_MIN_SIZE: int = 2
+    DATABASE_POOL_MAX_SIZE: int = 20
+    DATABASE_POOL_TIMEOUT: float = 30.0
+    DATABASE_POOL_MAX_IDLE: float = 600.0
+    DATABASE_POOL_MAX_LIFETIME: float = 3600.0
+    DATABASE_POOL_CHECK_INTERVAL: float = 5.0
+
+    # Реплики для чтения: DSN через запятую (недостающие параметры берутся у основной БД).
+    # Чтения уходят на основную БД, если отставание реплики больше MAX_LAG секунд;
+    # TIMEOUT — ожидание подключения к реплике, CHECK_INTERVAL — период проверки отставания.
+    # Роли приложения на реплике нужна pg_read_all_stats (статус pg_stat_wal_receiver)
+    DATABASE_REPLICA_URLS: str = ""
+    DATABASE_REPLICA_MAX_LAG: float = 5.0
+    DATABASE_REPLICA_TIMEOUT: float = 2.0
+    DATABASE_REPLICA_CHECK_INTERVAL: float = 1.0
+
+    # Максимальное число событий в одном запросе POST /events/batch
+    EVENTS_BATCH_MAX_SIZE: int = 10000
+
+    # Максимум id устройств в одном запросе массовой смены статуса
+    DEVICES_BULK_MAX_SIZE: int = 10000
+
+    # Кэш аутентифицированных пользователей (TTL — в секундах)
+    PRINCIPAL_CACHE_SIZE: int = 10000
+    PRINCIPAL_CACHE_TTL: float = 60.0
+
+    # Пагинация списков событий и логов
+    PAGE_DEFAULT_LIMIT: int = 100
+    PAGE_MAX_LIMIT: int = 1000
+
+    # Размер порции строк при потоковой выгрузке
+    EXPORT_CHUNK_SIZE: int = 5000
+
+    # Секционирование events/logs: сколько месяцев вперёд держать секции,
+    # сколько полных месяцев хранить (0 — без ограничения), период обслуживания (сек)
+    PARTITION_PREMAKE_MONTHS: int = 3
+    EVENTS_RETENTION_MONTHS: int = 0
+    LOGS_RETENTION_MONTHS: int = 0
+    PARTITION_MAINTENANCE_INTERVAL: float = 3600.0
+
+    # Материализованные представления аналитики: предельная давность данных (сек),
+    # после которой представление обновляется, и период проверки давности (сек)
+    ANALYTICS_VIEWS_MAX_STALENESS: float = 300.0
+    ANALYTICS_VIEWS_CHECK_INTERVAL: float = 30.0
+
+    # Аудит: buffered — фоновая пакетная запись после commit (по размеру пакета
+    # или по времени, очередь ограничена), sync — запись в транзакции изменения.
+    # После MAX_RETRIES неудачных попыток пакет делится пополам, записи, которые
+    # не пишутся и поодиночке, отбрасываются (records_lost)
+    AUDIT_LOG_MODE: str = "buffered"
+    AUDIT_LOG_BATCH_SIZE: int = 500
+    AUDIT_LOG_FLUSH_INTERVAL: float = 1.0
+    AUDIT_LOG_QUEUE_SIZE: int = 10000
+    AUDIT_LOG_MAX_RETRIES: int = 3
+
+    # Push событий (SSE): очередь на подписчика, период keepalive и пауза
+    # перед переподключением слушателя LISTEN (сек)
+    REALTIME_QUEUE_SIZE: int = 1000
+    REALTIME_KEEPALIVE_INTERVAL: float = 15.0
+    REALTIME_RECONNECT_DELAY: float = 1.0
+
+    # Агрегация показаний датчиков: максимум интервалов в одном ответе
+    SENSOR_READINGS_MAX_BUCKETS: int = 10000
+
+    # Кэш скомпилированных правил автоматики (по домам) и привязки устройств к домам
+    RULE_CACHE_SIZE: int = 10000
+    RULE_CACHE_TTL: float = 60.0
+    RULE_DEVICE_CACHE_SIZE: int = 100000
+    RULE_DEVICE_CACHE_TTL: float = 3600.0
+
     JWT_SECRET_KEY: str = "supersecretjwtkeychangeme"
     JWT_ALGORITHM: str = "HS256"
     ACCESS_TOKEN_EXPIRE_MINUTES: int = 60
@@ -1,7 +1,426 @@
+import functools
+import inspect
+import json
+import operator
+import threading
+import time
+import uuid
+import weakref
+from collections import deque
+from contextvars import ContextVar
+from contextlib import asynccontextmanager, contextmanager
+from datetime import date, datetime
+from decimal import Decimal
+
+import psycopg
 import psycopg2
+from psycopg.conninfo import conninfo_to_dict, make_conninfo
+from psycopg.rows import dict_row, tuple_row
+from psycopg2 import extensions
 from psycopg2.extras import RealDictCursor
+from psycopg_pool import AsyncConnectionPool
 from app.config import settings
-from typing import Optional, List, Dict, Any
+from typing import Optional, List, Dict, Any, AsyncIterator, Awaitable, Callable, Sequence, Tuple, Union
+
+try:
+    import orjson
+except ImportError:  # без orjson — стандартный json: медленнее, формат тот же
+    orjson = None
+
+
+# Ключ advisory-блокировки для init_schema
+SCHEMA_LOCK_ID = 7_451_002
+
+# Подключение единицы работы текущего запроса (см. AsyncDatabase.unit_of_work)
+_uow_connection: ContextVar[Optional["psycopg.AsyncConnection"]] = ContextVar("uow_connection", default=None)
+_uow_after_commit: ContextVar[Optional[List[Callable[[], Any]]]] = ContextVar("uow_after_commit", default=None)
+# Запросы функции, помеченной read_only, можно отправить на реплику
+_read_only: ContextVar[bool] = ContextVar("read_only", default=False)
+# Состояние HTTP-запроса для read-your-writes (см. AsyncDatabase.request_scope)
+# ("wrote" — запрос уже писал, "replica" — выбранная для его чтений реплика или None)
+_request_state: ContextVar[Optional[Dict[str, Any]]] = ContextVar("request_state", default=None)
+
+# Отставание реплики в секундах; 0, если всё полученное WAL уже применено.
+# Полученное = применённое и у реплики, потерявшей поток WAL, поэтому отставание
+# учитывается только при streaming-статусе приёмника WAL (NULL — статус не виден
+# роли без pg_read_all_stats — тоже считается недоступностью)
+REPLICA_LAG_SQL = """
+    SELECT pg_is_in_recovery(),
+           COALESCE((SELECT status = 'streaming' FROM pg_stat_wal_receiver), false),
+           CASE WHEN pg_last_wal_receive_lsn() = pg_last_wal_replay_lsn() THEN 0
+                ELSE COALESCE(EXTRACT(EPOCH FROM now() - pg_last_xact_replay_timestamp()), 0)
+           END
+"""
+
+# Ошибки реплики, после которых чтение повторяется на основной БД
+# (SerializationFailure — отмена запроса из-за конфликта с восстановлением)
+REPLICA_ERRORS = (psycopg.OperationalError, psycopg.errors.SerializationFailure)
+
+
+# Имена колонок выборки и строки-кортежи (см. AsyncDatabase.fetch_rows)
+Rows = Tuple[Tuple[str, ...], List[tuple]]
+
+
+class Statement:
+    """
+    Запрос каталога app.sql.queries (см. AsyncDatabase.statement).
+
+    На каждом подключении пула готовится при первом выполнении (psycopg
+    prepare=True) и дальше выполняется без разбора и планирования.
+    Счётчики выполнений — общие для всех подключений.
+    """
+
+    __slots__ = ("name", "sql", "calls", "errors", "total_ms", "max_ms")
+
+    def __init__(self, name: str, sql: str):
+        self.name = name
+        self.sql = sql
+        self.calls = 0
+        self.errors = 0
+        self.total_ms = 0.0
+        self.max_ms = 0.0
+
+    def record(self, elapsed_ms: float):
+        self.calls += 1
+        self.total_ms += elapsed_ms
+        if elapsed_ms > self.max_ms:
+            self.max_ms = elapsed_ms
+
+    def get_stats(self) -> Dict[str, Any]:
+        return {
+            "calls": self.calls,
+            "errors": self.errors,
+            "total_ms": round(self.total_ms, 3),
+            "avg_ms": round(self.total_ms / self.calls, 3) if self.calls else 0.0,
+            "max_ms": round(self.max_ms, 3),
+        }
+
+
+Query = Union[str, Statement]
+
+
+def _is_stale_plan(e: Exception) -> bool:
+    """Подготовленный запрос устарел: после ALTER TABLE изменился состав колонок SELECT *"""
+    return isinstance(e, psycopg.errors.FeatureNotSupported) and "cached plan must not change result type" in str(e)
+
+
+def read_only(func: Callable[..., Awaitable[Any]]) -> Callable[..., Awaitable[Any]]:
+    """Декоратор функций app.sql.queries, которые только читают: их запросы можно выполнить на реплике"""
+    @functools.wraps(func)
+    async def wrapper(*args, **kwargs):
+        token = _read_only.set(True)
+        try:
+            return await func(*args, **kwargs)
+        finally:
+            _read_only.reset(token)
+    return wrapper
+
+
+class Replica:
+    """
+    Реплика для чтения: свой пул подключений и отдельное подключение для
+    проверки отставания. Пока отставание не измерено, превышает допустимое
+    или реплика недоступна, чтения идут на основную БД.
+    """
+
+    def __init__(self, conninfo: str, pool: AsyncConnectionPool):
+        params = conninfo_to_dict(conninfo)
+        self.name = f"{params.get('host', 'localhost')}:{params.get('port', 5432)}"
+        self.conninfo = conninfo
+        self.pool = pool
+        self.lag: Optional[float] = None
+        self.error: Optional[str] = None
+        self.reads = 0
+        self.failures = 0
+        self._monitor: Optional[psycopg.AsyncConnection] = None
+
+    def available(self, max_lag: float) -> bool:
+        return self.error is None and self.lag is not None and self.lag <= max_lag
+
+    def failed(self, e: Exception):
+        """Ошибка чтения: реплика выключается до следующей успешной проверки отставания"""
+        self.failures += 1
+        self.error = str(e) or type(e).__name__
+
+    async def check_lag(self, timeout: float):
+        """Измерить отставание; ошибка подключения или не-standby делают реплику недоступной"""
+        try:
+            if self._monitor is None or self._monitor.closed:
+                self._monitor = await psycopg.AsyncConnection.connect(
+                    self.conninfo, autocommit=True, connect_timeout=max(1, int(timeout))
+                )
+            cur = await self._monitor.execute(REPLICA_LAG_SQL)
+            in_recovery, streaming, lag = await cur.fetchone()
+        except psycopg.Error as e:
+            await self.close_monitor()
+            self.lag, self.error = None, str(e) or type(e).__name__
+            return
+        if not in_recovery:
+            self.lag, self.error = None, "not a standby (pg_is_in_recovery() is false)"
+            return
+        if not streaming:
+            self.lag, self.error = None, "WAL receiver is not streaming (or its status is not visible)"
+            return
+        self.lag, self.error = float(lag), None
+
+    async def close_monitor(self):
+        if self._monitor is not None:
+            try:
+                await self._monitor.close()
+            except psycopg.Error:
+                pass
+            self._monitor = None
+
+    def get_stats(self, max_lag: float) -> Dict[str, Any]:
+        return {
+            "available": self.available(max_lag),
+            "lag_seconds": round(self.lag, 3) if self.lag is not None else None,
+            "error": self.error,
+            "reads": self.reads,
+            "failures": self.failures,
+            "pool": self.pool.get_stats(),
+        }
+
+
+class PoolError(Exception):
+    """Ошибка пула подключений"""
+
+
+class PoolTimeout(PoolError):
+    """Не удалось получить подключение из пула за отведённое время"""
+
+
+class ConnectionPool:
+    """
+    Потокобезопасный пул подключений psycopg2.
+
+    - держит не меньше min_size и не больше max_size открытых подключений;
+    - если свободных подключений нет, запрос ждёт до timeout секунд;
+    - подключения, простаивающие дольше max_idle, закрываются (сверх min_size);
+    - подключения старше max_lifetime пересоздаются;
+    - при выдаче подключение, простоявшее дольше check_interval, проверяется SELECT 1.
+    """
+
+    def __init__(
+        self,
+        connect: Callable[[], Any],
+        min_size: int = 1,
+        max_size: int = 10,
+        timeout: float = 30.0,
+        max_idle: float = 600.0,
+        max_lifetime: float = 3600.0,
+        check_interval: float = 5.0,
+    ):
+        if min_size < 0 or max_size < 1 or min_size > max_size:
+            raise ValueError("invalid pool size: min_size=%s, max_size=%s" % (min_size, max_size))
+        self._connect = connect
+        self.min_size = min_size
+        self.max_size = max_size
+        self.timeout = timeout
+        self.max_idle = max_idle
+        self.max_lifetime = max_lifetime
+        self.check_interval = check_interval
+
+        self._cond = threading.Condition()
+        self._idle = deque()  # (conn, last_used), справа — самые свежие
+        self._created_at: Dict[int, float] = {}
+        self._size = 0  # открытые подключения: свободные + выданные
+        self._closed = False
+
+        self._stats = {
+            "connections_num": 0,
+            "connections_lost": 0,
+            "connections_recycled": 0,
+            "requests_num": 0,
+            "requests_waiting": 0,
+            "requests_wait_ms": 0.0,
+            "requests_wait_max_ms": 0.0,
+            "requests_timeouts": 0,
+        }
+
+    # -------------------- жизненный цикл --------------------
+
+    def open(self):
+        """Заполнить пул до min_size подключений"""
+        with self._cond:
+            self._closed = False
+        while True:
+            # слот резервируется под каждое подключение: при ошибке освобождается только он
+            with self._cond:
+                if self._size >= self.min_size:
+                    return
+                self._size += 1
+            try:
+                conn = self._new_connection()
+            except Exception:
+                self._release_slot()
+                raise
+            with self._cond:
+                self._idle.append((conn, time.monotonic()))
+                self._cond.notify()
+
+    def close(self):
+        """Закрыть пул: свободные подключения закрываются сразу, выданные — при возврате"""
+        with self._cond:
+            self._closed = True
+            idle, self._idle = list(self._idle), deque()
+            self._size -= len(idle)
+            self._cond.notify_all()
+        for conn, _ in idle:
+            self._close_connection(conn)
+
+    # -------------------- выдача и возврат --------------------
+
+    def getconn(self, timeout: Optional[float] = None):
+        """Взять подключение из пула (ждёт, если все подключения заняты)"""
+        timeout = self.timeout if timeout is None else timeout
+        started = time.monotonic()
+        deadline = started + timeout
+        entry = None
+
+        with self._cond:
+            self._stats["requests_num"] += 1
+            self._stats["requests_waiting"] += 1
+            try:
+                while True:
+                    if self._closed:
+                        raise PoolError("connection pool is closed")
+                    self._prune_idle()
+                    if self._idle:
+                        entry = self._idle.pop()
+                        break
+                    if self._size < self.max_size:
+                        self._size += 1
+                        break
+                    remaining = deadline - time.monotonic()
+                    if remaining <= 0:
+                        self._stats["requests_timeouts"] += 1
+                        raise PoolTimeout(
+                            "couldn't get a connection after %.2f sec" % timeout
+                        )
+                    self._cond.wait(remaining)
+            finally:
+                self._stats["requests_waiting"] -= 1
+                waited_ms = (time.monotonic() - started) * 1000
+                self._stats["requests_wait_ms"] += waited_ms
+                self._stats["requests_wait_max_ms"] = max(self._stats["requests_wait_max_ms"], waited_ms)
+
+        if entry is not None:
+            conn = self._checked(*entry)
+            if conn is not None:
+                return conn
+
+        # слот уже зарезервирован: открываем новое подключение вне блокировки
+        try:
+            return self._new_connection()
+        except Exception:
+            self._release_slot()
+            raise
+
+    def putconn(self, conn, discard: bool = False):
+        """Вернуть подключение в пул"""
+        if not discard and not conn.closed:
+            status = conn.get_transaction_status()
+            if status == extensions.TRANSACTION_STATUS_UNKNOWN:
+                discard = True
+            elif status != extensions.TRANSACTION_STATUS_IDLE:
+                try:
+                    conn.rollback()
+                except psycopg2.Error:
+                    discard = True
+
+        if discard or conn.closed or self._expired(conn):
+            self._discard(conn)
+            return
+
+        with self._cond:
+            if self._closed:
+                self._size -= 1
+                close = True
+            else:
+                self._idle.append((conn, time.monotonic()))
+                close = False
+            self._cond.notify()
+        if close:
+            self._close_connection(conn)
+
+    def get_stats(self) -> Dict[str, Any]:
+        """Метрики пула (размер, ожидание подключений, потери)"""
+        with self._cond:
+            stats = dict(self._stats)
+            stats["pool_min"] = self.min_size
+            stats["pool_max"] = self.max_size
+            stats["pool_size"] = self._size
+            stats["pool_available"] = len(self._idle)
+        stats["requests_wait_ms"] = round(stats["requests_wait_ms"], 3)
+        stats["requests_wait_max_ms"] = round(stats["requests_wait_max_ms"], 3)
+        stats["requests_wait_avg_ms"] = (
+            round(stats["requests_wait_ms"] / stats["requests_num"], 3) if stats["requests_num"] else 0.0
+        )
+        return stats
+
+    # -------------------- служебное --------------------
+
+    def _new_connection(self):
+        conn = self._connect()
+        with self._cond:
+            self._created_at[id(conn)] = time.monotonic()
+            self._stats["connections_num"] += 1
+        return conn
+
+    def _checked(self, conn, last_used: float):
+        """Проверить подключение перед выдачей; None — подключение выброшено, слот остаётся за вызывающим"""
+        if conn.closed or self._expired(conn):
+            self._drop(conn, lost=conn.closed)
+            return None
+        if time.monotonic() - last_used >= self.check_interval:
+            try:
+                cur = conn.cursor()
+                cur.execute("SELECT 1")
+                cur.close()
+                conn.rollback()
+            except psycopg2.Error:
+                self._drop(conn, lost=True)
+                return None
+        return conn
+
+    def _expired(self, conn) -> bool:
+        created_at = self._created_at.get(id(conn))
+        return created_at is not None and time.monotonic() - created_at > self.max_lifetime
+
+    def _prune_idle(self):
+        """Закрыть подключения, простаивающие дольше max_idle (вызывается под блокировкой)"""
+        now = time.monotonic()
+        while self._idle and self._size > self.min_size and now - self._idle[0][1] > self.max_idle:
+            conn, _ = self._idle.popleft()
+            self._size -= 1
+            self._stats["connections_recycled"] += 1
+            self._close_connection(conn)
+
+    def _drop(self, conn, lost: bool):
+        """Закрыть подключение, не освобождая его слот"""
+        with self._cond:
+            if lost:
+                self._stats["connections_lost"] += 1
+            else:
+                self._stats["connections_recycled"] += 1
+        self._close_connection(conn)
+
+    def _discard(self, conn):
+        self._drop(conn, lost=conn.closed)
+        self._release_slot()
+
+    def _release_slot(self):
+        with self._cond:
+            self._size -= 1
+            self._cond.notify()
+
+    def _close_connection(self, conn):
+        self._created_at.pop(id(conn), None)
+        try:
+            conn.close()
+        except Exception:
+            pass
 
 
 class Database:
@@ -13,91 +432,568 @@ class Database:
             "host": settings.DATABASE_HOST,
             "port": settings.DATABASE_PORT,
         }
+        self.pool = ConnectionPool(
+            self.get_connection,
+            min_size=settings.DATABASE_POOL_MIN_SIZE,
+            max_size=settings.DATABASE_POOL_MAX_SIZE,
+            timeout=settings.DATABASE_POOL_TIMEOUT,
+            max_idle=settings.DATABASE_POOL_MAX_IDLE,
+            max_lifetime=settings.DATABASE_POOL_MAX_LIFETIME,
+            check_interval=settings.DATABASE_POOL_CHECK_INTERVAL,
+        )
 
     def get_connection(self):
-        """Открыть подключение к БД"""
+        """Открыть новое подключение к БД (в обход пула)"""
         return psycopg2.connect(**self.conn_params)
 
+    @contextmanager
+    def connection(self):
+        """Взять подключение из пула на время блока with"""
+        conn = self.pool.getconn()
+        try:
+            yield conn
+        finally:
+            self.pool.putconn(conn)
+
+    def open(self):
+        """Открыть пул подключений"""
+        self.pool.open()
+
+    def close(self):
+        """Закрыть пул подключений"""
+        self.pool.close()
+
     def execute_query(self, query: str, params: tuple = None) -> List[Dict[str, Any]]:
         """Выполнить SELECT-запрос, вернуть список словарей"""
-        conn = self.get_connection()
-        try:
+        with self.connection() as conn:
             cur = conn.cursor(cursor_factory=RealDictCursor)
             cur.execute(query, params or ())
             result = cur.fetchall()
             cur.close()
             return result
-        finally:
-            conn.close()
 
     def execute_single(self, query: str, params: tuple = None) -> Optional[Dict[str, Any]]:
         """Выполнить SELECT-запрос, вернуть одну строку"""
-        conn = self.get_connection()
-        try:
+        with self.connection() as conn:
             cur = conn.cursor(cursor_factory=RealDictCursor)
             cur.execute(query, params or ())
             result = cur.fetchone()
             cur.close()
             return result
-        finally:
-            conn.close()
 
     def execute_insert(self, query: str, params: tuple = None) -> Dict[str, Any]:
         """Выполнить INSERT-запрос (с RETURNING), вернуть вставленную строку"""
-        conn = self.get_connection()
-        try:
-            cur = conn.cursor(cursor_factory=RealDictCursor)
-            cur.execute(query, params or ())
-            result = cur.fetchone()
-            conn.commit()
-            cur.close()
-            return result
-        except Exception as e:
-            conn.rollback()
-            raise e
-        finally:
-            conn.close()
+        with self.connection() as conn:
+            try:
+                cur = conn.cursor(cursor_factory=RealDictCursor)
+                cur.execute(query, params or ())
+                result = cur.fetchone()
+                conn.commit()
+                cur.close()
+                return result
+            except Exception as e:
+                conn.rollback()
+                raise e
 
     def execute_update(self, query: str, params: tuple = None) -> int:
         """Выполнить UPDATE/DELETE-запрос, вернуть количество измененных строк"""
-        conn = self.get_connection()
+        with self.connection() as conn:
+            try:
+                cur = conn.cursor()
+                cur.execute(query, params or ())
+                affected = cur.rowcount
+                conn.commit()
+                cur.close()
+                return affected
+            except Exception as e:
+                conn.rollback()
+                raise e
+
+    def init_schema(self):
+        """Инициализировать схему БД из init.sql и применить миграции"""
+        from app.sql import init_sql, migrations
+        with self.connection() as conn:
+            try:
+                cur = conn.cursor()
+                # воркеры uvicorn стартуют одновременно — инициализация идёт по очереди
+                cur.execute("SELECT pg_advisory_xact_lock(%s)", (SCHEMA_LOCK_ID,))
+                cur.execute("SELECT to_regclass('public.homes') IS NULL")
+                fresh = cur.fetchone()[0]
+
+                migrations.ensure_table(cur)
+                applied = [] if fresh else migrations.apply_pending(cur)
+                cur.execute(init_sql.INIT_SQL)
+                if fresh:
+                    migrations.mark_all_applied(cur)
+
+                conn.commit()
+                cur.close()
+                print("✓ Schema initialized successfully")
+                for version in applied:
+                    print(f"✓ Migration applied: {version}")
+            except psycopg2.errors.DuplicateTable:
+                conn.rollback()
+                print("✓ Schema already exists")
+            except Exception as e:
+                conn.rollback()
+                print(f"✗ Error initializing schema: {e}")
+                raise
+
+
+class AsyncDatabase:
+    """
+    Асинхронный аналог Database для обработчиков FastAPI.
+
+    Работает на psycopg 3 и AsyncConnectionPool: плейсхолдеры %s те же,
+    строки возвращаются словарями (dict_row), как у RealDictCursor.
+    """
+
+    def __init__(self):
+        self.conninfo = make_conninfo(
+            dbname=settings.DATABASE_NAME,
+            user=settings.DATABASE_USER,
+            password=settings.DATABASE_PASSWORD,
+            host=settings.DATABASE_HOST,
+            port=settings.DATABASE_PORT,
+        )
+        self.check_interval = settings.DATABASE_POOL_CHECK_INTERVAL
+        self._last_used = weakref.WeakKeyDictionary()
+        # каталог подготовленных запросов и его поколение: после изменения схемы
+        # поколение растёт, и подключения сбрасывают свои подготовленные запросы
+        self.statements: Dict[str, Statement] = {}
+        self._statements_generation = 0
+        self._statements_invalidations = 0
+        self._generations = weakref.WeakKeyDictionary()
+        self.pool = self._make_pool(self.conninfo, settings.DATABASE_POOL_TIMEOUT)
+        # реплики: недостающие в DSN параметры (пользователь, пароль, база) берутся у основной БД
+        self.max_replica_lag = settings.DATABASE_REPLICA_MAX_LAG
+        self.replica_timeout = settings.DATABASE_REPLICA_TIMEOUT
+        self.replicas: List[Replica] = []
+        for dsn in settings.DATABASE_REPLICA_URLS.split(","):
+            if dsn.strip():
+                conninfo = make_conninfo(self.conninfo, **conninfo_to_dict(dsn.strip()))
+                self.replicas.append(Replica(conninfo, self._make_pool(conninfo, self.replica_timeout)))
+        self._next_replica = 0
+        self._routing = {"replica_reads": 0, "primary_reads": 0, "lag_fallbacks": 0, "error_fallbacks": 0}
+
+    def _make_pool(self, conninfo: str, timeout: float) -> AsyncConnectionPool:
+        return AsyncConnectionPool(
+            conninfo,
+            min_size=settings.DATABASE_POOL_MIN_SIZE,
+            max_size=settings.DATABASE_POOL_MAX_SIZE,
+            timeout=timeout,
+            max_idle=settings.DATABASE_POOL_MAX_IDLE,
+            max_lifetime=settings.DATABASE_POOL_MAX_LIFETIME,
+            kwargs={"row_factory": dict_row},
+            check=self._check_connection,
+            reset=self._mark_used,
+            open=False,
+        )
+
+    async def _check_connection(self, conn: psycopg.AsyncConnection):
+        """
+        Проверить подключение перед выдачей, если оно простаивало дольше check_interval,
+        и сбросить его подготовленные запросы, если каталог с тех пор инвалидирован.
+        """
+        last_used = self._last_used.get(conn)
+        if last_used is None or time.monotonic() - last_used >= self.check_interval:
+            await AsyncConnectionPool.check_connection(conn)
+        generation = self._generations.setdefault(conn, self._statements_generation)
+        if generation != self._statements_generation:
+            # psycopg забывает подготовленные запросы (и делает DEALLOCATE ALL) при ROLLBACK
+            await conn.execute("SELECT 1")
+            await conn.rollback()
+            self._generations[conn] = self._statements_generation
+
+    async def _mark_used(self, conn: psycopg.AsyncConnection):
+        self._last_used[conn] = time.monotonic()
+
+    async def open(self):
+        """Открыть пул подключений (и пулы реплик — без ожидания: недоступная реплика не мешает старту)"""
+        await self.pool.open(wait=True)
+        for replica in self.replicas:
+            await replica.pool.open(wait=False)
+        await self.check_replicas()
+
+    async def close(self):
+        """Закрыть пул подключений"""
+        for replica in self.replicas:
+            await replica.close_monitor()
+            await replica.pool.close()
+        await self.pool.close()
+
+    def get_stats(self) -> Dict[str, Any]:
+        """Метрики пула (размер, ожидание подключений, потери)"""
+        return self.pool.get_stats()
+
+    # -------------------- реплики --------------------
+
+    async def check_replicas(self):
+        """Обновить отставание реплик (вызывается фоновой задачей)"""
+        for replica in self.replicas:
+            was_available = replica.available(self.max_replica_lag)
+            await replica.check_lag(self.replica_timeout)
+            if replica.available(self.max_replica_lag) == was_available:
+                continue
+            if was_available:
+                reason = replica.error or f"lag {replica.lag:.1f}s"
+                print(f"✗ Replica {replica.name} is unavailable, reading from primary: {reason}")
+            else:
+                print(f"✓ Replica {replica.name} is available")
+
+    def _read_replica(self, read_only: Optional[bool] = None) -> Optional[Replica]:
+        """
+        Реплика для чтения или None — читать с основной БД: запрос не только
+        на чтение, идёт единица работы, текущий HTTP-запрос уже писал
+        (read-your-writes) или все реплики отстают сильнее допустимого.
+
+        Внутри HTTP-запроса реплика выбирается один раз: все его чтения идут на неё
+        (версия для ETag и список не должны прийти с разных реплик). Если она
+        перестала быть доступной, остальные чтения запроса идут на основную БД —
+        она не отстаёт ни от одной реплики.
+        """
+        if not self.replicas or not (_read_only.get() if read_only is None else read_only):
+            return None
+        state = _request_state.get()
+        if _uow_connection.get() is not None or (state is not None and state["wrote"]):
+            self._routing["primary_reads"] += 1
+            return None
+        if state is not None and "replica" in state:
+            replica = state["replica"]
+            if replica is None or not replica.available(self.max_replica_lag):
+                state["replica"] = None
+                self._routing["primary_reads"] += 1
+                return None
+        else:
+            replica = self._next_replica_available()
+            if state is not None:
+                state["replica"] = replica
+            if replica is None:
+                self._routing["lag_fallbacks"] += 1
+                return None
+        self._routing["replica_reads"] += 1
+        replica.reads += 1
+        return replica
+
+    def _next_replica_available(self) -> Optional[Replica]:
+        """Следующая по кругу реплика с допустимым отставанием"""
+        count = len(self.replicas)
+        for offset in range(count):
+            replica = self.replicas[(self._next_replica + offset) % count]
+            if replica.available(self.max_replica_lag):
+                self._next_replica = (self._next_replica + offset + 1) % count
+                return replica
+        return None
+
+    @contextmanager
+    def request_scope(self, writes: bool = False):
+        """
+        Границы HTTP-запроса для read-your-writes: после первой записи (или сразу,
+        если writes=True — небезопасный метод) чтения запроса идут на основную БД.
+        """
+        token = _request_state.set({"wrote": writes})
         try:
-            cur = conn.cursor()
-            cur.execute(query, params or ())
-            affected = cur.rowcount
-            conn.commit()
-            cur.close()
-            return affected
-        except Exception as e:
-            conn.rollback()
-            raise e
+            yield
         finally:
-            conn.close()
+            _request_state.reset(token)
 
-    def init_schema(self):
-        """Инициализировать схему БД из init.sql"""
-        from app.sql import init_sql
-        conn = self.get_connection()
+    def _mark_write(self):
+        state = _request_state.get()
+        if state is not None:
+            state["wrote"] = True
+
+    def get_replica_stats(self) -> Dict[str, Any]:
+        """Маршрутизация чтений и состояние реплик"""
+        return {
+            **self._routing,
+            "max_lag_seconds": self.max_replica_lag,
+            "replicas": {replica.name: replica.get_stats(self.max_replica_lag) for replica in self.replicas},
+        }
+
+    def statement(self, name: str, sql: str) -> Statement:
+        """Запрос каталога по имени: регистрируется при первом обращении"""
+        stmt = self.statements.get(name)
+        if stmt is None:
+            stmt = self.statements[name] = Statement(name, sql)
+        elif stmt.sql != sql:
+            raise ValueError(f"Statement {name!r} is already registered with different SQL")
+        return stmt
+
+    def invalidate_statements(self):
+        """Сбросить подготовленные запросы на всех подключениях (при следующей выдаче из пула)"""
+        self._statements_generation += 1
+        self._statements_invalidations += 1
+
+    def get_statement_stats(self) -> Dict[str, Any]:
+        """Счётчики запросов каталога, самые частые первыми"""
+        statements = sorted(self.statements.values(), key=lambda stmt: stmt.calls, reverse=True)
+        return {
+            "generation": self._statements_generation,
+            "invalidations": self._statements_invalidations,
+            "statements": {stmt.name: stmt.get_stats() for stmt in statements},
+        }
+
+    @asynccontextmanager
+    async def unit_of_work(self):
+        """
+        Единица работы: одно подключение и одна транзакция на весь блок.
+
+        Пока блок активен, execute_* и transaction() в этом контексте (например,
+        функции app.sql.queries, вызванные обработчиком) работают на общем
+        подключении. При выходе — commit, при исключении — rollback.
+        """
+        if _uow_connection.get() is not None:
+            raise RuntimeError("unit of work is already active in this context")
+        self._mark_write()
+        # pool.connection() делает commit при выходе и rollback при исключении
+        callbacks: List[Callable[[], Any]] = []
+        async with self.pool.connection() as conn:
+            token = _uow_connection.set(conn)
+            callbacks_token = _uow_after_commit.set(callbacks)
+            try:
+                yield conn
+            finally:
+                _uow_connection.reset(token)
+                _uow_after_commit.reset(callbacks_token)
+        for callback in callbacks:
+            result = callback()
+            if inspect.isawaitable(result):
+                await result
+
+    def after_commit(self, callback: Callable[[], Any]):
+        """Вызвать callback после commit текущей единицы работы (или сразу, если её нет)"""
+        callbacks = _uow_after_commit.get()
+        if callbacks is None:
+            callback()
+        else:
+            callbacks.append(callback)
+
+    async def after_commit_async(self, callback: Callable[[], Awaitable[Any]]):
+        """Асинхронный вариант after_commit: дождаться callback сразу, если единицы работы нет"""
+        callbacks = _uow_after_commit.get()
+        if callbacks is None:
+            await callback()
+        else:
+            callbacks.append(callback)
+
+    @asynccontextmanager
+    async def connection(self):
+        """Подключение текущей единицы работы или, если её нет, подключение из пула с автокоммитом блока"""
+        conn = _uow_connection.get()
+        if conn is not None:
+            yield conn
+            return
+        async with self.pool.connection() as conn:
+            yield conn
+
+    @asynccontextmanager
+    async def transaction(self):
+        """Выполнить несколько запросов на одном подключении в одной транзакции"""
+        self._mark_write()
+        conn = _uow_connection.get()
+        if conn is not None:
+            # внутри единицы работы — точка сохранения, итог фиксирует unit_of_work
+            async with conn.transaction():
+                yield conn
+            return
+        async with self.pool.connection() as conn:
+            yield conn
+
+    async def _run(self, conn: psycopg.AsyncConnection, query: Query, params: tuple, row_factory=None):
+        """Выполнить запрос на подключении; запрос каталога — подготовленным и с учётом в счётчиках"""
+        cur = conn.cursor(row_factory=row_factory) if row_factory is not None else conn.cursor()
+        if not isinstance(query, Statement):
+            try:
+                await cur.execute(query, params or ())
+            except psycopg.errors.FeatureNotSupported as e:
+                if _is_stale_plan(e):
+                    self.invalidate_statements()
+                raise
+            return cur
+        started = time.perf_counter()
         try:
-            cur = conn.cursor()
-            cur.execute(init_sql.INIT_SQL)
-            conn.commit()
-            cur.close()
-            print("✓ Schema initialized successfully")
-        except psycopg2.errors.DuplicateTable:
-            conn.rollback()
-            print("✓ Schema already exists")
+            await cur.execute(query.sql, params or (), prepare=True)
         except Exception as e:
-            conn.rollback()
-            print(f"✗ Error initializing schema: {e}")
+            query.errors += 1
+            if _is_stale_plan(e):
+                self.invalidate_statements()
             raise
-        finally:
-            conn.close()
+        query.record((time.perf_counter() - started) * 1000)
+        return cur
+
+    async def _execute(self, query: Query, params: tuple, fetch: Callable[[Any], Awaitable[Any]], row_factory=None):
+        """
+        Выполнить запрос на реплике (см. _read_replica) или на подключении единицы
+        работы/пула основной БД, вернуть fetch(курсор). Ошибка реплики — повтор
+        на основной БД.
+        """
+        replica = self._read_replica()
+        if replica is not None:
+            try:
+                return await self._execute_on(replica.pool.connection, query, params, fetch, row_factory)
+            except REPLICA_ERRORS as e:
+                replica.failed(e)
+                self._routing["error_fallbacks"] += 1
+                print(f"✗ Replica {replica.name} read failed, using primary: {e}")
+        return await self._execute_on(self.connection, query, params, fetch, row_factory)
+
+    async def _execute_on(self, connection, query: Query, params: tuple, fetch, row_factory=None):
+        """
+        Если план подготовленного запроса устарел после изменения схемы, вне единицы
+        работы запрос повторяется один раз: подключение уже сброшено rollback-ом.
+        """
+        try:
+            async with connection() as conn:
+                return await fetch(await self._run(conn, query, params, row_factory))
+        except psycopg.errors.FeatureNotSupported as e:
+            if not _is_stale_plan(e) or _uow_connection.get() is not None:
+                raise
+        async with connection() as conn:
+            return await fetch(await self._run(conn, query, params, row_factory))
+
+    async def execute_query(self, query: Query, params: tuple = None) -> List[Dict[str, Any]]:
+        """Выполнить SELECT-запрос, вернуть список словарей"""
+        return await self._execute(query, params, lambda cur: cur.fetchall())
+
+    async def execute_single(self, query: Query, params: tuple = None) -> Optional[Dict[str, Any]]:
+        """Выполнить SELECT-запрос, вернуть одну строку"""
+        return await self._execute(query, params, lambda cur: cur.fetchone())
+
+    async def fetch_rows(self, query: Query, params: tuple = None) -> Rows:
+        """Выполнить SELECT-запрос, вернуть имена колонок и строки-кортежи (для RowEncoder)"""
+        async def fetch(cur):
+            return tuple(column.name for column in cur.description), await cur.fetchall()
+        return await self._execute(query, params, fetch, row_factory=tuple_row)
+
+    async def execute_insert(self, query: Query, params: tuple = None) -> Dict[str, Any]:
+        """Выполнить INSERT-запрос (с RETURNING), вернуть вставленную строку"""
+        self._mark_write()
+        return await self._execute(query, params, lambda cur: cur.fetchone())
+
+    async def execute_update(self, query: Query, params: tuple = None) -> int:
+        """Выполнить UPDATE/DELETE-запрос, вернуть количество измененных строк"""
+        self._mark_write()
+        async def rowcount(cur):
+            return cur.rowcount
+        return await self._execute(query, params, rowcount)
 
+    async def stream_query(
+        self, query: str, params: tuple = None, chunk_size: int = 1000, read_only: bool = False
+    ) -> AsyncIterator[List[Dict[str, Any]]]:
+        """
+        Выполнить SELECT через именованный (серверный) курсор и отдавать строки
+        порциями по chunk_size: в памяти держится не больше одной порции.
+        Подключение берётся из пула отдельно от единицы работы и занято до конца чтения;
+        read_only=True — из пула реплики, если она доступна.
+        """
+        replica = self._read_replica(read_only)
+        pool = replica.pool if replica is not None else self.pool
+        async with pool.connection() as conn:
+            async with conn.cursor(name=f"stream_{uuid.uuid4().hex}") as cur:
+                await cur.execute(query, params or ())
+                while True:
+                    rows = await cur.fetchmany(chunk_size)
+                    if not rows:
+                        break
+                    yield rows
 
+
+def json_default(value: Any):
+    """default для json.dumps/orjson: даты — ISO 8601, Decimal — число"""
+    if isinstance(value, (datetime, date)):
+        return value.isoformat()
+    if isinstance(value, Decimal):
+        return float(value)
+    raise TypeError(f"Object of type {type(value).__name__} is not JSON serializable")
+
+
+def dump_json(value: Any) -> bytes:
+    """JSON в байтах: orjson, если установлен, иначе json (компактно, UTF-8, как JSONResponse)"""
+    if orjson is not None:
+        return orjson.dumps(value, default=json_default)
+    return json.dumps(value, default=json_default, ensure_ascii=False, separators=(",", ":")).encode()
+
+
+class RowEncoder:
+    """
+    Быстрая сериализация строк-кортежей в JSON-массив объектов схемы ответа.
+
+    Соответствие «поле схемы -> номер колонки» вычисляется один раз на набор
+    колонок выборки, дальше строки идут в JSON без RealDictRow и без повторной
+    валидации Pydantic. Поля и их порядок — как у модели, лишние колонки
+    отбрасываются; datetime — ISO 8601, Decimal — число, как в ответах FastAPI.
+    """
+
+    def __init__(self, fields: Sequence[str]):
+        self.fields = tuple(fields)
+        self._getters: Dict[Tuple[str, ...], Optional[Callable[[tuple], tuple]]] = {}
+
+    @classmethod
+    def for_model(cls, model: Any) -> "RowEncoder":
+        """Кодировщик по полям Pydantic-модели"""
+        return cls(model.model_fields)
+
+    def _getter(self, columns: Tuple[str, ...]) -> Optional[Callable[[tuple], tuple]]:
+        """Выборка значений полей из строки; None — колонки уже совпадают с полями"""
+        try:
+            return self._getters[columns]
+        except KeyError:
+            pass
+        missing = [field for field in self.fields if field not in columns]
+        if missing:
+            raise ValueError(f"Query result has no columns for fields: {', '.join(missing)}")
+        if columns == self.fields:
+            getter = None
+        else:
+            indexes = [columns.index(field) for field in self.fields]
+            getter = operator.itemgetter(*indexes)
+            if len(indexes) == 1:
+                single = getter
+                getter = lambda row: (single(row),)
+        self._getters[columns] = getter
+        return getter
+
+    def encode(self, columns: Sequence[str], rows: List[tuple]) -> bytes:
+        """JSON-массив объектов из строк выборки"""
+        getter = self._getter(tuple(columns))
+        fields = self.fields
+        if getter is None:
+            objects = [dict(zip(fields, row)) for row in rows]
+        else:
+            objects = [dict(zip(fields, getter(row))) for row in rows]
+        return dump_json(objects)
+
+
+class ReadYourWritesMiddleware:
+    """
+    ASGI-middleware: каждый HTTP-запрос — отдельная область read-your-writes
+    (AsyncDatabase.request_scope). Небезопасные методы (POST, PATCH, ...)
+    считаются пишущими с самого начала и читают только с основной БД.
+    """
+
+    SAFE_METHODS = ("GET", "HEAD", "OPTIONS")
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+        with adb.request_scope(writes=scope["method"] not in self.SAFE_METHODS):
+            await self.app(scope, receive, send)
+
+
+# Синхронный слой — для seed.py, миграций и скриптов; асинхронный — для роутеров
 db = Database()
+adb = AsyncDatabase()
 
 
 def get_db() -> Database:
     """Зависимость FastAPI для получения подключения"""
     return db
+
+
+def get_adb() -> AsyncDatabase:
+    """Зависимость FastAPI для получения асинхронного подключения"""
+    return adb
@@ -1,32 +1,48 @@
 from fastapi import Depends, HTTPException, status
 from fastapi.security import OAuth2PasswordBearer
+from app.cache import principal_cache
+from app.db import adb
 from app.security import decode_access_token
 from app.sql import queries
 
 oauth2_scheme = OAuth2PasswordBearer(tokenUrl="/auth/login")
 
 
-def get_current_user(token: str = Depends(oauth2_scheme)):
+async def transactional():
+    """
+    Единица работы на HTTP-запрос: все запросы обработчика (и зависимостей,
+    объявленных после неё) идут через одно подключение в одной транзакции.
+    Commit — после успешного обработчика, rollback — при любом исключении.
+    """
+    async with adb.unit_of_work() as conn:
+        yield conn
+
+
+async def get_current_user(token: str = Depends(oauth2_scheme)):
     credentials_exception = HTTPException(
         status_code=status.HTTP_401_UNAUTHORIZED,
         detail="Could not validate credentials",
     )
     try:
         payload = decode_access_token(token)
-        user_id: int = payload.get("sub")
+        user_id = payload.get("sub")
         role: str = payload.get("role")
         if user_id is None or role is None:
             raise credentials_exception
+        user_id = int(user_id)
     except Exception:
         raise credentials_exception
-    
-    user = queries.get_user_by_id(user_id)
-    if not user:
-        raise credentials_exception
+
+    user = principal_cache.get(user_id)
+    if user is None:
+        user = await queries.get_principal_by_id(user_id)
+        if not user:
+            raise credentials_exception
+        principal_cache.set(user_id, user)
     return user
 
 
-def get_current_admin(current_user: dict = Depends(get_current_user)):
+async def get_current_admin(current_user: dict = Depends(get_current_user)):
     if current_user.get("role") != "admin":
         raise HTTPException(status_code=403, detail="Admin privileges required")
     return current_user
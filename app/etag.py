@@ -0,0 +1,32 @@
+from fastapi import HTTPException, Request, Response
+
+from app.sql import queries
+
+
+def etag_matches(request: Request, etag: str) -> bool:
+    """Совпадает ли ETag с одним из значений If-None-Match (сравнение слабое, как требует RFC 9110)"""
+    header = request.headers.get("if-none-match")
+    if not header:
+        return False
+    if header.strip() == "*":
+        return True
+    tags = (tag.strip() for tag in header.split(","))
+    return any(tag.removeprefix("W/") == etag for tag in tags)
+
+
+async def home_etag(home_id: int, request: Request, response: Response) -> str:
+    """
+    Зависимость для списков данных дома: ETag по версии дома (home_versions).
+
+    Версия читается до запроса списка — если дом изменится между ними, клиент
+    получит новые данные со старым ETag и просто перезапросит их позже.
+    При совпадении с If-None-Match — 304 без обращения к таблицам сущностей.
+    Подключать после аутентификации, чтобы 304 не отдавался анонимно.
+    """
+    version = await queries.get_home_version(home_id)
+    etag = f'"home-{home_id}-v{version}"'
+    headers = {"ETag": etag, "Cache-Control": "private, no-cache"}
+    if etag_matches(request, etag):
+        raise HTTPException(status_code=304, headers=headers)
+    response.headers.update(headers)
+    return etag
@@ -0,0 +1,58 @@
+import csv
+import io
+import json
+from datetime import date, datetime
+from typing import Any, AsyncIterator, Dict, List
+
+from fastapi import HTTPException
+from fastapi.responses import StreamingResponse
+
+from app.db import json_default
+
+EXPORT_FORMATS = {
+    "ndjson": "application/x-ndjson",
+    "csv": "text/csv; charset=utf-8",
+}
+
+
+def _csv_value(value: Any):
+    if isinstance(value, (datetime, date)):
+        return value.isoformat()
+    return "" if value is None else value
+
+
+async def _ndjson_chunks(chunks: AsyncIterator[List[Dict[str, Any]]]) -> AsyncIterator[bytes]:
+    async for rows in chunks:
+        yield "".join(
+            json.dumps(row, default=json_default, ensure_ascii=False) + "\n" for row in rows
+        ).encode()
+
+
+async def _csv_chunks(chunks: AsyncIterator[List[Dict[str, Any]]], columns: List[str]) -> AsyncIterator[bytes]:
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    writer.writerow(columns)
+    # заголовок уходит сразу, до первой порции из БД
+    yield buffer.getvalue().encode()
+    async for rows in chunks:
+        buffer.seek(0)
+        buffer.truncate()
+        writer.writerows([_csv_value(row[column]) for column in columns] for row in rows)
+        yield buffer.getvalue().encode()
+
+
+def export_response(
+    chunks: AsyncIterator[List[Dict[str, Any]]],
+    columns: List[str],
+    fmt: str,
+    filename: str,
+) -> StreamingResponse:
+    """Потоковый ответ NDJSON/CSV из порций строк (см. AsyncDatabase.stream_query)"""
+    if fmt not in EXPORT_FORMATS:
+        raise HTTPException(status_code=400, detail=f"Unsupported format, use one of: {', '.join(EXPORT_FORMATS)}")
+    body = _ndjson_chunks(chunks) if fmt == "ndjson" else _csv_chunks(chunks, columns)
+    return StreamingResponse(
+        body,
+        media_type=EXPORT_FORMATS[fmt],
+        headers={"Content-Disposition": f'attachment; filename="{filename}.{fmt}"'},
+    )
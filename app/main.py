@@ -1,10 +1,37 @@
+from contextlib import asynccontextmanager
 from fastapi import FastAPI
 from fastapi.middleware.cors import CORSMiddleware
-from app.db import db
+from app.audit import audit_writer
+from app.cache import principal_cache
+from app.config import settings
+from app.db import db, adb, ReadYourWritesMiddleware
+from app.realtime import event_broadcaster
+from app.rule_engine import rule_engine
+from app.tasks import build_background_tasks
 from app.routers import auth, users, homes, devices, rooms, sensors, events, rules, logs, analytics
 
-# Инициализируем схему при старте
-db.init_schema()
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    # Инициализируем схему (синхронно, один раз) и открываем асинхронный пул
+    db.init_schema()
+    await adb.open()
+    if settings.AUDIT_LOG_MODE == "buffered":
+        audit_writer.start()
+    event_broadcaster.start()
+    tasks = build_background_tasks()
+    for task in tasks:
+        task.start()
+    yield
+    # Останавливаем фоновые задачи и закрываем пулы при остановке
+    for task in tasks:
+        await task.stop()
+    await event_broadcaster.stop()
+    # Дописываем очередь аудита, пока пул ещё открыт
+    await audit_writer.stop()
+    await adb.close()
+    db.close()
+
 
 app = FastAPI(
     title="Smart Home Management Service",
@@ -13,6 +40,7 @@ app = FastAPI(
         "(освещение, климат, безопасность). SQL-версия без ORM."
     ),
     version="1.0.0",
+    lifespan=lifespan,
 )
 
 # CORS
@@ -21,8 +49,12 @@ app.add_middleware(
     allow_origins=["*"],
     allow_methods=["*"],
     allow_headers=["*"],
+    expose_headers=["X-Next-Cursor", "X-Prev-Cursor", "ETag"],
 )
 
+# Read-your-writes: после записи в рамках HTTP-запроса его чтения идут на основную БД
+app.add_middleware(ReadYourWritesMiddleware)
+
 # Роутеры
 app.include_router(auth.router)
 app.include_router(users.router)
@@ -37,10 +69,40 @@ app.include_router(analytics.router)
 
 
 @app.get("/", tags=["root"], summary="Проверка работоспособности")
-def read_root():
+async def read_root():
     return {"message": "Smart Home API is running"}
 
 
 @app.get("/health", tags=["root"], summary="Health check")
-def health():
+async def health():
     return {"status": "ok"}
+
+
+@app.get("/health/db", tags=["root"], summary="Метрики пула подключений")
+async def health_db():
+    return {
+        "status": "ok",
+        "pool": adb.get_stats(),
+        "sync_pool": db.pool.get_stats(),
+        "read_routing": adb.get_replica_stats(),
+    }
+
+
+@app.get("/health/statements", tags=["root"], summary="Счётчики подготовленных запросов каталога")
+async def health_statements():
+    return {"status": "ok", **adb.get_statement_stats()}
+
+
+@app.get("/health/cache", tags=["root"], summary="Метрики кэшей пользователей и правил")
+async def health_cache():
+    return {"status": "ok", "principal_cache": principal_cache.get_stats(), "rule_engine": rule_engine.get_stats()}
+
+
+@app.get("/health/audit", tags=["root"], summary="Метрики фоновой записи аудита")
+async def health_audit():
+    return {"status": "ok", "audit_writer": audit_writer.get_stats()}
+
+
+@app.get("/health/realtime", tags=["root"], summary="Метрики push-подписок на события")
+async def health_realtime():
+    return {"status": "ok", "events": event_broadcaster.get_stats()}
@@ -0,0 +1,110 @@
+import base64
+from dataclasses import dataclass
+from datetime import datetime, timezone
+from typing import Any, Callable, Dict, List, Optional, Sequence, Tuple
+
+from fastapi import HTTPException, Query, Response
+
+from app.config import settings
+
+Cursor = Tuple[datetime, int]
+
+
+@dataclass
+class PageParams:
+    """Параметры keyset-пагинации по (timestamp, id)"""
+    limit: int
+    before: Optional[Cursor] = None
+    after: Optional[Cursor] = None
+    from_dt: Optional[datetime] = None
+    to_dt: Optional[datetime] = None
+
+    def query_kwargs(self) -> Dict[str, Any]:
+        """Аргументы для функций app.sql.queries (на одну строку больше — чтобы узнать, есть ли ещё)"""
+        return {
+            "limit": self.limit + 1,
+            "before": self.before,
+            "after": self.after,
+            "from_dt": self.from_dt,
+            "to_dt": self.to_dt,
+        }
+
+
+def encode_cursor(row: Dict[str, Any]) -> str:
+    """Курсор строки: непрозрачная base64-строка из timestamp и id"""
+    return _encode_cursor((row["timestamp"], row["id"]))
+
+
+def _encode_cursor(key: Cursor) -> str:
+    raw = f"{key[0].isoformat()}|{key[1]}"
+    return base64.urlsafe_b64encode(raw.encode()).decode().rstrip("=")
+
+
+def _dict_key(row: Dict[str, Any]) -> Cursor:
+    return row["timestamp"], row["id"]
+
+
+def tuple_key(columns: Sequence[str]) -> Callable[[tuple], Cursor]:
+    """Ключ (timestamp, id) для строк-кортежей с колонками columns (см. AsyncDatabase.fetch_rows)"""
+    ts_index, id_index = columns.index("timestamp"), columns.index("id")
+    return lambda row: (row[ts_index], row[id_index])
+
+
+def decode_cursor(value: str) -> Cursor:
+    try:
+        raw = base64.urlsafe_b64decode(value + "=" * (-len(value) % 4)).decode()
+        ts, row_id = raw.split("|")
+        return datetime.fromisoformat(ts), int(row_id)
+    except (ValueError, UnicodeDecodeError):
+        raise HTTPException(status_code=400, detail="Invalid cursor")
+
+
+def naive_utc(dt: Optional[datetime]) -> Optional[datetime]:
+    """Привести время к naive UTC — в таком виде оно хранится в БД"""
+    if dt is not None and dt.tzinfo is not None:
+        return dt.astimezone(timezone.utc).replace(tzinfo=None)
+    return dt
+
+
+def page_params(
+    limit: int = Query(settings.PAGE_DEFAULT_LIMIT, ge=1, le=settings.PAGE_MAX_LIMIT),
+    before: Optional[str] = Query(None, description="Курсор X-Next-Cursor: записи старше"),
+    after: Optional[str] = Query(None, description="Курсор X-Prev-Cursor: записи новее"),
+    from_dt: Optional[datetime] = Query(None, alias="from", description="Не раньше (включительно)"),
+    to_dt: Optional[datetime] = Query(None, alias="to", description="Раньше (не включительно)"),
+) -> PageParams:
+    """Зависимость FastAPI: разбор параметров пагинации"""
+    if before and after:
+        raise HTTPException(status_code=400, detail="Use either 'before' or 'after', not both")
+    return PageParams(
+        limit=limit,
+        before=decode_cursor(before) if before else None,
+        after=decode_cursor(after) if after else None,
+        from_dt=naive_utc(from_dt),
+        to_dt=naive_utc(to_dt),
+    )
+
+
+def paginate(
+    rows: List[Any], page: PageParams, response: Response, key: Callable[[Any], Cursor] = _dict_key
+) -> List[Any]:
+    """
+    Обрезать выборку (запрошено limit + 1 строк, новые первыми) до limit
+    и выставить курсоры соседних страниц в заголовки X-Next-Cursor / X-Prev-Cursor.
+    key — (timestamp, id) строки; по умолчанию строки — словари.
+    """
+    has_more = len(rows) > page.limit
+    if has_more:
+        # при after лишняя строка — самая новая, иначе — самая старая
+        rows = rows[1:] if page.after else rows[:-1]
+    if not rows:
+        return rows
+
+    has_older = has_more if not page.after else True
+    has_newer = has_more if page.after else page.before is not None
+    oldest, newest = key(rows[-1]), key(rows[0])
+    if has_older and oldest[0] is not None:
+        response.headers["X-Next-Cursor"] = _encode_cursor(oldest)
+    if has_newer and newest[0] is not None:
+        response.headers["X-Prev-Cursor"] = _encode_cursor(newest)
+    return rows
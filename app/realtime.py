@@ -0,0 +1,176 @@
+import asyncio
+import json
+from typing import Any, AsyncIterator, Dict, Optional, Set
+
+import psycopg
+
+from app.config import settings
+from app.db import adb
+
+EVENTS_CHANNEL = "events_inserted"
+
+
+class Subscription:
+    """
+    Подписка на новые события дома или устройства.
+
+    Очередь ограничена: если клиент не успевает читать, новые события
+    отбрасываются, а перед следующим доставленным приходит уведомление
+    о пропуске (gap) с их количеством — клиент догружает пропущенное
+    через GET /events/device/{id}.
+    """
+
+    def __init__(self, home_id: Optional[int], device_id: Optional[int], maxsize: int):
+        self.home_id = home_id
+        self.device_id = device_id
+        self.queue: asyncio.Queue = asyncio.Queue(maxsize=maxsize)
+        self.dropped = 0
+
+    def offer(self, message: str) -> bool:
+        """
+        Положить сообщение в очередь без ожидания. После переполнения события
+        отбрасываются, пока клиент не получит уведомление о пропуске, — так
+        порядок «события, gap, события» сохраняется.
+        """
+        if self.dropped or self.queue.full():
+            self.dropped += 1
+            return False
+        self.queue.put_nowait(message)
+        return True
+
+    def interrupt(self):
+        """Слушатель переподключался: события за это время могли потеряться (считается как один пропуск)"""
+        self.dropped += 1
+        if self.queue.empty():
+            # будим клиента, ждущего в get(), чтобы он сразу получил gap
+            self.queue.put_nowait(None)
+
+    async def get(self, timeout: float) -> Optional[Dict[str, Any]]:
+        """Следующее сообщение ({"type": ..., "data": ...}) или None, если за timeout ничего не пришло"""
+        while True:
+            if self.dropped and self.queue.empty():
+                dropped, self.dropped = self.dropped, 0
+                return {"type": "gap", "data": json.dumps({"dropped": dropped})}
+            try:
+                message = await asyncio.wait_for(self.queue.get(), timeout)
+            except asyncio.TimeoutError:
+                return None
+            if message is not None:
+                return {"type": "event", "data": message}
+
+
+class EventBroadcaster:
+    """
+    Одно LISTEN-подключение на воркер, раздающее уведомления events_inserted
+    подпискам по дому и устройству. Слушатель никогда не ждёт подписчиков:
+    медленные теряют события (см. Subscription), а не тормозят остальных.
+    """
+
+    def __init__(self, queue_size: int, reconnect_delay: float):
+        self.queue_size = queue_size
+        self.reconnect_delay = reconnect_delay
+        self._by_home: Dict[int, Set[Subscription]] = {}
+        self._by_device: Dict[int, Set[Subscription]] = {}
+        self._task: Optional[asyncio.Task] = None
+        self._stats = {"notifications": 0, "delivered": 0, "dropped": 0, "reconnects": 0}
+
+    def start(self):
+        if self._task is None:
+            self._task = asyncio.create_task(self._run(), name="events-listener")
+
+    async def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+
+    async def _run(self):
+        while True:
+            try:
+                async with await psycopg.AsyncConnection.connect(adb.conninfo, autocommit=True) as conn:
+                    await conn.execute(f"LISTEN {EVENTS_CHANNEL}")
+                    async for notify in conn.notifies():
+                        self._dispatch(notify.payload)
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                print(f"✗ Events listener disconnected: {e}")
+            # пока слушателя не было, события могли пройти мимо — сообщаем подписчикам
+            self._stats["reconnects"] += 1
+            for subscription in self._subscriptions():
+                subscription.interrupt()
+            await asyncio.sleep(self.reconnect_delay)
+
+    def _subscriptions(self) -> Set[Subscription]:
+        result = set()
+        for group in (*self._by_home.values(), *self._by_device.values()):
+            result |= group
+        return result
+
+    def _dispatch(self, payload: str):
+        self._stats["notifications"] += 1
+        try:
+            event = json.loads(payload)
+        except ValueError:
+            return
+        targets = self._by_home.get(event.get("home_id"), set()) | self._by_device.get(event.get("device_id"), set())
+        for subscription in targets:
+            if subscription.offer(payload):
+                self._stats["delivered"] += 1
+            else:
+                self._stats["dropped"] += 1
+
+    def subscribe(self, home_id: Optional[int] = None, device_id: Optional[int] = None) -> Subscription:
+        subscription = Subscription(home_id, device_id, self.queue_size)
+        if device_id is not None:
+            self._by_device.setdefault(device_id, set()).add(subscription)
+        else:
+            self._by_home.setdefault(home_id, set()).add(subscription)
+        return subscription
+
+    def unsubscribe(self, subscription: Subscription):
+        index, key = (
+            (self._by_device, subscription.device_id) if subscription.device_id is not None
+            else (self._by_home, subscription.home_id)
+        )
+        group = index.get(key)
+        if group is not None:
+            group.discard(subscription)
+            if not group:
+                del index[key]
+
+    async def stream(
+        self, home_id: Optional[int], device_id: Optional[int], keepalive: float
+    ) -> AsyncIterator[bytes]:
+        """Поток Server-Sent Events для подписки; отписка — при отключении клиента"""
+        subscription = self.subscribe(home_id, device_id)
+        try:
+            # комментарий сразу — клиент видит, что подписка оформлена
+            yield b": subscribed\n\n"
+            while True:
+                message = await subscription.get(keepalive)
+                if message is None:
+                    yield b": keepalive\n\n"
+                else:
+                    yield f"event: {message['type']}\ndata: {message['data']}\n\n".encode()
+        finally:
+            self.unsubscribe(subscription)
+
+    def get_stats(self) -> Dict[str, Any]:
+        subscriptions = self._subscriptions()
+        return {
+            **self._stats,
+            "listening": self._task is not None and not self._task.done(),
+            "subscribers": len(subscriptions),
+            "queued": sum(s.queue.qsize() for s in subscriptions),
+            "queue_size": self.queue_size,
+        }
+
+
+event_broadcaster = EventBroadcaster(
+    queue_size=settings.REALTIME_QUEUE_SIZE,
+    reconnect_delay=settings.REALTIME_RECONNECT_DELAY,
+)
@@ -0,0 +1,24 @@
+from typing import List, Sequence
+
+from fastapi import Response
+
+from app.db import RowEncoder
+from app.schemas import DeviceRead, EventRead, LogRead, SensorReadingRead
+
+# Кодировщики больших списков: поля и порядок — как у схем ответа
+DEVICE_ENCODER = RowEncoder.for_model(DeviceRead)
+EVENT_ENCODER = RowEncoder.for_model(EventRead)
+LOG_ENCODER = RowEncoder.for_model(LogRead)
+SENSOR_READING_ENCODER = RowEncoder.for_model(SensorReadingRead)
+
+
+def rows_response(encoder: RowEncoder, columns: Sequence[str], rows: List[tuple], response: Response) -> Response:
+    """
+    JSON-ответ из строк-кортежей в обход response_model (она остаётся для OpenAPI).
+    Заголовки, выставленные обработчиком и зависимостями (курсоры, ETag), переносятся.
+    """
+    result = Response(content=encoder.encode(columns, rows), media_type="application/json")
+    result.raw_headers.extend(
+        (name, value) for name, value in response.raw_headers if name not in (b"content-length", b"content-type")
+    )
+    return result
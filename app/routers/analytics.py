@@ -1,54 +1,91 @@
 from datetime import datetime, timedelta
-from typing import List
+from typing import List, Optional
 from fastapi import APIRouter, Depends, HTTPException
 from app.sql import queries
-from app.deps import get_current_user
+from app.deps import get_current_admin, get_current_user
 # from app import models
 
 router = APIRouter(prefix="/analytics", tags=["analytics"])
 
 
+def _freshness(state: Optional[dict]) -> dict:
+    """Давность данных материализованного представления для ответа"""
+    if not state:
+        return {"refreshed_at": None, "data_age_seconds": None}
+    return {"refreshed_at": state["refreshed_at"], "data_age_seconds": round(state["age_seconds"], 3)}
+
+
 @router.get("/devices/home-summary", summary="Сводка устройств по домам")
-def get_devices_home_summary(user: dict = Depends(get_current_user)):
+async def get_devices_home_summary(user: dict = Depends(get_current_user)):
     """
     Представление: агрегированная сводка количества устройств по домам.
     Показывает общее количество и разбор по типам (свет, термостат, камеры).
+    Данные обновляются по расписанию: refreshed_at и data_age_seconds — их давность.
     """
     try:
-        result = queries.get_home_devices_summary()
-        return {"status": "ok", "data": result}
+        result = await queries.get_home_devices_summary()
+        state = await queries.get_materialized_view_state("view_home_devices_summary")
+        return {"status": "ok", "data": result, **_freshness(state)}
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
 
 @router.get("/users/activity", summary="Активность пользователей")
-def get_users_activity(user: dict = Depends(get_current_user)):
+async def get_users_activity(user: dict = Depends(get_current_user)):
     """
     Представление: агрегированная активность пользователей.
     Показывает количество действий каждого пользователя и временные границы активности.
+    Данные обновляются по расписанию: refreshed_at и data_age_seconds — их давность.
     """
     try:
-        result = queries.get_user_activity_summary()
-        return {"status": "ok", "data": result}
+        result = await queries.get_user_activity_summary()
+        state = await queries.get_materialized_view_state("view_user_activity")
+        return {"status": "ok", "data": result, **_freshness(state)}
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
 
+@router.post("/views/refresh", summary="Принудительно обновить материализованные представления")
+async def refresh_views(view: Optional[str] = None, admin: dict = Depends(get_current_admin)):
+    """
+    Обновить материализованные представления аналитики, не дожидаясь планировщика.
+
+    Query параметры:
+    - view: имя представления (по умолчанию — все)
+    """
+    if view is not None and view not in queries.ANALYTICS_VIEWS:
+        raise HTTPException(status_code=404, detail="View not found")
+    views = [view] if view else list(queries.ANALYTICS_VIEWS)
+    refreshed = []
+    for view_name in views:
+        state = await queries.refresh_materialized_view(view_name)
+        refreshed.append({"view": view_name, **_freshness(state)})
+    return {"status": "ok", "refreshed": refreshed}
+
+
 @router.get("/devices/last-events", summary="Последние события по устройствам")
-def get_devices_last_events(user: dict = Depends(get_current_user)):
+async def get_devices_last_events(
+    home_id: Optional[int] = None,
+    type: Optional[str] = None,
+    user: dict = Depends(get_current_user),
+):
     """
     Представление: последние события по каждому устройству.
     Показывает самое свежее событие для каждого девайса с типом события и значением.
+
+    Query параметры:
+    - home_id: только устройства дома
+    - type: только устройства типа (light, thermostat, camera)
     """
     try:
-        result = queries.get_last_device_events()
+        result = await queries.get_last_device_events(home_id=home_id, device_type=type)
         return {"status": "ok", "data": result}
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
 
 @router.get("/devices/{device_id}/events-count", summary="Количество событий за период")
-def get_device_events_count(
+async def get_device_events_count(
     device_id: int,
     days: int = 7,
     user: dict = Depends(get_current_user),
@@ -62,7 +99,7 @@ def get_device_events_count(
     try:
         to_dt = datetime.utcnow()
         from_dt = to_dt - timedelta(days=days)
-        count = queries.get_events_count_for_device_period(device_id, from_dt, to_dt)
+        count = await queries.get_events_count_for_device_period(device_id, from_dt, to_dt)
         return {
             "status": "ok",
             "device_id": device_id,
@@ -76,7 +113,7 @@ def get_device_events_count(
 
 
 @router.get("/devices/{device_id}/events-stats", summary="Статистика событий устройства")
-def get_device_events_stats(
+async def get_device_events_stats(
     device_id: int,
     user: dict = Depends(get_current_user),
 ):
@@ -85,7 +122,7 @@ def get_device_events_stats(
     Показывает количество событий для каждого типа события.
     """
     try:
-        result = queries.get_device_events_stats_fn(device_id)
+        result = await queries.get_device_events_stats_fn(device_id)
         return {
             "status": "ok",
             "device_id": device_id,
@@ -96,7 +133,7 @@ def get_device_events_stats(
 
 
 @router.get("/homes/{home_id}/events-summary", summary="Агрегированная сводка событий дома (триггер)")
-def get_home_events_summary(home_id: int, user: dict = Depends(get_current_user)):
+async def get_home_events_summary(home_id: int, user: dict = Depends(get_current_user)):
     """
     Таблица home_events_summary автоматически обновляется триггером
     trg_events_insert_summary при вставке новых событий.
@@ -105,8 +142,7 @@ def get_home_events_summary(home_id: int, user: dict = Depends(get_current_user)
     (данные обновляются триггером в реальном времени).
     """
     try:
-        query = "SELECT * FROM home_events_summary WHERE home_id = %s"
-        result = queries.db.execute_single(query, (home_id,))
+        result = await queries.get_home_events_summary(home_id)
         
         if not result:
             return {
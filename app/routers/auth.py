@@ -1,3 +1,4 @@
+import asyncio
 from datetime import timedelta
 from fastapi import APIRouter, Depends, HTTPException, status
 from fastapi.security import OAuth2PasswordRequestForm
@@ -10,9 +11,10 @@ router = APIRouter(prefix="/auth", tags=["auth"])
 
 
 @router.post("/login", response_model=Token, summary="Авторизация пользователя")
-def login(form_data: OAuth2PasswordRequestForm = Depends()):
-    user = queries.get_user_by_email(form_data.username)
-    if not user or not verify_password(form_data.password, user["password_hash"]):
+async def login(form_data: OAuth2PasswordRequestForm = Depends()):
+    user = await queries.get_user_by_email(form_data.username)
+    # bcrypt — CPU-bound операция, выносим её из event loop
+    if not user or not await asyncio.to_thread(verify_password, form_data.password, user["password_hash"]):
         raise HTTPException(status_code=status.HTTP_401_UNAUTHORIZED, detail="Invalid credentials")
 
     access_token_expires = timedelta(minutes=settings.ACCESS_TOKEN_EXPIRE_MINUTES)
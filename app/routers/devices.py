@@ -1,40 +1,79 @@
 from typing import List
-from fastapi import APIRouter, Depends
-from app.schemas import DeviceCreate, DeviceRead, DeviceUpdateStatus
-from app.deps import get_current_user
+from fastapi import APIRouter, Depends, HTTPException, Response, status
+from app.config import settings
+from app.schemas import DeviceBulkStatusResult, DeviceBulkStatusUpdate, DeviceCreate, DeviceRead, DeviceUpdateStatus
+from app.deps import get_current_user, transactional
+from app.etag import home_etag
+from app.responses import DEVICE_ENCODER, rows_response
 from app.sql import queries
 
 router = APIRouter(prefix="/devices", tags=["devices"])
 
 
-@router.post("/", response_model=DeviceRead, summary="Создать устройство")
-def create_device(device_in: DeviceCreate, user: dict = Depends(get_current_user)):
-    device = queries.create_device(
+@router.post("/", response_model=DeviceRead, summary="Создать устройство", dependencies=[Depends(transactional)])
+async def create_device(device_in: DeviceCreate, user: dict = Depends(get_current_user)):
+    return await queries.create_device_with_log(
         home_id=device_in.home_id,
         type_=device_in.type,
         name=device_in.name,
         status=device_in.status,
+        user_id=user["id"],
     )
-    queries.create_log(user["id"], f"Created device: {device_in.name}")
-    return device
 
 
 @router.get("/home/{home_id}", response_model=List[DeviceRead], summary="Устройства дома")
-def list_devices(home_id: int, user: dict = Depends(get_current_user)):
-    return queries.get_devices_by_home(home_id)
+async def list_devices(
+    home_id: int,
+    response: Response,
+    user: dict = Depends(get_current_user),
+    etag: str = Depends(home_etag),
+):
+    """Поддерживает If-None-Match: ETag меняется с версией данных дома"""
+    columns, rows = await queries.get_devices_by_home_rows(home_id)
+    return rows_response(DEVICE_ENCODER, columns, rows, response)
+
+
+@router.patch("/status", response_model=DeviceBulkStatusResult, summary="Массово изменить статус", dependencies=[Depends(transactional)])
+async def update_status_bulk(update: DeviceBulkStatusUpdate, user: dict = Depends(get_current_user)):
+    """
+    Изменить статус набора устройств одним запросом: по списку device_ids
+    или по home_id (и, при необходимости, type). В аудит пишется одна запись.
+    """
+    if (update.device_ids is None) == (update.home_id is None):
+        raise HTTPException(status_code=400, detail="Specify exactly one of device_ids or home_id")
+    if update.device_ids is not None:
+        if not update.device_ids:
+            raise HTTPException(status_code=400, detail="device_ids must not be empty")
+        if len(update.device_ids) > settings.DEVICES_BULK_MAX_SIZE:
+            raise HTTPException(
+                status_code=status.HTTP_413_REQUEST_ENTITY_TOO_LARGE,
+                detail=f"Request exceeds {settings.DEVICES_BULK_MAX_SIZE} devices",
+            )
+    devices = await queries.update_devices_status_with_log(
+        update.status,
+        user["id"],
+        device_ids=update.device_ids,
+        home_id=update.home_id,
+        type_=update.type,
+    )
+    not_found = []
+    if update.device_ids is not None:
+        updated_ids = {device["id"] for device in devices}
+        not_found = sorted(set(update.device_ids) - updated_ids)
+    return DeviceBulkStatusResult(updated=len(devices), devices=devices, not_found=not_found)
 
 
 @router.get("/{device_id}", response_model=DeviceRead, summary="Получить устройство")
-def get_device(device_id: int, user: dict = Depends(get_current_user)):
-    device = queries.get_device_by_id(device_id)
+async def get_device(device_id: int, user: dict = Depends(get_current_user)):
+    device = await queries.get_device_by_id(device_id)
     if not device:
         return {"detail": "Device not found"}
     return device
 
 
-@router.patch("/{device_id}/status", response_model=DeviceRead, summary="Изменить статус")
-def update_status(device_id: int, update: DeviceUpdateStatus, user: dict = Depends(get_current_user)):
-    queries.update_device_status(device_id, update.status)
-    device = queries.get_device_by_id(device_id)
-    queries.create_log(user["id"], f"Updated device {device_id} status to {update.status}")
+@router.patch("/{device_id}/status", response_model=DeviceRead, summary="Изменить статус", dependencies=[Depends(transactional)])
+async def update_status(device_id: int, update: DeviceUpdateStatus, user: dict = Depends(get_current_user)):
+    device = await queries.update_device_status_with_log(device_id, update.status, user["id"])
+    if not device:
+        raise HTTPException(status_code=404, detail="Device not found")
     return device
@@ -1,23 +1,207 @@
-from typing import List
-from fastapi import APIRouter, Depends
-from app.schemas import EventCreate, EventRead
-from app.deps import get_current_user
+import json
+from datetime import datetime
+from typing import Any, List, Optional, Tuple
+from fastapi import APIRouter, Depends, HTTPException, Query, Request, Response, status
+from fastapi.responses import StreamingResponse
+from pydantic import ValidationError
+from app.config import settings
+from app.schemas import EventCreate, EventRead, EventBatchItem, EventBatchItemResult, EventBatchResult
+from app.db import adb
+from app.deps import get_current_user, transactional
+from app.export import export_response
+from app.pagination import PageParams, naive_utc, page_params, paginate, tuple_key
+from app.realtime import event_broadcaster
+from app.responses import EVENT_ENCODER, rows_response
+from app.rule_engine import rule_engine
 from app.sql import queries
 
 router = APIRouter(prefix="/events", tags=["events"])
 
+NDJSON_MEDIA_TYPES = ("application/x-ndjson", "application/ndjson", "application/jsonl")
 
-@router.post("/", response_model=EventRead, summary="Создать событие")
-def create_event(event_in: EventCreate, user: dict = Depends(get_current_user)):
-    event = queries.create_event(
+
+@router.post("/", response_model=EventRead, summary="Создать событие", dependencies=[Depends(transactional)])
+async def create_event(event_in: EventCreate, user: dict = Depends(get_current_user)):
+    event = await queries.create_event_with_log(
         device_id=event_in.device_id,
         event_type=event_in.event_type,
         value=event_in.value,
+        user_id=user["id"],
     )
-    queries.create_log(user["id"], f"Event triggered: {event_in.event_type}")
+    await rule_engine.process_events(user["id"], [event])
     return event
 
 
+def _check_batch_size(count: int):
+    if count > settings.EVENTS_BATCH_MAX_SIZE:
+        raise HTTPException(
+            status_code=status.HTTP_413_REQUEST_ENTITY_TOO_LARGE,
+            detail=f"Batch exceeds {settings.EVENTS_BATCH_MAX_SIZE} events",
+        )
+
+
+async def _read_batch(request: Request) -> List[Tuple[Any, Optional[str]]]:
+    """Прочитать тело запроса: JSON-массив или NDJSON-поток. Возвращает пары (объект, ошибка разбора)"""
+    content_type = request.headers.get("content-type", "").split(";")[0].strip().lower()
+
+    if content_type not in NDJSON_MEDIA_TYPES:
+        try:
+            body = await request.json()
+        except ValueError:
+            raise HTTPException(status_code=400, detail="Body must be a JSON array of events")
+        if not isinstance(body, list):
+            raise HTTPException(status_code=400, detail="Body must be a JSON array of events")
+        _check_batch_size(len(body))
+        return [(item, None) for item in body]
+
+    # NDJSON разбираем построчно по мере поступления, не собирая тело целиком
+    items = []
+    buffer = b""
+
+    def parse_line(line: bytes):
+        if not line.strip():
+            return
+        try:
+            items.append((json.loads(line), None))
+        except ValueError as e:
+            items.append((None, f"invalid JSON: {e}"))
+        _check_batch_size(len(items))
+
+    async for chunk in request.stream():
+        buffer += chunk
+        *lines, buffer = buffer.split(b"\n")
+        for line in lines:
+            parse_line(line)
+    parse_line(buffer)
+    return items
+
+
+def _format_validation_error(e: ValidationError) -> str:
+    return "; ".join(
+        f"{'.'.join(str(part) for part in err['loc'])}: {err['msg']}" for err in e.errors()
+    )
+
+
+@router.post(
+    "/batch",
+    response_model=EventBatchResult,
+    summary="Пакетная загрузка событий",
+    openapi_extra={
+        "requestBody": {
+            "required": True,
+            "content": {
+                "application/json": {
+                    "schema": {"type": "array", "items": {"$ref": "#/components/schemas/EventBatchItem"}},
+                },
+                "application/x-ndjson": {
+                    "schema": {"type": "string", "description": "По одному событию EventBatchItem на строку"},
+                },
+            },
+        },
+    },
+)
+async def create_events_batch(request: Request, user: dict = Depends(get_current_user)):
+    """
+    Принимает JSON-массив событий или поток NDJSON (Content-Type: application/x-ndjson).
+
+    Все корректные события пишутся одним запросом в одной транзакции, в аудит
+    пишется одна запись на весь пакет (и по записи на каждое сработавшее правило). Результат возвращается для каждого элемента
+    в порядке поступления.
+
+    Тело читается и проверяется до открытия транзакции: подключение из пула
+    занимается только на время записи пакета и обработки правил.
+    """
+    raw_items = await _read_batch(request)
+
+    results: List[Optional[EventBatchItemResult]] = [None] * len(raw_items)
+    valid, valid_indexes = [], []
+    for index, (payload, error) in enumerate(raw_items):
+        if error is None:
+            try:
+                item = EventBatchItem.model_validate(payload)
+            except ValidationError as e:
+                error = _format_validation_error(e)
+        if error is not None:
+            results[index] = EventBatchItemResult(index=index, status="rejected", error=error)
+        else:
+            valid.append(item.model_dump())
+            valid_indexes.append(index)
+
+    if valid:
+        async with adb.unit_of_work():
+            created = await queries.create_events_batch(user["id"], valid)
+            await rule_engine.process_events(user["id"], [event for event in created if event is not None])
+        for index, item, event in zip(valid_indexes, valid, created):
+            if event is None:
+                results[index] = EventBatchItemResult(
+                    index=index, status="rejected", error=f"Device {item['device_id']} not found"
+                )
+            else:
+                results[index] = EventBatchItemResult(index=index, status="created", event=event)
+
+    accepted = sum(1 for r in results if r.status == "created")
+    return EventBatchResult(accepted=accepted, rejected=len(results) - accepted, items=results)
+
+
 @router.get("/device/{device_id}", response_model=List[EventRead], summary="События устройства")
-def list_events(device_id: int, user: dict = Depends(get_current_user)):
-    return queries.get_events_by_device(device_id)
+async def list_events(
+    device_id: int,
+    response: Response,
+    page: PageParams = Depends(page_params),
+    user: dict = Depends(get_current_user),
+):
+    """События устройства от новых к старым. Курсоры — в заголовках X-Next-Cursor / X-Prev-Cursor."""
+    columns, rows = await queries.get_events_by_device_rows(device_id, **page.query_kwargs())
+    rows = paginate(rows, page, response, key=tuple_key(columns))
+    return rows_response(EVENT_ENCODER, columns, rows, response)
+
+
+@router.get("/stream", summary="Подписка на новые события (Server-Sent Events)")
+async def stream_events(
+    home_id: Optional[int] = None,
+    device_id: Optional[int] = None,
+    user: dict = Depends(get_current_user),
+):
+    """
+    Новые события дома или устройства по мере вставки (text/event-stream).
+
+    - `event: event` — событие в data (JSON как в EventRead плюс home_id);
+    - `event: gap` — клиент не успевал читать, data.dropped событий пропущено:
+      их можно догрузить через GET /events/device/{id};
+    - комментарий `: keepalive` — раз в REALTIME_KEEPALIVE_INTERVAL секунд без событий.
+
+    Все подписки воркера обслуживает одно LISTEN-подключение к БД.
+    """
+    if (home_id is None) == (device_id is None):
+        raise HTTPException(status_code=400, detail="Specify exactly one of home_id or device_id")
+    return StreamingResponse(
+        event_broadcaster.stream(home_id, device_id, settings.REALTIME_KEEPALIVE_INTERVAL),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
+
+
+@router.get("/export", summary="Потоковая выгрузка событий (NDJSON/CSV)")
+async def export_events(
+    home_id: Optional[int] = None,
+    device_id: Optional[int] = None,
+    from_dt: Optional[datetime] = Query(None, alias="from"),
+    to_dt: Optional[datetime] = Query(None, alias="to"),
+    format: str = Query("ndjson", description="ndjson | csv"),
+    user: dict = Depends(get_current_user),
+):
+    """
+    Выгрузка событий дома и/или устройства за период, от старых к новым.
+    Строки читаются из БД серверным курсором порциями по EXPORT_CHUNK_SIZE
+    и сразу отдаются клиенту — память не растёт с размером выгрузки.
+    """
+    if home_id is None and device_id is None:
+        raise HTTPException(status_code=400, detail="home_id or device_id is required")
+    chunks = queries.stream_events(
+        home_id=home_id,
+        device_id=device_id,
+        from_dt=naive_utc(from_dt),
+        to_dt=naive_utc(to_dt),
+        chunk_size=settings.EXPORT_CHUNK_SIZE,
+    )
+    return export_response(chunks, list(EventRead.model_fields), format, "events")
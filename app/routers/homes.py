@@ -1,26 +1,42 @@
 from typing import List
-from fastapi import APIRouter, Depends
+from fastapi import APIRouter, Depends, HTTPException, Response
 from app.schemas import HomeCreate, HomeRead
-from app.deps import get_current_admin
+from app.deps import get_current_admin, get_current_user, transactional
 from app.sql import queries
 
 router = APIRouter(prefix="/homes", tags=["homes"])
 
 
-@router.post("/", response_model=HomeRead, summary="Создать дом (admin)")
-def create_home(home_in: HomeCreate, admin: dict = Depends(get_current_admin)):
-    home = queries.create_home(name=home_in.name, address=home_in.address)
+@router.post("/", response_model=HomeRead, summary="Создать дом (admin)", dependencies=[Depends(transactional)])
+async def create_home(home_in: HomeCreate, admin: dict = Depends(get_current_admin)):
+    home = await queries.create_home(name=home_in.name, address=home_in.address)
     return home
 
 
 @router.get("/", response_model=List[HomeRead], summary="Список домов (admin)")
-def list_homes(admin: dict = Depends(get_current_admin)):
-    return queries.get_all_homes()
+async def list_homes(admin: dict = Depends(get_current_admin)):
+    return await queries.get_all_homes()
 
 
 @router.get("/{home_id}", response_model=HomeRead, summary="Получить дом (admin)")
-def get_home(home_id: int, admin: dict = Depends(get_current_admin)):
-    home = queries.get_home_by_id(home_id)
+async def get_home(home_id: int, admin: dict = Depends(get_current_admin)):
+    home = await queries.get_home_by_id(home_id)
     if not home:
         return {"detail": "Home not found"}
     return home
+
+
+@router.get("/{home_id}/snapshot", summary="Дом целиком: комнаты, устройства, датчики, правила")
+async def get_home_snapshot(home_id: int, user: dict = Depends(get_current_user)):
+    """
+    Всё для отрисовки дома одним запросом вместо /homes, /rooms, /devices,
+    /sensors по каждому устройству и /rules. JSON собирает PostgreSQL
+    (json_agg / json_build_object), ответ отдаётся как есть.
+    Доступно администратору и жильцам этого дома.
+    """
+    if user.get("role") != "admin" and user.get("home_id") != home_id:
+        raise HTTPException(status_code=403, detail="Access to this home is not allowed")
+    snapshot = await queries.get_home_snapshot(home_id)
+    if snapshot is None:
+        raise HTTPException(status_code=404, detail="Home not found")
+    return Response(content=snapshot, media_type="application/json")
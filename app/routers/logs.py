@@ -1,17 +1,55 @@
-from typing import List
-from fastapi import APIRouter, Depends
+from datetime import datetime
+from typing import List, Optional
+from fastapi import APIRouter, Depends, Query, Response
+from app.config import settings
 from app.schemas import LogRead
 from app.deps import get_current_admin
+from app.export import export_response
+from app.pagination import PageParams, naive_utc, page_params, paginate, tuple_key
+from app.responses import LOG_ENCODER, rows_response
 from app.sql import queries
 
 router = APIRouter(prefix="/logs", tags=["logs"])
 
 
 @router.get("/", response_model=List[LogRead], summary="Все логи (admin)")
-def list_logs(admin: dict = Depends(get_current_admin)):
-    return queries.get_logs()
+async def list_logs(
+    response: Response,
+    page: PageParams = Depends(page_params),
+    admin: dict = Depends(get_current_admin),
+):
+    """Логи от новых к старым. Курсоры соседних страниц — в заголовках X-Next-Cursor / X-Prev-Cursor."""
+    columns, rows = await queries.get_logs_rows(**page.query_kwargs())
+    rows = paginate(rows, page, response, key=tuple_key(columns))
+    return rows_response(LOG_ENCODER, columns, rows, response)
 
 
 @router.get("/user/{user_id}", response_model=List[LogRead], summary="Логи пользователя")
-def list_user_logs(user_id: int, admin: dict = Depends(get_current_admin)):
-    return queries.get_logs_by_user(user_id)
+async def list_user_logs(
+    user_id: int,
+    response: Response,
+    page: PageParams = Depends(page_params),
+    admin: dict = Depends(get_current_admin),
+):
+    """Логи пользователя от новых к старым. Курсоры — в заголовках X-Next-Cursor / X-Prev-Cursor."""
+    columns, rows = await queries.get_logs_by_user_rows(user_id, **page.query_kwargs())
+    rows = paginate(rows, page, response, key=tuple_key(columns))
+    return rows_response(LOG_ENCODER, columns, rows, response)
+
+
+@router.get("/export", summary="Потоковая выгрузка логов (NDJSON/CSV, admin)")
+async def export_logs(
+    user_id: Optional[int] = None,
+    from_dt: Optional[datetime] = Query(None, alias="from"),
+    to_dt: Optional[datetime] = Query(None, alias="to"),
+    format: str = Query("ndjson", description="ndjson | csv"),
+    admin: dict = Depends(get_current_admin),
+):
+    """Выгрузка логов (всех или одного пользователя) за период серверным курсором, от старых к новым."""
+    chunks = queries.stream_logs(
+        user_id=user_id,
+        from_dt=naive_utc(from_dt),
+        to_dt=naive_utc(to_dt),
+        chunk_size=settings.EXPORT_CHUNK_SIZE,
+    )
+    return export_response(chunks, list(LogRead.model_fields), format, "logs")
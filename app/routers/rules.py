@@ -1,30 +1,37 @@
 from typing import List
-from fastapi import APIRouter, Depends
+from fastapi import APIRouter, Depends, HTTPException
 from app.schemas import RuleCreate, RuleRead
-from app.deps import get_current_user
+from app.deps import get_current_user, transactional
+from app.etag import home_etag
+from app.rule_engine import compile_condition
 from app.sql import queries
 
 router = APIRouter(prefix="/rules", tags=["rules"])
 
 
-@router.post("/", response_model=RuleRead, summary="Создать правило автоматики")
-def create_rule(rule_in: RuleCreate, user: dict = Depends(get_current_user)):
-    rule = queries.create_rule(
+@router.post("/", response_model=RuleRead, summary="Создать правило автоматики", dependencies=[Depends(transactional)])
+async def create_rule(rule_in: RuleCreate, user: dict = Depends(get_current_user)):
+    try:
+        compile_condition(rule_in.condition)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    return await queries.create_rule_with_log(
         home_id=rule_in.home_id,
         condition=rule_in.condition,
         action=rule_in.action,
+        user_id=user["id"],
     )
-    queries.create_log(user["id"], f"Created rule in home {rule_in.home_id}")
-    return rule
 
 
 @router.get("/home/{home_id}", response_model=List[RuleRead], summary="Правила дома")
-def list_rules(home_id: int, user: dict = Depends(get_current_user)):
-    return queries.get_rules_by_home(home_id)
+async def list_rules(home_id: int, user: dict = Depends(get_current_user), etag: str = Depends(home_etag)):
+    """Поддерживает If-None-Match: ETag меняется с версией данных дома"""
+    return await queries.get_rules_by_home(home_id)
 
 
-@router.delete("/{rule_id}", summary="Удалить правило")
-def delete_rule(rule_id: int, user: dict = Depends(get_current_user)):
-    queries.delete_rule(rule_id)
-    queries.create_log(user["id"], f"Deleted rule {rule_id}")
+@router.delete("/{rule_id}", summary="Удалить правило", dependencies=[Depends(transactional)])
+async def delete_rule(rule_id: int, user: dict = Depends(get_current_user)):
+    rule = await queries.delete_rule_with_log(rule_id, user["id"])
+    if not rule:
+        raise HTTPException(status_code=404, detail="Rule not found")
     return {"detail": "Rule deleted"}
@@ -1,31 +1,128 @@
-from typing import List
-from fastapi import APIRouter, Depends
-from app.schemas import SensorCreate, SensorRead, SensorUpdateValue
-from app.deps import get_current_user
+import re
+from datetime import datetime, timedelta
+from typing import List, Optional
+from fastapi import APIRouter, Depends, HTTPException, Query, Response
+from app.config import settings
+from app.schemas import SensorCreate, SensorRead, SensorReadingRead, SensorUpdateValue
+from app.deps import get_current_user, transactional
+from app.pagination import PageParams, naive_utc, page_params, paginate, tuple_key
+from app.responses import SENSOR_READING_ENCODER, rows_response
 from app.sql import queries
 
 router = APIRouter(prefix="/sensors", tags=["sensors"])
 
+BUCKET_RE = re.compile(r"^(\d+)(s|m|h|d)$")
+BUCKET_UNITS = {"s": "seconds", "m": "minutes", "h": "hours", "d": "days"}
 
-@router.post("/", response_model=SensorRead, summary="Создать датчик")
-def create_sensor(sensor_in: SensorCreate, user: dict = Depends(get_current_user)):
-    sensor = queries.create_sensor(
+
+@router.post("/", response_model=SensorRead, summary="Создать датчик", dependencies=[Depends(transactional)])
+async def create_sensor(sensor_in: SensorCreate, user: dict = Depends(get_current_user)):
+    return await queries.create_sensor_with_log(
         device_id=sensor_in.device_id,
         type_=sensor_in.type,
         value=sensor_in.value,
+        user_id=user["id"],
     )
-    queries.create_log(user["id"], f"Created sensor: {sensor_in.type}")
-    return sensor
 
 
 @router.get("/device/{device_id}", response_model=List[SensorRead], summary="Датчики устройства")
-def list_sensors(device_id: int, user: dict = Depends(get_current_user)):
-    return queries.get_sensors_by_device(device_id)
+async def list_sensors(device_id: int, user: dict = Depends(get_current_user)):
+    return await queries.get_sensors_by_device(device_id)
 
 
-@router.patch("/{sensor_id}/value", response_model=SensorRead, summary="Обновить значение датчика")
-def update_value(sensor_id: int, update: SensorUpdateValue, user: dict = Depends(get_current_user)):
-    queries.update_sensor_value(sensor_id, update.value)
-    sensor = queries.get_sensor_by_id(sensor_id)
-    queries.create_log(user["id"], f"Updated sensor {sensor_id} value to {update.value}")
+@router.patch("/{sensor_id}/value", response_model=SensorRead, summary="Обновить значение датчика", dependencies=[Depends(transactional)])
+async def update_value(sensor_id: int, update: SensorUpdateValue, user: dict = Depends(get_current_user)):
+    """
+    Текущее значение датчика — любая строка. Числовые значения ('22°C') и состояния
+    (open/closed, detected/clear, on/off) добавляются в историю показаний.
+    """
+    if update.unit is not None and len(update.unit) > 16:
+        raise HTTPException(status_code=400, detail="Unit must be at most 16 characters")
+    sensor = await queries.update_sensor_value_with_log(sensor_id, update.value, user["id"], update.unit)
+    if not sensor:
+        raise HTTPException(status_code=404, detail="Sensor not found")
     return sensor
+
+
+@router.get("/{sensor_id}/readings", response_model=List[SensorReadingRead], summary="История показаний датчика")
+async def list_readings(
+    sensor_id: int,
+    response: Response,
+    page: PageParams = Depends(page_params),
+    user: dict = Depends(get_current_user),
+):
+    """Показания от новых к старым. Курсоры — в заголовках X-Next-Cursor / X-Prev-Cursor."""
+    columns, rows = await queries.get_sensor_readings_rows(sensor_id, **page.query_kwargs())
+    rows = paginate(rows, page, response, key=tuple_key(columns))
+    return rows_response(SENSOR_READING_ENCODER, columns, rows, response)
+
+
+def _parse_bucket(value: str) -> timedelta:
+    match = BUCKET_RE.match(value.strip())
+    if not match or int(match.group(1)) == 0:
+        raise HTTPException(status_code=400, detail="Bucket must look like 30s, 5m, 1h or 1d")
+    return timedelta(**{BUCKET_UNITS[match.group(2)]: int(match.group(1))})
+
+
+def _parse_percentiles(value: str) -> List[float]:
+    try:
+        percentiles = [float(p) for p in value.split(",") if p.strip()]
+    except ValueError:
+        percentiles = []
+    if not percentiles or not all(0 < p < 1 for p in percentiles):
+        raise HTTPException(status_code=400, detail="Percentiles must be fractions between 0 and 1, e.g. 0.5,0.95")
+    return percentiles
+
+
+@router.get("/{sensor_id}/readings/aggregate", summary="Агрегаты показаний датчика по интервалам")
+async def aggregate_readings(
+    sensor_id: int,
+    bucket: str = "1h",
+    from_dt: Optional[datetime] = Query(None, alias="from"),
+    to_dt: Optional[datetime] = Query(None, alias="to"),
+    percentiles: str = "0.5,0.95,0.99",
+    user: dict = Depends(get_current_user),
+):
+    """
+    Количество, min, max, среднее и перцентили показаний по интервалам. Считается в SQL.
+
+    Query параметры:
+    - bucket: длина интервала (30s, 5m, 1h, 1d), по умолчанию 1h
+    - from / to: период (по умолчанию — последние сутки)
+    - percentiles: доли через запятую, по умолчанию 0.5,0.95,0.99
+    """
+    step = _parse_bucket(bucket)
+    points = _parse_percentiles(percentiles)
+    to_dt = naive_utc(to_dt) or datetime.utcnow()
+    from_dt = naive_utc(from_dt) or to_dt - timedelta(days=1)
+    if from_dt >= to_dt:
+        raise HTTPException(status_code=400, detail="'from' must be earlier than 'to'")
+    if (to_dt - from_dt) / step > settings.SENSOR_READINGS_MAX_BUCKETS:
+        raise HTTPException(
+            status_code=400, detail=f"Period spans more than {settings.SENSOR_READINGS_MAX_BUCKETS} buckets"
+        )
+    if not await queries.get_sensor_by_id(sensor_id):
+        raise HTTPException(status_code=404, detail="Sensor not found")
+
+    rows = await queries.aggregate_sensor_readings(sensor_id, step, from_dt, to_dt, points)
+    names = [f"p{p * 100:g}" for p in points]
+    buckets = [
+        {
+            "bucket": row["bucket"],
+            "unit": row["unit"],
+            "count": row["count"],
+            "min": row["min"],
+            "max": row["max"],
+            "avg": row["avg"],
+            **dict(zip(names, row["percentiles"])),
+        }
+        for row in rows
+    ]
+    return {
+        "status": "ok",
+        "sensor_id": sensor_id,
+        "bucket": bucket,
+        "from": from_dt.isoformat(),
+        "to": to_dt.isoformat(),
+        "buckets": buckets,
+    }
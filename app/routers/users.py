@@ -1,15 +1,15 @@
 from typing import List
 from fastapi import APIRouter, Depends, HTTPException, status
-from app.schemas import UserCreate, UserRead
-from app.deps import get_current_admin, get_current_user
+from app.schemas import UserCreate, UserRead, UserUpdateRole
+from app.deps import get_current_admin, get_current_user, transactional
 from app.sql import queries
 
 router = APIRouter(prefix="/users", tags=["users"])
 
 
-@router.post("/init-admin", response_model=UserRead, summary="Инициализация первого админа")
-def init_admin(user_in: UserCreate):
-    user = queries.create_user(
+@router.post("/init-admin", response_model=UserRead, summary="Инициализация первого админа", dependencies=[Depends(transactional)])
+async def init_admin(user_in: UserCreate):
+    user = await queries.create_user(
         email=user_in.email,
         password=user_in.password,
         role="admin",
@@ -18,12 +18,12 @@ def init_admin(user_in: UserCreate):
     return user
 
 
-@router.post("/", response_model=UserRead, summary="Создать пользователя (admin)")
-def create_user(user_in: UserCreate, admin: dict = Depends(get_current_admin)):
-    existing = queries.get_user_by_email(user_in.email)
+@router.post("/", response_model=UserRead, summary="Создать пользователя (admin)", dependencies=[Depends(transactional)])
+async def create_user(user_in: UserCreate, admin: dict = Depends(get_current_admin)):
+    existing = await queries.get_user_by_email(user_in.email)
     if existing:
         raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail="Email already registered")
-    user = queries.create_user(
+    user = await queries.create_user(
         email=user_in.email,
         password=user_in.password,
         role=user_in.role,
@@ -33,10 +33,21 @@ def create_user(user_in: UserCreate, admin: dict = Depends(get_current_admin)):
 
 
 @router.get("/me", response_model=UserRead, summary="Информация о текущем пользователе")
-def read_me(current_user: dict = Depends(get_current_user)):
+async def read_me(current_user: dict = Depends(get_current_user)):
     return current_user
 
 
 @router.get("/", response_model=List[UserRead], summary="Список пользователей (admin)")
-def list_users(admin: dict = Depends(get_current_admin)):
-    return queries.get_all_users()
+async def list_users(admin: dict = Depends(get_current_admin)):
+    return await queries.get_all_users()
+
+
+@router.patch("/{user_id}/role", response_model=UserRead, summary="Изменить роль пользователя (admin)", dependencies=[Depends(transactional)])
+async def update_role(user_id: int, update: UserUpdateRole, admin: dict = Depends(get_current_admin)):
+    if update.role not in ("admin", "user"):
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail="Role must be 'admin' or 'user'")
+    user = await queries.update_user_role(user_id, update.role)
+    if not user:
+        raise HTTPException(status_code=404, detail="User not found")
+    await queries.create_log(admin["id"], f"Changed user {user_id} role to {update.role}")
+    return user
@@ -0,0 +1,292 @@
+"""
+Движок правил автоматики.
+
+Условие правила — сравнение сигнала с литералом: `temperature > 25`,
+`motion_detected == true`, `door_open != false`, `mode == "away"`.
+Операторы: ==, !=, >, >=, <, <=. Литералы: числа, true/false, строки
+(в кавычках или без, например 22:00).
+
+С числовым литералом значение события читается как показание датчика
+(queries.parse_sensor_reading): единица измерения отбрасывается ('22°C' — 22),
+а состояния двоичных датчиков дают 1/0, как в истории sensor_readings:
+detected/open/on/true — 1, clear/closed/off/false — 0. Поэтому
+`motion > 0` срабатывает на 'detected', а `door_open == 1` — на 'open'.
+
+Условия разбираются один раз в объекты Condition, правила дома собираются в
+RuleSet и кэшируются (rule_cache). RuleSet индексирует правила по сигналу,
+а внутри сигнала — по оператору: == через словарь, пороги >, >=, <, <= через
+отсортированные списки, поэтому событие проверяет только подходящие правила.
+
+Событие даёт сигнал по своему типу (см. EVENT_SIGNALS) со значением value
+(без значения — true). Условия по времени (`time == 22:00`) событиями
+не вызываются.
+"""
+import operator
+import re
+from bisect import bisect_left, bisect_right
+from datetime import datetime
+from typing import Any, Callable, Dict, Iterable, List, Optional, Tuple
+
+from app.cache import TTLCache, rule_cache
+from app.config import settings
+from app.sql import queries
+
+CONDITION_RE = re.compile(r"^\s*([A-Za-z_][\w.]*)\s*(==|!=|>=|<=|>|<|=)\s*(.+?)\s*$")
+
+OPERATORS: Dict[str, Callable[[Any, Any], bool]] = {
+    "==": operator.eq,
+    "!=": operator.ne,
+    ">": operator.gt,
+    ">=": operator.ge,
+    "<": operator.lt,
+    "<=": operator.le,
+}
+
+TRUE_VALUES = {"true", "1", "yes", "on"}
+FALSE_VALUES = {"false", "0", "no", "off"}
+
+# Тип события -> (сигнал, значение по умолчанию, если у события нет value)
+EVENT_SIGNALS: Dict[str, Tuple[str, Optional[str]]] = {
+    "temperature_change": ("temperature", None),
+    "humidity_change": ("humidity", None),
+    "door_open": ("door_open", "true"),
+    "door_close": ("door_open", "false"),
+}
+
+# Значение с типом: ("n", 25.0), ("b", True), ("s", "22:00")
+Value = Tuple[str, Any]
+
+
+def parse_literal(text: str) -> Value:
+    """Литерал условия: число, true/false или строка (кавычки снимаются)"""
+    if len(text) >= 2 and text[0] == text[-1] and text[0] in "'\"":
+        return ("s", text[1:-1].casefold())
+    lowered = text.casefold()
+    if lowered in ("true", "false"):
+        return ("b", lowered == "true")
+    try:
+        return ("n", float(text))
+    except ValueError:
+        return ("s", lowered)
+
+
+def coerce_value(raw: Optional[str], kind: str) -> Optional[Any]:
+    """Значение события в типе литерала условия; None — не приводится"""
+    if raw is None:
+        return None
+    if kind == "n":
+        # значения датчиков приходят с единицами измерения: '22°C', '55 %';
+        # состояния ('open', 'detected', ...) — 1/0, см. docstring модуля
+        reading = queries.parse_sensor_reading(str(raw))
+        return reading[0] if reading is not None else None
+    text = str(raw).strip().casefold()
+    if kind == "b":
+        if text in TRUE_VALUES:
+            return True
+        if text in FALSE_VALUES:
+            return False
+        return None
+    return text
+
+
+class Condition:
+    """Разобранное условие `signal op literal`, вызывается как предикат от значения сигнала"""
+
+    __slots__ = ("signal", "op", "kind", "literal", "_compare")
+
+    def __init__(self, signal: str, op: str, literal: Value):
+        self.signal = signal
+        self.op = op
+        self.kind, self.literal = literal
+        self._compare = OPERATORS[op]
+
+    def __call__(self, raw: Optional[str]) -> bool:
+        value = coerce_value(raw, self.kind)
+        if value is None:
+            return False
+        return self._compare(value, self.literal)
+
+    def __repr__(self):
+        return f"Condition({self.signal} {self.op} {self.literal!r})"
+
+
+def compile_condition(text: str) -> Condition:
+    """Разобрать текст условия; ValueError, если формат не поддерживается"""
+    match = CONDITION_RE.match(text or "")
+    if not match:
+        raise ValueError(f"Unsupported condition: {text!r} (expected '<signal> <op> <value>')")
+    signal, op, literal = match.groups()
+    if op == "=":
+        op = "=="
+    kind, value = parse_literal(literal)
+    if kind == "b" and op not in ("==", "!="):
+        raise ValueError(f"Operator {op} is not supported for boolean values: {text!r}")
+    return Condition(signal.casefold(), op, (kind, value))
+
+
+def event_signal(event_type: str, value: Optional[str]) -> Tuple[str, str]:
+    """Сигнал и его значение для события"""
+    signal, default = EVENT_SIGNALS.get(event_type, (event_type, "true"))
+    if value is None:
+        value = default
+    return signal, value
+
+
+class CompiledRule:
+    __slots__ = ("id", "condition", "action")
+
+    def __init__(self, rule_id: int, condition: Condition, action: str):
+        self.id = rule_id
+        self.condition = condition
+        self.action = action
+
+
+class _Thresholds:
+    """Правила с порогом одного оператора, отсортированные по порогу"""
+
+    __slots__ = ("keys", "rules")
+
+    def __init__(self, items: List[Tuple[Any, CompiledRule]]):
+        items.sort(key=lambda item: item[0])
+        self.keys = [key for key, _ in items]
+        self.rules = [rule for _, rule in items]
+
+
+class _SignalIndex:
+    """Правила одного сигнала, сгруппированные по типу литерала и оператору"""
+
+    def __init__(self, rules: Iterable[CompiledRule]):
+        # kind -> значение литерала -> правила с ==
+        self.eq: Dict[str, Dict[Any, List[CompiledRule]]] = {}
+        # kind -> правила с != (проверяются все)
+        self.ne: Dict[str, List[CompiledRule]] = {}
+        # kind -> оператор порога -> отсортированные пороги
+        self.ranges: Dict[str, Dict[str, _Thresholds]] = {}
+        ranges: Dict[str, Dict[str, List[Tuple[Any, CompiledRule]]]] = {}
+        for rule in rules:
+            cond = rule.condition
+            if cond.op == "==":
+                self.eq.setdefault(cond.kind, {}).setdefault(cond.literal, []).append(rule)
+            elif cond.op == "!=":
+                self.ne.setdefault(cond.kind, []).append(rule)
+            else:
+                ranges.setdefault(cond.kind, {}).setdefault(cond.op, []).append((cond.literal, rule))
+        for kind, by_op in ranges.items():
+            self.ranges[kind] = {op: _Thresholds(items) for op, items in by_op.items()}
+        self.kinds = set(self.eq) | set(self.ne) | set(self.ranges)
+
+    def match(self, raw: Optional[str]) -> List[CompiledRule]:
+        matched: List[CompiledRule] = []
+        for kind in self.kinds:
+            value = coerce_value(raw, kind)
+            if value is None:
+                continue
+            matched.extend(self.eq.get(kind, {}).get(value, ()))
+            matched.extend(rule for rule in self.ne.get(kind, ()) if rule.condition.literal != value)
+            for op, thresholds in self.ranges.get(kind, {}).items():
+                keys, rules = thresholds.keys, thresholds.rules
+                if op == ">":  # value > порог
+                    matched.extend(rules[:bisect_left(keys, value)])
+                elif op == ">=":
+                    matched.extend(rules[:bisect_right(keys, value)])
+                elif op == "<":  # value < порог
+                    matched.extend(rules[bisect_right(keys, value):])
+                else:
+                    matched.extend(rules[bisect_left(keys, value):])
+        return matched
+
+
+class RuleSet:
+    """Скомпилированные правила одного дома, проиндексированные по сигналу"""
+
+    def __init__(self, rules: Iterable[Dict[str, Any]]):
+        by_signal: Dict[str, List[CompiledRule]] = {}
+        self.invalid: List[int] = []
+        self.size = 0
+        for row in rules:
+            try:
+                condition = compile_condition(row["condition"])
+            except ValueError:
+                self.invalid.append(row["id"])
+                continue
+            by_signal.setdefault(condition.signal, []).append(CompiledRule(row["id"], condition, row["action"]))
+            self.size += 1
+        self._index = {signal: _SignalIndex(rules) for signal, rules in by_signal.items()}
+
+    def match(self, signal: str, raw: Optional[str]) -> List[CompiledRule]:
+        """Правила, условие которых выполняется для значения сигнала, по возрастанию id"""
+        index = self._index.get(signal)
+        if index is None:
+            return []
+        matched = index.match(raw)
+        matched.sort(key=lambda rule: rule.id)
+        return matched
+
+
+class RuleEngine:
+    """Проверка правил дома для поступающих событий с кэшем скомпилированных правил"""
+
+    def __init__(self, cache: TTLCache, device_homes: TTLCache):
+        self.cache = cache
+        self.device_homes = device_homes
+        self._stats = {"events_checked": 0, "rules_triggered": 0, "rule_sets_compiled": 0}
+
+    async def get_rule_set(self, home_id: int) -> RuleSet:
+        """Правила дома из кэша или из базы (с компиляцией)"""
+        rule_set = self.cache.get(home_id)
+        if rule_set is None:
+            rule_set = RuleSet(await queries.get_rules_by_home(home_id))
+            self.cache.set(home_id, rule_set)
+            self._stats["rule_sets_compiled"] += 1
+        return rule_set
+
+    async def _homes_of(self, device_ids: Iterable[int]) -> Dict[int, int]:
+        homes, missing = {}, []
+        for device_id in set(device_ids):
+            home_id = self.device_homes.get(device_id)
+            if home_id is None:
+                missing.append(device_id)
+            else:
+                homes[device_id] = home_id
+        if missing:
+            found = await queries.get_device_homes(missing)
+            for device_id, home_id in found.items():
+                self.device_homes.set(device_id, home_id)
+            homes.update(found)
+        return homes
+
+    async def process_events(self, user_id: int, events: List[Dict[str, Any]]) -> List[Tuple[Dict[str, Any], CompiledRule]]:
+        """
+        Проверить правила для созданных событий; сработавшие правила пишутся в аудит.
+        Возвращает пары (событие, правило).
+        """
+        if not events:
+            return []
+        homes = await self._homes_of(event["device_id"] for event in events)
+        rule_sets = {home_id: await self.get_rule_set(home_id) for home_id in set(homes.values())}
+        triggered = []
+        for event in events:
+            home_id = homes.get(event["device_id"])
+            if home_id is None:
+                continue
+            signal, value = event_signal(event["event_type"], event.get("value"))
+            for rule in rule_sets[home_id].match(signal, value):
+                triggered.append((event, rule))
+        self._stats["events_checked"] += len(events)
+        self._stats["rules_triggered"] += len(triggered)
+        now = datetime.utcnow()
+        await queries.create_logs([
+            (user_id, queries.fit_log_action(f"Rule {rule.id} triggered by event {event['id']}: {rule.action}"), now)
+            for event, rule in triggered
+        ])
+        return triggered
+
+    def get_stats(self) -> Dict[str, Any]:
+        return {**self._stats, "rule_cache": self.cache.get_stats(), "device_homes": self.device_homes.get_stats()}
+
+
+# Устройство не переходит в другой дом, поэтому привязку можно держать дольше правил
+rule_engine = RuleEngine(
+    cache=rule_cache,
+    device_homes=TTLCache(maxsize=settings.RULE_DEVICE_CACHE_SIZE, ttl=settings.RULE_DEVICE_CACHE_TTL),
+)
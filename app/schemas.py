@@ -1,5 +1,5 @@
-from pydantic import BaseModel, EmailStr
-from typing import Optional
+from pydantic import BaseModel, EmailStr, Field
+from typing import Optional, List
 from datetime import datetime
 
 
@@ -21,6 +21,10 @@ class UserCreate(BaseModel):
     home_id: Optional[int] = None
 
 
+class UserUpdateRole(BaseModel):
+    role: str  # 'admin' | 'user'
+
+
 class UserRead(BaseModel):
     id: int
     email: str
@@ -78,6 +82,19 @@ class DeviceUpdateStatus(BaseModel):
     status: str
 
 
+class DeviceBulkStatusUpdate(BaseModel):
+    status: str
+    device_ids: Optional[List[int]] = None  # либо список устройств,
+    home_id: Optional[int] = None  # либо все устройства дома
+    type: Optional[str] = None  # дополнительно: только устройства типа
+
+
+class DeviceBulkStatusResult(BaseModel):
+    updated: int
+    devices: List[DeviceRead]
+    not_found: List[int] = []  # id из device_ids, которых нет (или другого type)
+
+
 # ==================== SENSORS ====================
 
 
@@ -95,7 +112,16 @@ class SensorRead(BaseModel):
 
 
 class SensorUpdateValue(BaseModel):
-    value: str
+    value: str  # '22°C', '55 %', 'open', 'detected'
+    unit: Optional[str] = None  # по умолчанию — из value
+
+
+class SensorReadingRead(BaseModel):
+    id: int
+    sensor_id: int
+    timestamp: datetime
+    value: float
+    unit: Optional[str]
 
 
 # ==================== EVENTS ====================
@@ -115,6 +141,26 @@ class EventRead(BaseModel):
     value: Optional[str]
 
 
+class EventBatchItem(EventCreate):
+    # ограничения столбцов events: слишком длинный элемент отклоняется сам, а не роняет весь пакет
+    event_type: str = Field(max_length=64)
+    value: Optional[str] = Field(None, max_length=255)
+    timestamp: Optional[datetime] = None  # время события на устройстве; по умолчанию — время приёма
+
+
+class EventBatchItemResult(BaseModel):
+    index: int
+    status: str  # 'created' | 'rejected'
+    event: Optional[EventRead] = None
+    error: Optional[str] = None
+
+
+class EventBatchResult(BaseModel):
+    accepted: int
+    rejected: int
+    items: List[EventBatchItemResult]
+
+
 # ==================== RULES ====================
 
 
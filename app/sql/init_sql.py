@@ -1,4 +1,77 @@
-INIT_SQL = """
+# Помесячное секционирование events и logs.
+# Секция таблицы t за месяц YYYYMM называется t_YYYYMM, плюс секция t_default
+# для строк вне созданных диапазонов.
+PARTITIONING_SQL = """
+-- Создать секцию p_table за месяц, содержащий p_month. Строки этого месяца,
+-- уже попавшие в default-секцию, переносятся в новую секцию.
+CREATE OR REPLACE FUNCTION create_month_partition(p_table TEXT, p_month DATE)
+RETURNS BOOLEAN AS $$
+DECLARE
+    v_start DATE := date_trunc('month', p_month)::DATE;
+    v_end   DATE := (date_trunc('month', p_month) + INTERVAL '1 month')::DATE;
+    v_name  TEXT := p_table || '_' || to_char(v_start, 'YYYYMM');
+BEGIN
+    IF to_regclass(v_name) IS NOT NULL THEN
+        RETURN FALSE;
+    END IF;
+
+    EXECUTE format('CREATE TABLE %I (LIKE %I INCLUDING DEFAULTS)', v_name, p_table);
+    IF to_regclass(p_table || '_default') IS NOT NULL THEN
+        EXECUTE format(
+            'WITH moved AS (DELETE FROM %I WHERE timestamp >= %L AND timestamp < %L RETURNING *) '
+            'INSERT INTO %I SELECT * FROM moved',
+            p_table || '_default', v_start, v_end, v_name
+        );
+    END IF;
+    EXECUTE format(
+        'ALTER TABLE %I ATTACH PARTITION %I FOR VALUES FROM (%L) TO (%L)',
+        p_table, v_name, v_start, v_end
+    );
+    RETURN TRUE;
+END;
+$$ LANGUAGE plpgsql;
+
+-- Создать секции p_table на p_months месяцев начиная с месяца p_from,
+-- вернуть количество новых секций
+CREATE OR REPLACE FUNCTION create_month_partitions(p_table TEXT, p_from DATE, p_months INT)
+RETURNS INT AS $$
+DECLARE
+    v_created INT := 0;
+BEGIN
+    FOR i IN 0 .. p_months - 1 LOOP
+        IF create_month_partition(p_table, (date_trunc('month', p_from) + make_interval(months => i))::DATE) THEN
+            v_created := v_created + 1;
+        END IF;
+    END LOOP;
+    RETURN v_created;
+END;
+$$ LANGUAGE plpgsql;
+
+-- Политика хранения: удалить секции p_table старше p_keep_months полных месяцев
+-- до текущего. DROP секции вместо DELETE — без мёртвых строк и VACUUM.
+CREATE OR REPLACE FUNCTION drop_old_partitions(p_table TEXT, p_keep_months INT)
+RETURNS SETOF TEXT AS $$
+DECLARE
+    v_cutoff DATE := (date_trunc('month', CURRENT_DATE) - make_interval(months => p_keep_months))::DATE;
+    v_part   TEXT;
+BEGIN
+    FOR v_part IN
+        SELECT c.relname
+        FROM pg_inherits i
+        JOIN pg_class c ON c.oid = i.inhrelid
+        WHERE i.inhparent = p_table::regclass
+          AND c.relname ~ ('^' || p_table || '_[0-9]{6}$')
+          AND to_date(right(c.relname, 6), 'YYYYMM') < v_cutoff
+        ORDER BY c.relname
+    LOOP
+        EXECUTE format('DROP TABLE %I', v_part);
+        RETURN NEXT v_part;
+    END LOOP;
+END;
+$$ LANGUAGE plpgsql;
+"""
+
+INIT_SQL = PARTITIONING_SQL + """
 CREATE TABLE IF NOT EXISTS homes (
     id SERIAL PRIMARY KEY,
     name VARCHAR(255) NOT NULL,
@@ -34,13 +107,17 @@ CREATE TABLE IF NOT EXISTS sensors (
     value VARCHAR(255)
 );
 
+-- Секционирована по месяцам: ключ секционирования входит в первичный ключ
 CREATE TABLE IF NOT EXISTS events (
-    id SERIAL PRIMARY KEY,
+    id SERIAL,
     device_id INTEGER NOT NULL REFERENCES devices(id),
-    timestamp TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+    timestamp TIMESTAMP NOT NULL DEFAULT CURRENT_TIMESTAMP,
     event_type VARCHAR(64) NOT NULL,
-    value VARCHAR(255)
-);
+    value VARCHAR(255),
+    PRIMARY KEY (id, timestamp)
+) PARTITION BY RANGE (timestamp);
+
+CREATE TABLE IF NOT EXISTS events_default PARTITION OF events DEFAULT;
 
 CREATE TABLE IF NOT EXISTS rules (
     id SERIAL PRIMARY KEY,
@@ -49,18 +126,70 @@ CREATE TABLE IF NOT EXISTS rules (
     action TEXT NOT NULL
 );
 
+-- Секционирована по месяцам, как events
 CREATE TABLE IF NOT EXISTS logs (
-    id SERIAL PRIMARY KEY,
+    id SERIAL,
     user_id INTEGER NOT NULL REFERENCES users(id),
     action VARCHAR(255) NOT NULL,
-    timestamp TIMESTAMP DEFAULT CURRENT_TIMESTAMP
-);
+    timestamp TIMESTAMP NOT NULL DEFAULT CURRENT_TIMESTAMP,
+    PRIMARY KEY (id, timestamp)
+) PARTITION BY RANGE (timestamp);
+
+CREATE TABLE IF NOT EXISTS logs_default PARTITION OF logs DEFAULT;
+
+-- Секции на текущий и следующие месяцы (дальше их создаёт фоновое обслуживание)
+SELECT create_month_partitions('events', CURRENT_DATE, 4);
+SELECT create_month_partitions('logs', CURRENT_DATE, 4);
 
 CREATE TABLE IF NOT EXISTS home_events_summary (
     home_id INT PRIMARY KEY REFERENCES homes(id),
     events_total INT NOT NULL DEFAULT 0
 );
 
+-- Количество событий по устройству и типу за час / за сутки.
+-- Поддерживаются триггером trg_events_insert_rollups, заполняются заново
+-- командой python -m app.sql.rollups backfill
+CREATE TABLE IF NOT EXISTS events_rollup_hourly (
+    device_id INT NOT NULL,
+    event_type VARCHAR(64) NOT NULL,
+    bucket TIMESTAMP NOT NULL,
+    events_count INT NOT NULL,
+    PRIMARY KEY (device_id, bucket, event_type)
+);
+
+CREATE TABLE IF NOT EXISTS events_rollup_daily (
+    device_id INT NOT NULL,
+    event_type VARCHAR(64) NOT NULL,
+    bucket TIMESTAMP NOT NULL,
+    events_count INT NOT NULL,
+    PRIMARY KEY (device_id, bucket, event_type)
+);
+
+-- Версии данных домов для ETag списков комнат, устройств и правил;
+-- увеличиваются функциями app.sql.queries, изменяющими эти таблицы
+CREATE TABLE IF NOT EXISTS home_versions (
+    home_id INT PRIMARY KEY REFERENCES homes(id) ON DELETE CASCADE,
+    version BIGINT NOT NULL
+);
+
+-- История показаний датчиков: строки только добавляются, значение — числом
+CREATE TABLE IF NOT EXISTS sensor_readings (
+    id BIGSERIAL PRIMARY KEY,
+    sensor_id INTEGER NOT NULL REFERENCES sensors(id),
+    timestamp TIMESTAMP NOT NULL DEFAULT CURRENT_TIMESTAMP,
+    value DOUBLE PRECISION NOT NULL,
+    unit VARCHAR(16)
+);
+
+-- Последнее событие каждого устройства, поддерживается триггером trg_events_insert_last_event
+CREATE TABLE IF NOT EXISTS device_last_event (
+    device_id INT PRIMARY KEY REFERENCES devices(id) ON DELETE CASCADE,
+    event_id INT NOT NULL,
+    timestamp TIMESTAMP NOT NULL,
+    event_type VARCHAR(64) NOT NULL,
+    value VARCHAR(255)
+);
+
 CREATE INDEX IF NOT EXISTS idx_users_home_id ON users(home_id);
 
 -- Дома
@@ -83,6 +212,13 @@ CREATE INDEX IF NOT EXISTS idx_events_timestamp  ON events(timestamp);
 CREATE INDEX IF NOT EXISTS idx_events_device_time
     ON events(device_id, timestamp);
 
+-- Показания датчиков: окна по одному датчику — составной индекс;
+-- диапазоны времени по всем датчикам — BRIN (строки пишутся в порядке времени)
+CREATE INDEX IF NOT EXISTS idx_sensor_readings_sensor_time
+    ON sensor_readings(sensor_id, timestamp);
+CREATE INDEX IF NOT EXISTS idx_sensor_readings_timestamp_brin
+    ON sensor_readings USING BRIN (timestamp);
+
 -- Правила
 CREATE INDEX IF NOT EXISTS idx_rules_home_id ON rules(home_id);
 
@@ -92,18 +228,45 @@ CREATE INDEX IF NOT EXISTS idx_logs_timestamp   ON logs(timestamp);
 CREATE INDEX IF NOT EXISTS idx_logs_user_time
     ON logs(user_id, timestamp);
 
--- 1. Скалярная функция: количество событий по устройству за период
+-- 1. Скалярная функция: количество событий по устройству за период.
+-- Полные часы периода берутся из events_rollup_hourly, неполные часы на краях
+-- досчитываются по events (условие по timestamp отсекает лишние секции)
 CREATE OR REPLACE FUNCTION get_events_count_for_device(
     p_device_id INT,
     p_from TIMESTAMP,
     p_to   TIMESTAMP
 )
 RETURNS INT AS $$
-    SELECT COUNT(*)
-    FROM events
+DECLARE
+    v_full_from TIMESTAMP := date_trunc('hour', p_from);
+    v_full_to   TIMESTAMP := date_trunc('hour', p_to);
+    v_count     BIGINT;
+BEGIN
+    IF v_full_from < p_from THEN
+        v_full_from := v_full_from + INTERVAL '1 hour';
+    END IF;
+
+    IF v_full_from >= v_full_to THEN
+        SELECT COUNT(*) INTO v_count
+        FROM events
+        WHERE device_id = p_device_id
+        AND timestamp BETWEEN p_from AND p_to;
+        RETURN v_count;
+    END IF;
+
+    SELECT COALESCE(SUM(events_count), 0) INTO v_count
+    FROM events_rollup_hourly
     WHERE device_id = p_device_id
-    AND timestamp BETWEEN p_from AND p_to;
-$$ LANGUAGE sql STABLE;
+    AND bucket >= v_full_from AND bucket < v_full_to;
+
+    v_count := v_count
+        + (SELECT COUNT(*) FROM events
+           WHERE device_id = p_device_id AND timestamp >= p_from AND timestamp < v_full_from)
+        + (SELECT COUNT(*) FROM events
+           WHERE device_id = p_device_id AND timestamp >= v_full_to AND timestamp <= p_to);
+    RETURN v_count;
+END;
+$$ LANGUAGE plpgsql STABLE;
 
 
 -- 2. Табличная функция: сводка по событиям устройства
@@ -114,15 +277,21 @@ RETURNS TABLE (
     event_type TEXT,
     events_count INT
 ) AS $$
-    SELECT event_type, COUNT(*)::INT AS events_count
-    FROM events
-    WHERE device_id = p_device_id
-    GROUP BY event_type
+    SELECT r.event_type, SUM(r.events_count)::INT AS events_count
+    FROM events_rollup_daily r
+    WHERE r.device_id = p_device_id
+    GROUP BY r.event_type
     ORDER BY events_count DESC;
 $$ LANGUAGE sql STABLE;
 
--- 1. Сводка устройств по домам
-CREATE OR REPLACE VIEW view_home_devices_summary AS
+-- Время последнего обновления материализованных представлений аналитики
+CREATE TABLE IF NOT EXISTS materialized_view_refreshes (
+    view_name VARCHAR(64) PRIMARY KEY,
+    refreshed_at TIMESTAMP NOT NULL DEFAULT LOCALTIMESTAMP
+);
+
+-- 1. Сводка устройств по домам (материализованная, обновляется по расписанию)
+CREATE MATERIALIZED VIEW IF NOT EXISTS view_home_devices_summary AS
 SELECT
     h.id   AS home_id,
     h.name AS home_name,
@@ -134,8 +303,11 @@ FROM homes h
 LEFT JOIN devices d ON d.home_id = h.id
 GROUP BY h.id, h.name;
 
--- 2. Активность пользователей (кол-во действий)
-CREATE OR REPLACE VIEW view_user_activity AS
+CREATE UNIQUE INDEX IF NOT EXISTS idx_view_home_devices_summary_home
+ON view_home_devices_summary(home_id);
+
+-- 2. Активность пользователей (кол-во действий; материализованная)
+CREATE MATERIALIZED VIEW IF NOT EXISTS view_user_activity AS
 SELECT
     u.id    AS user_id,
     u.email AS user_email,
@@ -146,46 +318,142 @@ FROM users u
 LEFT JOIN logs l ON l.user_id = u.id
 GROUP BY u.id, u.email;
 
--- 3. Последние события по устройствам
+CREATE UNIQUE INDEX IF NOT EXISTS idx_view_user_activity_user
+ON view_user_activity(user_id);
+
+INSERT INTO materialized_view_refreshes (view_name)
+VALUES ('view_home_devices_summary'), ('view_user_activity')
+ON CONFLICT (view_name) DO NOTHING;
+
+-- 3. Последние события по устройствам (из таблицы device_last_event)
 CREATE OR REPLACE VIEW view_last_device_events AS
-SELECT DISTINCT ON (e.device_id)
+SELECT
     e.device_id,
     d.name      AS device_name,
     d.type      AS device_type,
     e.timestamp,
     e.event_type,
-    e.value
-FROM events e
-JOIN devices d ON d.id = e.device_id
-ORDER BY e.device_id, e.timestamp DESC;
+    e.value,
+    d.home_id
+FROM device_last_event e
+JOIN devices d ON d.id = e.device_id;
 
 CREATE OR REPLACE FUNCTION trg_update_home_events_summary()
 RETURNS TRIGGER AS $$
-DECLARE
-    v_home_id INT;
 BEGIN
-    -- находим дом, к которому относится устройство
-    SELECT home_id INTO v_home_id FROM devices WHERE id = NEW.device_id;
-
-    IF v_home_id IS NULL THEN
-        RETURN NEW;
-    END IF;
-
+    -- один раз на оператор INSERT: агрегируем вставленные строки по домам
+    -- (new_events — переходная таблица со всеми вставленными событиями);
+    -- ORDER BY задаёт единый порядок блокировок строк сводки между транзакциями
     INSERT INTO home_events_summary (home_id, events_total)
-    VALUES (v_home_id, 1)
+    SELECT d.home_id, COUNT(*)::INT
+    FROM new_events e
+    JOIN devices d ON d.id = e.device_id
+    GROUP BY d.home_id
+    ORDER BY d.home_id
     ON CONFLICT (home_id) DO UPDATE
-        SET events_total = home_events_summary.events_total + 1;
+        SET events_total = home_events_summary.events_total + EXCLUDED.events_total;
 
-    RETURN NEW;
+    RETURN NULL;
 END;
 $$ LANGUAGE plpgsql;
 
--- триггер срабатывает при вставке новой записи в events
+-- триггер срабатывает один раз на каждый оператор INSERT в events
 DROP TRIGGER IF EXISTS trg_events_insert_summary ON events;
 
 CREATE TRIGGER trg_events_insert_summary
 AFTER INSERT ON events
-FOR EACH ROW
+REFERENCING NEW TABLE AS new_events
+FOR EACH STATEMENT
 EXECUTE FUNCTION trg_update_home_events_summary();
 
+-- Инкрементальное обновление часовых и суточных агрегатов событий
+CREATE OR REPLACE FUNCTION trg_update_events_rollups()
+RETURNS TRIGGER AS $$
+BEGIN
+    INSERT INTO events_rollup_hourly (device_id, event_type, bucket, events_count)
+    SELECT device_id, event_type, date_trunc('hour', timestamp), COUNT(*)::INT
+    FROM new_events
+    GROUP BY 1, 2, 3
+    ORDER BY 1, 3, 2
+    ON CONFLICT (device_id, bucket, event_type) DO UPDATE
+        SET events_count = events_rollup_hourly.events_count + EXCLUDED.events_count;
+
+    INSERT INTO events_rollup_daily (device_id, event_type, bucket, events_count)
+    SELECT device_id, event_type, date_trunc('day', timestamp), COUNT(*)::INT
+    FROM new_events
+    GROUP BY 1, 2, 3
+    ORDER BY 1, 3, 2
+    ON CONFLICT (device_id, bucket, event_type) DO UPDATE
+        SET events_count = events_rollup_daily.events_count + EXCLUDED.events_count;
+
+    RETURN NULL;
+END;
+$$ LANGUAGE plpgsql;
+
+DROP TRIGGER IF EXISTS trg_events_insert_rollups ON events;
+
+CREATE TRIGGER trg_events_insert_rollups
+AFTER INSERT ON events
+REFERENCING NEW TABLE AS new_events
+FOR EACH STATEMENT
+EXECUTE FUNCTION trg_update_events_rollups();
+
+CREATE OR REPLACE FUNCTION trg_update_device_last_event()
+RETURNS TRIGGER AS $$
+BEGIN
+    -- самое позднее из вставленных событий устройства заменяет сохранённое,
+    -- только если оно новее (события могут приходить не по порядку)
+    INSERT INTO device_last_event (device_id, event_id, timestamp, event_type, value)
+    SELECT DISTINCT ON (device_id) device_id, id, timestamp, event_type, value
+    FROM new_events
+    ORDER BY device_id, timestamp DESC, id DESC
+    ON CONFLICT (device_id) DO UPDATE
+        SET event_id = EXCLUDED.event_id,
+            timestamp = EXCLUDED.timestamp,
+            event_type = EXCLUDED.event_type,
+            value = EXCLUDED.value
+        WHERE (device_last_event.timestamp, device_last_event.event_id)
+            < (EXCLUDED.timestamp, EXCLUDED.event_id);
+
+    RETURN NULL;
+END;
+$$ LANGUAGE plpgsql;
+
+DROP TRIGGER IF EXISTS trg_events_insert_last_event ON events;
+
+CREATE TRIGGER trg_events_insert_last_event
+AFTER INSERT ON events
+REFERENCING NEW TABLE AS new_events
+FOR EACH STATEMENT
+EXECUTE FUNCTION trg_update_device_last_event();
+
+-- Уведомление о новых событиях для подписчиков (app.realtime): по одному
+-- NOTIFY events_inserted на строку, доставляется слушателям после commit
+CREATE OR REPLACE FUNCTION trg_notify_events_inserted()
+RETURNS TRIGGER AS $$
+BEGIN
+    PERFORM pg_notify('events_inserted', json_build_object(
+        'id', e.id,
+        'device_id', e.device_id,
+        'home_id', d.home_id,
+        'timestamp', e.timestamp,
+        'event_type', e.event_type,
+        'value', e.value
+    )::TEXT)
+    FROM new_events e
+    JOIN devices d ON d.id = e.device_id
+    ORDER BY e.timestamp, e.id;
+
+    RETURN NULL;
+END;
+$$ LANGUAGE plpgsql;
+
+DROP TRIGGER IF EXISTS trg_events_insert_notify ON events;
+
+CREATE TRIGGER trg_events_insert_notify
+AFTER INSERT ON events
+REFERENCING NEW TABLE AS new_events
+FOR EACH STATEMENT
+EXECUTE FUNCTION trg_notify_events_inserted();
+
 """
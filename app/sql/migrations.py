@@ -0,0 +1,226 @@
+"""
+Миграции схемы для уже развёрнутых баз.
+
+INIT_SQL всегда описывает актуальную схему. На пустой базе он применяется целиком,
+а все миграции сразу отмечаются как выполненные. На существующей базе перед INIT_SQL
+применяются ещё не выполненные миграции: они переводят старые объекты и данные
+в вид, который ожидает INIT_SQL. Каждая миграция выполняется в транзакции init_schema
+и записывается в schema_migrations.
+"""
+from typing import List, Set, Tuple
+
+from app.sql.init_sql import PARTITIONING_SQL
+
+MIGRATIONS_TABLE_SQL = """
+CREATE TABLE IF NOT EXISTS schema_migrations (
+    version VARCHAR(255) PRIMARY KEY,
+    applied_at TIMESTAMP NOT NULL DEFAULT CURRENT_TIMESTAMP
+);
+"""
+
+# (версия, SQL) — строго в порядке применения
+MIGRATIONS: List[Tuple[str, str]] = [
+    (
+        "0001_events_summary_statement_trigger",
+        """
+        -- Построчный триггер сводки событий заменяется триггером уровня оператора
+        -- с переходной таблицей: одна агрегация и один upsert на дом за INSERT.
+        CREATE OR REPLACE FUNCTION trg_update_home_events_summary()
+        RETURNS TRIGGER AS $$
+        BEGIN
+            INSERT INTO home_events_summary (home_id, events_total)
+            SELECT d.home_id, COUNT(*)::INT
+            FROM new_events e
+            JOIN devices d ON d.id = e.device_id
+            GROUP BY d.home_id
+            ORDER BY d.home_id
+            ON CONFLICT (home_id) DO UPDATE
+                SET events_total = home_events_summary.events_total + EXCLUDED.events_total;
+
+            RETURN NULL;
+        END;
+        $$ LANGUAGE plpgsql;
+
+        DROP TRIGGER IF EXISTS trg_events_insert_summary ON events;
+
+        CREATE TRIGGER trg_events_insert_summary
+        AFTER INSERT ON events
+        REFERENCING NEW TABLE AS new_events
+        FOR EACH STATEMENT
+        EXECUTE FUNCTION trg_update_home_events_summary();
+        """,
+    ),
+    (
+        "0002_partition_events_and_logs",
+        # Обычные таблицы events и logs превращаются в секционированные по месяцам:
+        # старая таблица переименовывается, создаётся новая с секциями на весь
+        # диапазон данных, строки копируются (с прежними id), старая удаляется.
+        # Индексы, представления и триггер сводки затем создаёт INIT_SQL — уже
+        # после копирования, поэтому сводка home_events_summary не пересчитывается.
+        # На больших таблицах миграция долгая: запускать в окно обслуживания.
+        PARTITIONING_SQL + """
+        DROP VIEW IF EXISTS view_last_device_events;
+        DROP TRIGGER IF EXISTS trg_events_insert_summary ON events;
+        DROP INDEX IF EXISTS idx_events_device_id, idx_events_timestamp, idx_events_device_time;
+        ALTER TABLE events RENAME TO events_legacy;
+        ALTER TABLE events_legacy RENAME CONSTRAINT events_pkey TO events_legacy_pkey;
+        ALTER TABLE events_legacy RENAME CONSTRAINT events_device_id_fkey TO events_legacy_device_id_fkey;
+        UPDATE events_legacy SET timestamp = CURRENT_TIMESTAMP WHERE timestamp IS NULL;
+
+        CREATE TABLE events (
+            id INTEGER NOT NULL DEFAULT nextval('events_id_seq'),
+            device_id INTEGER NOT NULL REFERENCES devices(id),
+            timestamp TIMESTAMP NOT NULL DEFAULT CURRENT_TIMESTAMP,
+            event_type VARCHAR(64) NOT NULL,
+            value VARCHAR(255),
+            PRIMARY KEY (id, timestamp)
+        ) PARTITION BY RANGE (timestamp);
+        ALTER SEQUENCE events_id_seq OWNED BY events.id;
+        CREATE TABLE events_default PARTITION OF events DEFAULT;
+
+        DROP VIEW IF EXISTS view_user_activity;
+        DROP INDEX IF EXISTS idx_logs_user_id, idx_logs_timestamp, idx_logs_user_time;
+        ALTER TABLE logs RENAME TO logs_legacy;
+        ALTER TABLE logs_legacy RENAME CONSTRAINT logs_pkey TO logs_legacy_pkey;
+        ALTER TABLE logs_legacy RENAME CONSTRAINT logs_user_id_fkey TO logs_legacy_user_id_fkey;
+        UPDATE logs_legacy SET timestamp = CURRENT_TIMESTAMP WHERE timestamp IS NULL;
+
+        CREATE TABLE logs (
+            id INTEGER NOT NULL DEFAULT nextval('logs_id_seq'),
+            user_id INTEGER NOT NULL REFERENCES users(id),
+            action VARCHAR(255) NOT NULL,
+            timestamp TIMESTAMP NOT NULL DEFAULT CURRENT_TIMESTAMP,
+            PRIMARY KEY (id, timestamp)
+        ) PARTITION BY RANGE (timestamp);
+        ALTER SEQUENCE logs_id_seq OWNED BY logs.id;
+        CREATE TABLE logs_default PARTITION OF logs DEFAULT;
+
+        -- секции от месяца самой старой строки до текущего месяца + 3
+        DO $$
+        DECLARE
+            v_table TEXT;
+            v_from  DATE;
+        BEGIN
+            FOREACH v_table IN ARRAY ARRAY['events', 'logs'] LOOP
+                EXECUTE format(
+                    'SELECT date_trunc(''month'', COALESCE(MIN(timestamp), CURRENT_TIMESTAMP))::DATE FROM %I',
+                    v_table || '_legacy'
+                ) INTO v_from;
+                PERFORM create_month_partitions(
+                    v_table,
+                    v_from,
+                    ((EXTRACT(YEAR FROM CURRENT_DATE) - EXTRACT(YEAR FROM v_from)) * 12
+                     + EXTRACT(MONTH FROM CURRENT_DATE) - EXTRACT(MONTH FROM v_from))::INT + 4
+                );
+            END LOOP;
+        END;
+        $$;
+
+        INSERT INTO events (id, device_id, timestamp, event_type, value)
+        SELECT id, device_id, timestamp, event_type, value FROM events_legacy;
+        DROP TABLE events_legacy;
+
+        INSERT INTO logs (id, user_id, action, timestamp)
+        SELECT id, user_id, action, timestamp FROM logs_legacy;
+        DROP TABLE logs_legacy;
+        """,
+    ),
+    (
+        "0003_events_rollups",
+        # Часовые и суточные агрегаты событий заполняются по существующим данным;
+        # триггер, поддерживающий их дальше, создаёт INIT_SQL уже после заполнения.
+        """
+        CREATE TABLE IF NOT EXISTS events_rollup_hourly (
+            device_id INT NOT NULL,
+            event_type VARCHAR(64) NOT NULL,
+            bucket TIMESTAMP NOT NULL,
+            events_count INT NOT NULL,
+            PRIMARY KEY (device_id, bucket, event_type)
+        );
+
+        CREATE TABLE IF NOT EXISTS events_rollup_daily (
+            device_id INT NOT NULL,
+            event_type VARCHAR(64) NOT NULL,
+            bucket TIMESTAMP NOT NULL,
+            events_count INT NOT NULL,
+            PRIMARY KEY (device_id, bucket, event_type)
+        );
+
+        DROP TRIGGER IF EXISTS trg_events_insert_rollups ON events;
+        TRUNCATE events_rollup_hourly, events_rollup_daily;
+
+        INSERT INTO events_rollup_hourly (device_id, event_type, bucket, events_count)
+        SELECT device_id, event_type, date_trunc('hour', timestamp), COUNT(*)::INT
+        FROM events
+        GROUP BY 1, 2, 3;
+
+        INSERT INTO events_rollup_daily (device_id, event_type, bucket, events_count)
+        SELECT device_id, event_type, date_trunc('day', timestamp), COUNT(*)::INT
+        FROM events
+        GROUP BY 1, 2, 3;
+        """,
+    ),
+    (
+        "0004_materialized_analytics_views",
+        # Обычные представления заменяются материализованными: INIT_SQL создаёт их заново
+        """
+        DROP VIEW IF EXISTS view_home_devices_summary;
+        DROP VIEW IF EXISTS view_user_activity;
+        """,
+    ),
+    (
+        "0005_device_last_event",
+        # Последнее событие устройства заполняется по существующим данным;
+        # триггер, поддерживающий таблицу дальше, создаёт INIT_SQL
+        """
+        CREATE TABLE IF NOT EXISTS device_last_event (
+            device_id INT PRIMARY KEY REFERENCES devices(id) ON DELETE CASCADE,
+            event_id INT NOT NULL,
+            timestamp TIMESTAMP NOT NULL,
+            event_type VARCHAR(64) NOT NULL,
+            value VARCHAR(255)
+        );
+
+        DROP TRIGGER IF EXISTS trg_events_insert_last_event ON events;
+        TRUNCATE device_last_event;
+
+        INSERT INTO device_last_event (device_id, event_id, timestamp, event_type, value)
+        SELECT DISTINCT ON (device_id) device_id, id, timestamp, event_type, value
+        FROM events
+        ORDER BY device_id, timestamp DESC, id DESC;
+        """,
+    ),
+]
+
+
+def ensure_table(cur):
+    """Создать таблицу учёта миграций"""
+    cur.execute(MIGRATIONS_TABLE_SQL)
+
+
+def applied_versions(cur) -> Set[str]:
+    """Версии уже применённых миграций"""
+    cur.execute("SELECT version FROM schema_migrations")
+    return {row[0] for row in cur.fetchall()}
+
+
+def apply_pending(cur) -> List[str]:
+    """Применить невыполненные миграции по порядку, вернуть их версии"""
+    done = applied_versions(cur)
+    applied = []
+    for version, sql in MIGRATIONS:
+        if version in done:
+            continue
+        cur.execute(sql)
+        cur.execute("INSERT INTO schema_migrations (version) VALUES (%s)", (version,))
+        applied.append(version)
+    return applied
+
+
+def mark_all_applied(cur):
+    """Отметить все миграции выполненными (схема создана сразу в актуальном виде)"""
+    for version, _ in MIGRATIONS:
+        cur.execute(
+            "INSERT INTO schema_migrations (version) VALUES (%s) ON CONFLICT DO NOTHING",
+            (version,),
+        )
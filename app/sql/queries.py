@@ -1,236 +1,789 @@
-from typing import Optional, List, Dict, Any
-from app.db import db
+import asyncio
+import re
+from typing import Optional, List, Dict, Any, AsyncIterator, Iterable, Tuple
+from app.audit import audit_writer
+from app.cache import principal_cache, rule_cache
+from app.config import settings
+from app.db import Rows, adb, read_only
+from app.pagination import naive_utc
 from app.security import hash_password
-from datetime import datetime
+from datetime import datetime, timedelta
+
+
+# Изменение + запись аудита одним запросом: DML с RETURNING в CTE,
+# строка в logs вставляется, только если DML затронул строку
+LOGGED_DML = """
+    WITH affected AS (
+        {dml}
+    ), logged AS (
+        INSERT INTO logs (user_id, action, timestamp)
+        SELECT %s, %s, %s FROM affected
+    )
+    SELECT * FROM affected
+"""
+
+
+def _keyset_query(
+    table: str,
+    conditions: List[str],
+    params: tuple,
+    limit: Optional[int],
+    before: Optional[Tuple[datetime, int]],
+    after: Optional[Tuple[datetime, int]],
+    from_dt: Optional[datetime],
+    to_dt: Optional[datetime],
+    ascending: bool = False,
+) -> Tuple[str, tuple]:
+    """
+    Построить SELECT с keyset-пагинацией по (timestamp, id).
+
+    Сравнение строк (timestamp, id) < (...) использует индексы по (…, timestamp):
+    id в индекс не входит, и планировщик сужает диапазон по timestamp.
+    При after выборка идёт по возрастанию — результат нужно развернуть;
+    ascending=True — порядок от старых к новым без пагинации (для выгрузок).
+    """
+    conditions = list(conditions)
+    params = list(params)
+    if from_dt is not None:
+        conditions.append("timestamp >= %s")
+        params.append(from_dt)
+    if to_dt is not None:
+        conditions.append("timestamp < %s")
+        params.append(to_dt)
+    if before is not None:
+        conditions.append("(timestamp, id) < (%s, %s)")
+        params.extend(before)
+    if after is not None:
+        conditions.append("(timestamp, id) > (%s, %s)")
+        params.extend(after)
+
+    direction = "ASC" if after is not None or ascending else "DESC"
+    query = f"SELECT * FROM {table} WHERE {' AND '.join(conditions) or 'TRUE'} ORDER BY timestamp {direction}, id {direction}"
+    if limit is not None:
+        query += " LIMIT %s"
+        params.append(limit)
+    return query, tuple(params)
+
+
+async def _keyset_fetch_rows(table: str, conditions: List[str], params: tuple, **page) -> Rows:
+    """Выполнить запрос _keyset_query, вернуть колонки и строки-кортежи от новых к старым (для RowEncoder)"""
+    query, params = _keyset_query(table, conditions, params, **page)
+    columns, rows = await adb.fetch_rows(query, params)
+    if page.get("after") is not None:
+        rows.reverse()
+    return columns, rows
+
+
+async def _execute_logged(dml: str, params: tuple, user_id: int, action: str) -> Optional[Dict[str, Any]]:
+    """
+    Выполнить DML ... RETURNING * и записать аудит, вернуть затронутую строку.
+
+    В синхронном режиме аудит пишется тем же запросом (один round trip),
+    в буферизованном — передаётся фоновому писателю после commit.
+    """
+    if settings.AUDIT_LOG_MODE == "sync":
+        query = LOGGED_DML.format(dml=dml)
+        return await adb.execute_insert(query, (*params, user_id, action, datetime.utcnow()))
+    row = await adb.execute_insert(dml, params)
+    if row:
+        await create_log(user_id, action)
+    return row
 
 
 # ==================== USERS ====================
 
 
-def get_user_by_email(email: str) -> Optional[Dict[str, Any]]:
+def _invalidate_principal(user_id: int):
+    """Сбросить пользователя в кэше сразу и ещё раз после commit, чтобы не закэшировать старую версию"""
+    principal_cache.invalidate(user_id)
+    adb.after_commit(lambda: principal_cache.invalidate(user_id))
+
+
+async def get_user_by_email(email: str) -> Optional[Dict[str, Any]]:
     """Получить пользователя по email"""
-    query = "SELECT * FROM users WHERE email = %s"
-    return db.execute_single(query, (email,))
+    query = adb.statement("get_user_by_email", "SELECT * FROM users WHERE email = %s")
+    return await adb.execute_single(query, (email,))
 
 
-def get_user_by_id(user_id: int) -> Optional[Dict[str, Any]]:
+async def get_user_by_id(user_id: int) -> Optional[Dict[str, Any]]:
     """Получить пользователя по ID"""
-    query = "SELECT * FROM users WHERE id = %s"
-    return db.execute_single(query, (user_id,))
+    query = adb.statement("get_user_by_id", "SELECT * FROM users WHERE id = %s")
+    return await adb.execute_single(query, (user_id,))
+
 
+async def get_principal_by_id(user_id: int) -> Optional[Dict[str, Any]]:
+    """Получить пользователя для аутентификации (без password_hash)"""
+    query = adb.statement("get_principal_by_id", "SELECT id, email, role, home_id FROM users WHERE id = %s")
+    return await adb.execute_single(query, (user_id,))
 
-def create_user(email: str, password: str, role: str = "user", home_id: Optional[int] = None) -> Dict[str, Any]:
+
+async def create_user(email: str, password: str, role: str = "user", home_id: Optional[int] = None) -> Dict[str, Any]:
     """Создать пользователя"""
-    password_hash = hash_password(password)
+    # bcrypt — CPU-bound операция, выносим её из event loop
+    password_hash = await asyncio.to_thread(hash_password, password)
     query = """
         INSERT INTO users (email, password_hash, role, home_id)
         VALUES (%s, %s, %s, %s)
         RETURNING *
     """
-    return db.execute_insert(query, (email, password_hash, role, home_id))
+    user = await adb.execute_insert(query, (email, password_hash, role, home_id))
+    _invalidate_principal(user["id"])
+    return user
+
+
+async def update_user_role(user_id: int, role: str) -> Optional[Dict[str, Any]]:
+    """Изменить роль пользователя; None — пользователя нет"""
+    query = "UPDATE users SET role = %s WHERE id = %s RETURNING id, email, role, home_id"
+    user = await adb.execute_insert(query, (role, user_id))
+    _invalidate_principal(user_id)
+    return user
 
 
-def get_all_users() -> List[Dict[str, Any]]:
+@read_only
+async def get_all_users() -> List[Dict[str, Any]]:
     """Получить всех пользователей"""
     query = "SELECT id, email, role, home_id FROM users"
-    return db.execute_query(query)
+    return await adb.execute_query(query)
 
 
 # ==================== HOMES ====================
 
 
-def create_home(name: str, address: Optional[str] = None) -> Dict[str, Any]:
+async def create_home(name: str, address: Optional[str] = None) -> Dict[str, Any]:
     """Создать дом"""
     query = """
         INSERT INTO homes (name, address)
         VALUES (%s, %s)
         RETURNING *
     """
-    return db.execute_insert(query, (name, address))
+    return await adb.execute_insert(query, (name, address))
 
 
-def get_home_by_id(home_id: int) -> Optional[Dict[str, Any]]:
+@read_only
+async def get_home_by_id(home_id: int) -> Optional[Dict[str, Any]]:
     """Получить дом по ID"""
-    query = "SELECT * FROM homes WHERE id = %s"
-    return db.execute_single(query, (home_id,))
+    query = adb.statement("get_home_by_id", "SELECT * FROM homes WHERE id = %s")
+    return await adb.execute_single(query, (home_id,))
+
+
+@read_only
+async def get_home_snapshot(home_id: int) -> Optional[str]:
+    """
+    Дом целиком одним запросом: комнаты, устройства с датчиками и последним
+    событием, правила. JSON собирается в PostgreSQL и возвращается текстом
+    (без разбора в Python); None — дома нет.
+    """
+    query = """
+        SELECT json_build_object(
+            'id', h.id,
+            'name', h.name,
+            'address', h.address,
+            'rooms', COALESCE((
+                SELECT json_agg(json_build_object('id', r.id, 'name', r.name) ORDER BY r.id)
+                FROM rooms r
+                WHERE r.home_id = h.id
+            ), '[]'),
+            'devices', COALESCE((
+                SELECT json_agg(json_build_object(
+                    'id', d.id,
+                    'type', d.type,
+                    'name', d.name,
+                    'status', d.status,
+                    'sensors', COALESCE((
+                        SELECT json_agg(json_build_object('id', s.id, 'type', s.type, 'value', s.value) ORDER BY s.id)
+                        FROM sensors s
+                        WHERE s.device_id = d.id
+                    ), '[]'),
+                    'last_event', (
+                        SELECT json_build_object(
+                            'id', e.event_id,
+                            'timestamp', e.timestamp,
+                            'event_type', e.event_type,
+                            'value', e.value
+                        )
+                        FROM device_last_event e
+                        WHERE e.device_id = d.id
+                    )
+                ) ORDER BY d.id)
+                FROM devices d
+                WHERE d.home_id = h.id
+            ), '[]'),
+            'rules', COALESCE((
+                SELECT json_agg(json_build_object('id', ru.id, 'condition', ru.condition, 'action', ru.action) ORDER BY ru.id)
+                FROM rules ru
+                WHERE ru.home_id = h.id
+            ), '[]')
+        )::TEXT AS snapshot
+        FROM homes h
+        WHERE h.id = %s
+    """
+    row = await adb.execute_single(query, (home_id,))
+    return row["snapshot"] if row else None
 
 
-def get_all_homes() -> List[Dict[str, Any]]:
+@read_only
+async def get_all_homes() -> List[Dict[str, Any]]:
     """Получить все дома"""
     query = "SELECT * FROM homes"
-    return db.execute_query(query)
+    return await adb.execute_query(query)
 
 
-# ==================== ROOMS ====================
+@read_only
+async def get_home_version(home_id: int) -> int:
+    """Версия данных дома (комнаты, устройства, правила); 0 — дом ещё не менялся"""
+    query = adb.statement("get_home_version", "SELECT version FROM home_versions WHERE home_id = %s")
+    row = await adb.execute_single(query, (home_id,))
+    return row["version"] if row else 0
 
 
-def create_room(home_id: int, name: str) -> Dict[str, Any]:
-    """Создать комнату"""
+async def _bump_home_versions(home_ids: Iterable[int]):
+    """
+    Увеличить версии домов после изменения их комнат, устройств или правил.
+    Вызывается в той же транзакции, что и изменение; строки блокируются в порядке id.
+    """
     query = """
-        INSERT INTO rooms (home_id, name)
-        VALUES (%s, %s)
-        RETURNING *
+        INSERT INTO home_versions (home_id, version)
+        SELECT home_id, 1 FROM unnest(%s::int[]) AS home_id
+        ON CONFLICT (home_id) DO UPDATE SET version = home_versions.version + 1
     """
-    return db.execute_insert(query, (home_id, name))
+    await adb.execute_update(query, (sorted(set(home_ids)),))
 
 
-def get_rooms_by_home(home_id: int) -> List[Dict[str, Any]]:
-    """Получить все комнаты дома"""
-    query = "SELECT * FROM rooms WHERE home_id = %s"
-    return db.execute_query(query, (home_id,))
+# ==================== ROOMS ====================
 
 
-def get_room_by_id(room_id: int) -> Optional[Dict[str, Any]]:
-    """Получить комнату по ID"""
-    query = "SELECT * FROM rooms WHERE id = %s"
-    return db.execute_single(query, (room_id,))
+async def create_room_with_log(home_id: int, name: str, user_id: int) -> Dict[str, Any]:
+    """Создать комнату и записать аудит одним запросом"""
+    dml = "INSERT INTO rooms (home_id, name) VALUES (%s, %s) RETURNING *"
+    room = await _execute_logged(dml, (home_id, name), user_id, f"Created room: {name}")
+    await _bump_home_versions([home_id])
+    return room
 
 
-# ==================== DEVICES ====================
+@read_only
+async def get_rooms_by_home(home_id: int) -> List[Dict[str, Any]]:
+    """Получить все комнаты дома"""
+    query = adb.statement("get_rooms_by_home", "SELECT * FROM rooms WHERE home_id = %s")
+    return await adb.execute_query(query, (home_id,))
 
 
-def create_device(home_id: int, type_: str, name: str, status: str) -> Dict[str, Any]:
-    """Создать устройство"""
-    query = """
-        INSERT INTO devices (home_id, type, name, status)
-        VALUES (%s, %s, %s, %s)
-        RETURNING *
-    """
-    return db.execute_insert(query, (home_id, type_, name, status))
+@read_only
+async def get_room_by_id(room_id: int) -> Optional[Dict[str, Any]]:
+    """Получить комнату по ID"""
+    query = adb.statement("get_room_by_id", "SELECT * FROM rooms WHERE id = %s")
+    return await adb.execute_single(query, (room_id,))
 
 
-def get_device_by_id(device_id: int) -> Optional[Dict[str, Any]]:
-    """Получить устройство по ID"""
-    query = "SELECT * FROM devices WHERE id = %s"
-    return db.execute_single(query, (device_id,))
+# ==================== DEVICES ====================
 
 
-def get_devices_by_home(home_id: int) -> List[Dict[str, Any]]:
-    """Получить все устройства дома"""
-    query = "SELECT * FROM devices WHERE home_id = %s"
-    return db.execute_query(query, (home_id,))
+async def create_device_with_log(home_id: int, type_: str, name: str, status: str, user_id: int) -> Dict[str, Any]:
+    """Создать устройство и записать аудит одним запросом"""
+    dml = "INSERT INTO devices (home_id, type, name, status) VALUES (%s, %s, %s, %s) RETURNING *"
+    device = await _execute_logged(dml, (home_id, type_, name, status), user_id, f"Created device: {name}")
+    await _bump_home_versions([home_id])
+    return device
 
 
-def update_device_status(device_id: int, status: str) -> int:
-    """Обновить статус устройства"""
-    query = "UPDATE devices SET status = %s WHERE id = %s"
-    return db.execute_update(query, (status, device_id))
+@read_only
+async def get_device_by_id(device_id: int) -> Optional[Dict[str, Any]]:
+    """Получить устройство по ID"""
+    query = adb.statement("get_device_by_id", "SELECT * FROM devices WHERE id = %s")
+    return await adb.execute_single(query, (device_id,))
+
+
+@read_only
+async def get_devices_by_home_rows(home_id: int) -> Rows:
+    """Устройства дома колонками и кортежами (для RowEncoder)"""
+    query = adb.statement("get_devices_by_home_rows", "SELECT * FROM devices WHERE home_id = %s")
+    return await adb.fetch_rows(query, (home_id,))
+
+
+@read_only
+async def get_device_homes(device_ids: List[int]) -> Dict[int, int]:
+    """Дома устройств: {device_id: home_id}"""
+    query = adb.statement("get_device_homes", "SELECT id, home_id FROM devices WHERE id = ANY(%s)")
+    rows = await adb.execute_query(query, (list(device_ids),))
+    return {row["id"]: row["home_id"] for row in rows}
+
+
+async def update_device_status_with_log(device_id: int, status: str, user_id: int) -> Optional[Dict[str, Any]]:
+    """Обновить статус устройства и записать аудит одним запросом; None — устройства нет"""
+    dml = "UPDATE devices SET status = %s WHERE id = %s RETURNING *"
+    device = await _execute_logged(
+        dml, (status, device_id), user_id, f"Updated device {device_id} status to {status}"
+    )
+    if device:
+        await _bump_home_versions([device["home_id"]])
+    return device
+
+
+async def update_devices_status_with_log(
+    status: str,
+    user_id: int,
+    device_ids: Optional[List[int]] = None,
+    home_id: Optional[int] = None,
+    type_: Optional[str] = None,
+) -> List[Dict[str, Any]]:
+    """
+    Массово изменить статус устройств (по списку id или по дому) одним запросом
+    с одной записью аудита на весь набор. Строки блокируются в порядке id, чтобы
+    пересекающиеся массовые изменения не взаимоблокировались.
+    Возвращает изменённые устройства по возрастанию id.
+    """
+    conditions, params = [], []
+    if device_ids is not None:
+        conditions.append("id = ANY(%s::int[])")
+        params.append(list(device_ids))
+    if home_id is not None:
+        conditions.append("home_id = %s")
+        params.append(home_id)
+    if type_ is not None:
+        conditions.append("type = %s")
+        params.append(type_)
+    target = f"SELECT id FROM devices WHERE {' AND '.join(conditions)} ORDER BY id FOR UPDATE"
+    update = f"""
+        WITH target AS ({target})
+        UPDATE devices d SET status = %s
+        FROM target
+        WHERE d.id = target.id
+        RETURNING d.*
+    """
+    params.append(status)
+    now = datetime.utcnow()
+
+    if settings.AUDIT_LOG_MODE == "sync":
+        query = f"""
+            WITH affected AS ({update}), logged AS (
+                INSERT INTO logs (user_id, action, timestamp)
+                SELECT %s, format('Updated %%s devices status to %%s', COUNT(*), %s::TEXT), %s
+                FROM affected
+                HAVING COUNT(*) > 0
+            )
+            SELECT * FROM affected ORDER BY id
+        """
+        rows = await adb.execute_query(query, (*params, user_id, status, now))
+    else:
+        rows = await adb.execute_query(f"WITH affected AS ({update}) SELECT * FROM affected ORDER BY id", tuple(params))
+        if rows:
+            await create_log(user_id, f"Updated {len(rows)} devices status to {status}", now)
+    if rows:
+        await _bump_home_versions(row["home_id"] for row in rows)
+    return rows
 
 
 # ==================== SENSORS ====================
 
 
-def create_sensor(device_id: int, type_: str, value: Optional[str] = None) -> Dict[str, Any]:
-    """Создать датчик"""
-    query = """
-        INSERT INTO sensors (device_id, type, value)
-        VALUES (%s, %s, %s)
-        RETURNING *
-    """
-    return db.execute_insert(query, (device_id, type_, value))
+async def create_sensor_with_log(device_id: int, type_: str, value: Optional[str], user_id: int) -> Dict[str, Any]:
+    """Создать датчик и записать аудит одним запросом; числовое начальное значение попадает в историю"""
+    dml = "INSERT INTO sensors (device_id, type, value) VALUES (%s, %s, %s) RETURNING *"
+    sensor = await _execute_logged(dml, (device_id, type_, value), user_id, f"Created sensor: {type_}")
+    reading = parse_sensor_reading(value)
+    if sensor and reading:
+        await append_sensor_reading(sensor["id"], *reading)
+    return sensor
 
 
-def get_sensor_by_id(sensor_id: int) -> Optional[Dict[str, Any]]:
+@read_only
+async def get_sensor_by_id(sensor_id: int) -> Optional[Dict[str, Any]]:
     """Получить датчик по ID"""
-    query = "SELECT * FROM sensors WHERE id = %s"
-    return db.execute_single(query, (sensor_id,))
+    query = adb.statement("get_sensor_by_id", "SELECT * FROM sensors WHERE id = %s")
+    return await adb.execute_single(query, (sensor_id,))
 
 
-def get_sensors_by_device(device_id: int) -> List[Dict[str, Any]]:
+@read_only
+async def get_sensors_by_device(device_id: int) -> List[Dict[str, Any]]:
     """Получить все датчики устройства"""
-    query = "SELECT * FROM sensors WHERE device_id = %s"
-    return db.execute_query(query, (device_id,))
+    query = adb.statement("get_sensors_by_device", "SELECT * FROM sensors WHERE device_id = %s")
+    return await adb.execute_query(query, (device_id,))
 
 
-def update_sensor_value(sensor_id: int, value: str) -> int:
-    """Обновить значение датчика"""
-    query = "UPDATE sensors SET value = %s WHERE id = %s"
-    return db.execute_update(query, (value, sensor_id))
+async def update_sensor_value_with_log(
+    sensor_id: int, value: str, user_id: int, unit: Optional[str] = None
+) -> Optional[Dict[str, Any]]:
+    """
+    Обновить текущее значение датчика и записать аудит одним запросом; None — датчика нет.
+    Числовое значение (см. parse_sensor_reading) добавляется в историю sensor_readings.
+    """
+    dml = "UPDATE sensors SET value = %s WHERE id = %s RETURNING *"
+    sensor = await _execute_logged(
+        dml, (value, sensor_id), user_id, f"Updated sensor {sensor_id} value to {value}"
+    )
+    reading = parse_sensor_reading(value, unit)
+    if sensor and reading:
+        await append_sensor_reading(sensor_id, *reading)
+    return sensor
+
+
+# ==================== SENSOR READINGS ====================
+
+# Состояния двоичных датчиков (движение, дверь) в истории хранятся как 1/0
+SENSOR_STATE_VALUES = {
+    "detected": 1.0, "open": 1.0, "on": 1.0, "true": 1.0,
+    "clear": 0.0, "closed": 0.0, "off": 0.0, "false": 0.0,
+}
+
+SENSOR_READING_RE = re.compile(r"^\s*([-+]?\d+(?:[.,]\d+)?)\s*(\S.{0,15})?\s*$")
+
+
+def parse_sensor_reading(value: Optional[str], unit: Optional[str] = None) -> Optional[Tuple[float, Optional[str]]]:
+    """Число и единица измерения из значения датчика ('22°C', '55 %', 'open'); None — значение не числовое"""
+    if value is None:
+        return None
+    state = SENSOR_STATE_VALUES.get(value.strip().lower())
+    if state is not None:
+        return state, unit
+    match = SENSOR_READING_RE.match(value)
+    if not match:
+        return None
+    number, parsed_unit = match.groups()
+    return float(number.replace(",", ".")), unit or (parsed_unit.strip() if parsed_unit else None)
+
+
+async def append_sensor_reading(
+    sensor_id: int, value: float, unit: Optional[str], timestamp: Optional[datetime] = None
+) -> Dict[str, Any]:
+    """Добавить показание в историю датчика"""
+    query = """
+        INSERT INTO sensor_readings (sensor_id, value, unit, timestamp)
+        VALUES (%s, %s, %s, %s)
+        RETURNING *
+    """
+    return await adb.execute_insert(query, (sensor_id, value, unit, timestamp or datetime.utcnow()))
+
+
+@read_only
+async def get_sensor_readings_rows(
+    sensor_id: int,
+    limit: Optional[int] = None,
+    before: Optional[Tuple[datetime, int]] = None,
+    after: Optional[Tuple[datetime, int]] = None,
+    from_dt: Optional[datetime] = None,
+    to_dt: Optional[datetime] = None,
+) -> Rows:
+    """Показания датчика колонками и кортежами (для RowEncoder)"""
+    return await _keyset_fetch_rows(
+        "sensor_readings", ["sensor_id = %s"], (sensor_id,),
+        limit=limit, before=before, after=after, from_dt=from_dt, to_dt=to_dt,
+    )
+
+
+@read_only
+async def aggregate_sensor_readings(
+    sensor_id: int,
+    bucket: timedelta,
+    from_dt: datetime,
+    to_dt: datetime,
+    percentiles: List[float],
+) -> List[Dict[str, Any]]:
+    """
+    Агрегаты показаний датчика по интервалам длины bucket за [from_dt, to_dt):
+    количество, min, max, среднее и перцентили (percentile_cont) — всё считается в SQL.
+    Интервалы выровнены от полуночи 2000-01-01, показания с разными единицами не смешиваются.
+    """
+    query = """
+        SELECT date_bin(%s, timestamp, TIMESTAMP '2000-01-01') AS bucket,
+               unit,
+               COUNT(*)::INT AS count,
+               MIN(value) AS min,
+               MAX(value) AS max,
+               AVG(value) AS avg,
+               percentile_cont(%s::FLOAT8[]) WITHIN GROUP (ORDER BY value) AS percentiles
+        FROM sensor_readings
+        WHERE sensor_id = %s AND timestamp >= %s AND timestamp < %s
+        GROUP BY 1, 2
+        ORDER BY 1, 2
+    """
+    return await adb.execute_query(query, (bucket, percentiles, sensor_id, from_dt, to_dt))
 
 
 # ==================== EVENTS ====================
 
 
-def create_event(device_id: int, event_type: str, value: Optional[str] = None) -> Dict[str, Any]:
-    """Создать событие"""
-    query = """
+async def create_event_with_log(device_id: int, event_type: str, value: Optional[str], user_id: int) -> Dict[str, Any]:
+    """Создать событие и записать аудит одним запросом"""
+    dml = """
         INSERT INTO events (device_id, event_type, value, timestamp)
         VALUES (%s, %s, %s, %s)
         RETURNING *
     """
-    return db.execute_insert(query, (device_id, event_type, value, datetime.utcnow()))
+    return await _execute_logged(
+        dml, (device_id, event_type, value, datetime.utcnow()), user_id, f"Event triggered: {event_type}"
+    )
+
 
+async def create_events_batch(user_id: int, events: List[Dict[str, Any]]) -> List[Optional[Dict[str, Any]]]:
+    """
+    Пакетно создать события в одной транзакции.
 
-def get_event_by_id(event_id: int) -> Optional[Dict[str, Any]]:
+    Все строки вставляются одним INSERT ... SELECT FROM unnest(...), на весь пакет
+    пишется одна запись аудита. Возвращает список той же длины, что и events:
+    вставленная строка или None, если устройство не существует.
+    """
+    now = datetime.utcnow()
+    device_ids = sorted({e["device_id"] for e in events})
+    async with adb.transaction() as conn:
+        cur = await conn.execute("SELECT id FROM devices WHERE id = ANY(%s)", (device_ids,))
+        known = {row["id"] for row in await cur.fetchall()}
+        rows = [e for e in events if e["device_id"] in known]
+
+        inserted = []
+        if rows:
+            query = """
+                INSERT INTO events (device_id, event_type, value, timestamp)
+                SELECT * FROM unnest(%s::int[], %s::varchar[], %s::varchar[], %s::timestamp[])
+                RETURNING *
+            """
+            cur = await conn.execute(query, (
+                [e["device_id"] for e in rows],
+                [e["event_type"] for e in rows],
+                [e.get("value") for e in rows],
+                # время с часовым поясом — в naive UTC: иначе сдвиг отбрасывается при приведении к timestamp
+                [naive_utc(e.get("timestamp")) or now for e in rows],
+            ))
+            # id выдаются из последовательности в порядке строк unnest
+            inserted = sorted(await cur.fetchall(), key=lambda r: r["id"])
+
+    await create_log(user_id, f"Events batch ingested: {len(inserted)} of {len(events)} events", now)
+
+    it = iter(inserted)
+    return [next(it) if e["device_id"] in known else None for e in events]
+
+
+def stream_events(
+    home_id: Optional[int] = None,
+    device_id: Optional[int] = None,
+    from_dt: Optional[datetime] = None,
+    to_dt: Optional[datetime] = None,
+    chunk_size: int = 1000,
+) -> AsyncIterator[List[Dict[str, Any]]]:
+    """Выгрузка событий дома/устройства за период порциями (от старых к новым)"""
+    conditions, params = [], []
+    if home_id is not None:
+        conditions.append("device_id IN (SELECT id FROM devices WHERE home_id = %s)")
+        params.append(home_id)
+    if device_id is not None:
+        conditions.append("device_id = %s")
+        params.append(device_id)
+    query, params = _keyset_query(
+        "events", conditions, tuple(params), None, None, None, from_dt, to_dt, ascending=True
+    )
+    return adb.stream_query(query, params, chunk_size, read_only=True)
+
+
+@read_only
+async def get_event_by_id(event_id: int) -> Optional[Dict[str, Any]]:
     """Получить событие по ID"""
-    query = "SELECT * FROM events WHERE id = %s"
-    return db.execute_single(query, (event_id,))
+    query = adb.statement("get_event_by_id", "SELECT * FROM events WHERE id = %s")
+    return await adb.execute_single(query, (event_id,))
 
 
-def get_events_by_device(device_id: int) -> List[Dict[str, Any]]:
-    """Получить события устройства"""
-    query = "SELECT * FROM events WHERE device_id = %s ORDER BY timestamp DESC"
-    return db.execute_query(query, (device_id,))
+@read_only
+async def get_events_by_device_rows(
+    device_id: int,
+    limit: Optional[int] = None,
+    before: Optional[Tuple[datetime, int]] = None,
+    after: Optional[Tuple[datetime, int]] = None,
+    from_dt: Optional[datetime] = None,
+    to_dt: Optional[datetime] = None,
+) -> Rows:
+    """События устройства колонками и кортежами (для RowEncoder)"""
+    return await _keyset_fetch_rows(
+        "events", ["device_id = %s"], (device_id,),
+        limit=limit, before=before, after=after, from_dt=from_dt, to_dt=to_dt,
+    )
 
 
 # ==================== RULES ====================
 
 
-def create_rule(home_id: int, condition: str, action: str) -> Dict[str, Any]:
-    """Создать правило автоматики"""
-    query = """
-        INSERT INTO rules (home_id, condition, action)
-        VALUES (%s, %s, %s)
-        RETURNING *
-    """
-    return db.execute_insert(query, (home_id, condition, action))
+def _invalidate_rules(home_id: int):
+    """Сбросить скомпилированные правила дома сразу и ещё раз после commit"""
+    rule_cache.invalidate(home_id)
+    adb.after_commit(lambda: rule_cache.invalidate(home_id))
 
 
-def get_rule_by_id(rule_id: int) -> Optional[Dict[str, Any]]:
+async def create_rule_with_log(home_id: int, condition: str, action: str, user_id: int) -> Dict[str, Any]:
+    """Создать правило и записать аудит одним запросом"""
+    dml = "INSERT INTO rules (home_id, condition, action) VALUES (%s, %s, %s) RETURNING *"
+    rule = await _execute_logged(dml, (home_id, condition, action), user_id, f"Created rule in home {home_id}")
+    _invalidate_rules(home_id)
+    await _bump_home_versions([home_id])
+    return rule
+
+
+@read_only
+async def get_rule_by_id(rule_id: int) -> Optional[Dict[str, Any]]:
     """Получить правило по ID"""
-    query = "SELECT * FROM rules WHERE id = %s"
-    return db.execute_single(query, (rule_id,))
+    query = adb.statement("get_rule_by_id", "SELECT * FROM rules WHERE id = %s")
+    return await adb.execute_single(query, (rule_id,))
 
 
-def get_rules_by_home(home_id: int) -> List[Dict[str, Any]]:
+@read_only
+async def get_rules_by_home(home_id: int) -> List[Dict[str, Any]]:
     """Получить правила дома"""
-    query = "SELECT * FROM rules WHERE home_id = %s"
-    return db.execute_query(query, (home_id,))
+    query = adb.statement("get_rules_by_home", "SELECT * FROM rules WHERE home_id = %s")
+    return await adb.execute_query(query, (home_id,))
 
 
-def delete_rule(rule_id: int) -> int:
-    """Удалить правило"""
-    query = "DELETE FROM rules WHERE id = %s"
-    return db.execute_update(query, (rule_id,))
+async def delete_rule_with_log(rule_id: int, user_id: int) -> Optional[Dict[str, Any]]:
+    """Удалить правило и записать аудит одним запросом, вернуть удалённую строку; None — правила нет"""
+    dml = "DELETE FROM rules WHERE id = %s RETURNING *"
+    rule = await _execute_logged(dml, (rule_id,), user_id, f"Deleted rule {rule_id}")
+    if rule:
+        _invalidate_rules(rule["home_id"])
+        await _bump_home_versions([rule["home_id"]])
+    return rule
 
 
 # ==================== LOGS ====================
 
 
-def create_log(user_id: int, action: str) -> Dict[str, Any]:
-    """Создать запись аудита"""
-    query = """
-        INSERT INTO logs (user_id, action, timestamp)
-        VALUES (%s, %s, %s)
-        RETURNING *
+# logs.action — VARCHAR(255)
+LOG_ACTION_MAX_LENGTH = 255
+
+
+def fit_log_action(action: str) -> str:
+    """Обрезать текст записи аудита до длины колонки logs.action (с многоточием)"""
+    if len(action) <= LOG_ACTION_MAX_LENGTH:
+        return action
+    return action[:LOG_ACTION_MAX_LENGTH - 1] + "…"
+
+
+async def create_log(user_id: int, action: str, timestamp: Optional[datetime] = None) -> Optional[Dict[str, Any]]:
+    """
+    Создать запись аудита.
+
+    В режиме AUDIT_LOG_MODE=sync — INSERT в текущей транзакции, возвращает запись.
+    В режиме buffered запись уходит фоновому писателю после commit (при откате
+    не пишется) и функция возвращает None.
+    """
+    timestamp = timestamp or datetime.utcnow()
+    if settings.AUDIT_LOG_MODE == "sync":
+        query = """
+            INSERT INTO logs (user_id, action, timestamp)
+            VALUES (%s, %s, %s)
+            RETURNING *
+        """
+        return await adb.execute_insert(query, (user_id, action, timestamp))
+    await adb.after_commit_async(lambda: audit_writer.write(user_id, action, timestamp))
+    return None
+
+
+async def create_logs(records: List[Tuple[int, str, datetime]]) -> int:
     """
-    return db.execute_insert(query, (user_id, action, datetime.utcnow()))
+    Создать несколько записей аудита (user_id, action, timestamp), как create_log:
+    в режиме sync — одним INSERT в текущей транзакции, в buffered — после commit.
+    """
+    if not records:
+        return 0
+    if settings.AUDIT_LOG_MODE == "sync":
+        return await insert_logs_batch(records)
 
+    async def write_all():
+        for record in records:
+            await audit_writer.write(*record)
 
-def get_logs() -> List[Dict[str, Any]]:
-    """Получить все логи"""
-    query = "SELECT * FROM logs ORDER BY timestamp DESC"
-    return db.execute_query(query)
+    await adb.after_commit_async(write_all)
+    return len(records)
 
 
-def get_logs_by_user(user_id: int) -> List[Dict[str, Any]]:
-    """Получить логи пользователя"""
-    query = "SELECT * FROM logs WHERE user_id = %s ORDER BY timestamp DESC"
-    return db.execute_query(query, (user_id,))
+async def insert_logs_batch(records: List[Tuple[int, str, datetime]]) -> int:
+    """Записать пакет записей аудита (user_id, action, timestamp) одним INSERT"""
+    query = """
+        INSERT INTO logs (user_id, action, timestamp)
+        SELECT * FROM unnest(%s::int[], %s::varchar[], %s::timestamp[])
+    """
+    return await adb.execute_update(query, (
+        [r[0] for r in records],
+        [r[1] for r in records],
+        [r[2] for r in records],
+    ))
+
+
+@read_only
+async def get_logs_rows(
+    limit: Optional[int] = None,
+    before: Optional[Tuple[datetime, int]] = None,
+    after: Optional[Tuple[datetime, int]] = None,
+    from_dt: Optional[datetime] = None,
+    to_dt: Optional[datetime] = None,
+) -> Rows:
+    """Логи колонками и кортежами (для RowEncoder)"""
+    return await _keyset_fetch_rows(
+        "logs", [], (),
+        limit=limit, before=before, after=after, from_dt=from_dt, to_dt=to_dt,
+    )
+
+
+@read_only
+async def get_logs_by_user_rows(
+    user_id: int,
+    limit: Optional[int] = None,
+    before: Optional[Tuple[datetime, int]] = None,
+    after: Optional[Tuple[datetime, int]] = None,
+    from_dt: Optional[datetime] = None,
+    to_dt: Optional[datetime] = None,
+) -> Rows:
+    """Логи пользователя колонками и кортежами (для RowEncoder)"""
+    return await _keyset_fetch_rows(
+        "logs", ["user_id = %s"], (user_id,),
+        limit=limit, before=before, after=after, from_dt=from_dt, to_dt=to_dt,
+    )
+
+
+def stream_logs(
+    user_id: Optional[int] = None,
+    from_dt: Optional[datetime] = None,
+    to_dt: Optional[datetime] = None,
+    chunk_size: int = 1000,
+) -> AsyncIterator[List[Dict[str, Any]]]:
+    """Выгрузка логов (всех или пользователя) за период порциями (от старых к новым)"""
+    conditions, params = [], []
+    if user_id is not None:
+        conditions.append("user_id = %s")
+        params.append(user_id)
+    query, params = _keyset_query(
+        "logs", conditions, tuple(params), None, None, None, from_dt, to_dt, ascending=True
+    )
+    return adb.stream_query(query, params, chunk_size, read_only=True)
+
+# ==================== PARTITIONS ====================
+
+# Ключ advisory-блокировки: обслуживание секций выполняет один воркер за раз
+PARTITION_MAINTENANCE_LOCK_ID = 7_451_010
+
+
+async def maintain_partitions(premake_months: int, retention_months: Dict[str, int]) -> Dict[str, Any]:
+    """
+    Создать секции events/logs на текущий и premake_months следующих месяцев и
+    удалить секции старше retention_months[table] полных месяцев (0 — не удалять).
+    """
+    result = {}
+    async with adb.transaction() as conn:
+        cur = await conn.execute("SELECT pg_try_advisory_xact_lock(%s) AS locked", (PARTITION_MAINTENANCE_LOCK_ID,))
+        if not (await cur.fetchone())["locked"]:
+            return result
+        for table in ("events", "logs"):
+            cur = await conn.execute(
+                "SELECT create_month_partitions(%s, CURRENT_DATE, %s) AS created", (table, premake_months + 1)
+            )
+            created = (await cur.fetchone())["created"]
+            dropped = []
+            if retention_months.get(table, 0) > 0:
+                cur = await conn.execute(
+                    "SELECT drop_old_partitions(%s, %s) AS name", (table, retention_months[table])
+                )
+                dropped = [row["name"] for row in await cur.fetchall()]
+            result[table] = {"created": created, "dropped": dropped}
+    return result
+
 
 # ==================== ANALYTICS: FUNCTIONS & VIEWS ====================
 
-def get_events_count_for_device_period(
+@read_only
+async def get_events_count_for_device_period(
     device_id: int,
     from_dt: datetime,
     to_dt: datetime,
@@ -240,41 +793,117 @@ def get_events_count_for_device_period(
     Возвращает количество событий устройства за период.
     """
     query = "SELECT get_events_count_for_device(%s, %s, %s) AS cnt"
-    row = db.execute_single(query, (device_id, from_dt, to_dt))
+    row = await adb.execute_single(query, (device_id, from_dt, to_dt))
     return int(row["cnt"]) if row and row.get("cnt") is not None else 0
 
 
-def get_device_events_stats_fn(device_id: int) -> List[Dict[str, Any]]:
+@read_only
+async def get_device_events_stats_fn(device_id: int) -> List[Dict[str, Any]]:
     """
     Табличная функция: обёртка над get_device_events_stats()
     Возвращает сводку по типам событий устройства.
     """
     query = "SELECT * FROM get_device_events_stats(%s)"
-    return db.execute_query(query, (device_id,))
+    return await adb.execute_query(query, (device_id,))
+
+
+ANALYTICS_VIEWS = ("view_home_devices_summary", "view_user_activity")
 
 
-def get_home_devices_summary() -> List[Dict[str, Any]]:
+@read_only
+async def get_materialized_view_state(view_name: str) -> Optional[Dict[str, Any]]:
+    """Время последнего обновления материализованного представления и давность данных (сек)"""
+    query = """
+        SELECT view_name, refreshed_at,
+               EXTRACT(EPOCH FROM LOCALTIMESTAMP - refreshed_at)::FLOAT8 AS age_seconds
+        FROM materialized_view_refreshes
+        WHERE view_name = %s
     """
-    VIEW: агрегированная сводка устройств по домам.
+    return await adb.execute_single(query, (view_name,))
+
+
+async def refresh_materialized_view(view_name: str, max_staleness: Optional[float] = None) -> Optional[Dict[str, Any]]:
+    """
+    REFRESH MATERIALIZED VIEW CONCURRENTLY, если данные старше max_staleness секунд
+    (None — обновить принудительно). Строка в materialized_view_refreshes блокируется
+    на время обновления, поэтому плановое обновление пропускается, пока представление
+    обновляет другой процесс. Возвращает новое состояние или None, если обновления не было.
+    """
+    if view_name not in ANALYTICS_VIEWS:
+        raise ValueError(f"Unknown materialized view: {view_name}")
+    lock = "FOR UPDATE" if max_staleness is None else "FOR UPDATE SKIP LOCKED"
+    async with adb.transaction() as conn:
+        cur = await conn.execute(
+            f"""
+            SELECT EXTRACT(EPOCH FROM LOCALTIMESTAMP - refreshed_at)::FLOAT8 AS age_seconds
+            FROM materialized_view_refreshes
+            WHERE view_name = %s
+            {lock}
+            """,
+            (view_name,),
+        )
+        row = await cur.fetchone()
+        if row is None or (max_staleness is not None and row["age_seconds"] < max_staleness):
+            return None
+        await conn.execute(f"REFRESH MATERIALIZED VIEW CONCURRENTLY {view_name}")
+        cur = await conn.execute(
+            """
+            UPDATE materialized_view_refreshes
+            SET refreshed_at = LOCALTIMESTAMP
+            WHERE view_name = %s
+            RETURNING view_name, refreshed_at, 0.0::FLOAT8 AS age_seconds
+            """,
+            (view_name,),
+        )
+        return await cur.fetchone()
+
+
+@read_only
+async def get_home_devices_summary() -> List[Dict[str, Any]]:
+    """
+    MATERIALIZED VIEW: агрегированная сводка устройств по домам.
     Использует представление view_home_devices_summary.
     """
     query = "SELECT * FROM view_home_devices_summary ORDER BY home_id"
-    return db.execute_query(query)
+    return await adb.execute_query(query)
 
 
-def get_user_activity_summary() -> List[Dict[str, Any]]:
+@read_only
+async def get_user_activity_summary() -> List[Dict[str, Any]]:
     """
-    VIEW: агрегированная активность пользователей по логам.
+    MATERIALIZED VIEW: агрегированная активность пользователей по логам.
     Использует представление view_user_activity.
     """
     query = "SELECT * FROM view_user_activity ORDER BY actions_count DESC, user_id"
-    return db.execute_query(query)
+    return await adb.execute_query(query)
 
 
-def get_last_device_events() -> List[Dict[str, Any]]:
+@read_only
+async def get_last_device_events(
+    home_id: Optional[int] = None,
+    device_type: Optional[str] = None,
+) -> List[Dict[str, Any]]:
     """
-    VIEW: последние события по каждому устройству.
+    VIEW: последние события по каждому устройству, с фильтрами по дому и типу устройства.
     Использует представление view_last_device_events.
     """
-    query = "SELECT * FROM view_last_device_events ORDER BY device_id"
-    return db.execute_query(query)
+    conditions = []
+    params = []
+    if home_id is not None:
+        conditions.append("home_id = %s")
+        params.append(home_id)
+    if device_type is not None:
+        conditions.append("device_type = %s")
+        params.append(device_type)
+    where = f"WHERE {' AND '.join(conditions)}" if conditions else ""
+    query = f"SELECT * FROM view_last_device_events {where} ORDER BY device_id"
+    return await adb.execute_query(query, tuple(params))
+
+
+@read_only
+async def get_home_events_summary(home_id: int) -> Optional[Dict[str, Any]]:
+    """
+    Таблица home_events_summary, поддерживаемая триггером trg_events_insert_summary.
+    """
+    query = adb.statement("get_home_events_summary", "SELECT * FROM home_events_summary WHERE home_id = %s")
+    return await adb.execute_single(query, (home_id,))
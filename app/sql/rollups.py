@@ -0,0 +1,136 @@
+"""
+Обслуживание агрегатов событий events_rollup_hourly / events_rollup_daily.
+
+Запуск из корня репозитория:
+    python -m app.sql.rollups backfill [--from 2026-01-01] [--to 2026-02-01]
+    python -m app.sql.rollups check    [--from 2026-01-01] [--to 2026-02-01]
+
+backfill пересчитывает агрегаты из events по суткам: каждые сутки — отдельная
+транзакция под LOCK TABLE events IN SHARE MODE (вставка событий ждёт, чтение — нет).
+check сравнивает агрегаты с подсчётом по events и завершается с кодом 1 при расхождении.
+По умолчанию период — все данные events. Секции, удалённые политикой хранения,
+в агрегатах остаются: проверяйте период, за который сырые данные ещё есть.
+"""
+import argparse
+import sys
+from datetime import datetime, timedelta
+from typing import Optional, Tuple
+
+from app.db import db
+
+ROLLUPS = {
+    "events_rollup_hourly": "hour",
+    "events_rollup_daily": "day",
+}
+
+BACKFILL_SQL = """
+    DELETE FROM {table} WHERE bucket >= %(from)s AND bucket < %(to)s;
+    INSERT INTO {table} (device_id, event_type, bucket, events_count)
+    SELECT device_id, event_type, date_trunc('{unit}', timestamp), COUNT(*)::INT
+    FROM events
+    WHERE timestamp >= %(from)s AND timestamp < %(to)s
+    GROUP BY 1, 2, 3;
+"""
+
+CHECK_SQL = """
+    WITH raw AS (
+        SELECT device_id, event_type, date_trunc('{unit}', timestamp) AS bucket, COUNT(*)::INT AS events_count
+        FROM events
+        WHERE timestamp >= %(from)s AND timestamp < %(to)s
+        GROUP BY 1, 2, 3
+    ), rollup AS (
+        SELECT device_id, event_type, bucket, events_count
+        FROM {table}
+        WHERE bucket >= %(from)s AND bucket < %(to)s
+    )
+    SELECT device_id, event_type, bucket, raw.events_count AS raw_count, rollup.events_count AS rollup_count
+    FROM raw
+    FULL JOIN rollup USING (device_id, event_type, bucket)
+    WHERE raw.events_count IS DISTINCT FROM rollup.events_count
+    ORDER BY bucket, device_id, event_type
+"""
+
+
+def _day(dt: datetime) -> datetime:
+    return dt.replace(hour=0, minute=0, second=0, microsecond=0)
+
+
+def _period(from_dt: Optional[datetime], to_dt: Optional[datetime]) -> Optional[Tuple[datetime, datetime]]:
+    """Период в целых сутках; по умолчанию — все данные events"""
+    if from_dt is None or to_dt is None:
+        row = db.execute_single("SELECT MIN(timestamp) AS min_ts, MAX(timestamp) AS max_ts FROM events")
+        if row["min_ts"] is None:
+            return None
+        from_dt = from_dt or row["min_ts"]
+        to_dt = to_dt or row["max_ts"] + timedelta(days=1)
+    return _day(from_dt), _day(to_dt - timedelta(microseconds=1)) + timedelta(days=1)
+
+
+def backfill(from_dt: Optional[datetime] = None, to_dt: Optional[datetime] = None) -> int:
+    """Пересчитать агрегаты за период по суткам, вернуть количество обработанных суток"""
+    period = _period(from_dt, to_dt)
+    if period is None:
+        return 0
+    day, end = period
+    days = 0
+    while day < end:
+        params = {"from": day, "to": day + timedelta(days=1)}
+        with db.connection() as conn:
+            try:
+                cur = conn.cursor()
+                cur.execute("LOCK TABLE events IN SHARE MODE")
+                for table, unit in ROLLUPS.items():
+                    cur.execute(BACKFILL_SQL.format(table=table, unit=unit), params)
+                conn.commit()
+                cur.close()
+            except Exception:
+                conn.rollback()
+                raise
+        day += timedelta(days=1)
+        days += 1
+    return days
+
+
+def check(from_dt: Optional[datetime] = None, to_dt: Optional[datetime] = None) -> int:
+    """Сравнить агрегаты с events за период, напечатать расхождения, вернуть их количество"""
+    period = _period(from_dt, to_dt)
+    if period is None:
+        return 0
+    params = {"from": period[0], "to": period[1]}
+    mismatches = 0
+    for table, unit in ROLLUPS.items():
+        rows = db.execute_query(CHECK_SQL.format(table=table, unit=unit), params)
+        for row in rows[:20]:
+            print(
+                f"✗ {table}: device {row['device_id']}, {row['event_type']}, {row['bucket']}: "
+                f"events={row['raw_count'] or 0}, rollup={row['rollup_count'] or 0}"
+            )
+        if len(rows) > 20:
+            print(f"  ... and {len(rows) - 20} more")
+        mismatches += len(rows)
+    return mismatches
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("command", choices=["backfill", "check"])
+    parser.add_argument("--from", dest="from_dt", type=datetime.fromisoformat, default=None)
+    parser.add_argument("--to", dest="to_dt", type=datetime.fromisoformat, default=None)
+    args = parser.parse_args()
+
+    try:
+        if args.command == "backfill":
+            days = backfill(args.from_dt, args.to_dt)
+            print(f"✓ Rollups rebuilt for {days} day(s)")
+        else:
+            mismatches = check(args.from_dt, args.to_dt)
+            if mismatches:
+                print(f"✗ Rollups differ from events in {mismatches} bucket(s)")
+                sys.exit(1)
+            print("✓ Rollups match events")
+    finally:
+        db.close()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,81 @@
+import asyncio
+from typing import Awaitable, Callable, List
+
+from app.config import settings
+
+
+class PeriodicTask:
+    """Фоновая задача в event loop приложения: вызывает func раз в interval секунд"""
+
+    def __init__(self, name: str, interval: float, func: Callable[[], Awaitable[None]]):
+        self.name = name
+        self.interval = interval
+        self.func = func
+        self._task = None
+
+    def start(self):
+        if self._task is None:
+            self._task = asyncio.create_task(self._run(), name=self.name)
+
+    async def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+
+    async def _run(self):
+        while True:
+            try:
+                await self.func()
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                print(f"✗ Background task {self.name} failed: {e}")
+            await asyncio.sleep(self.interval)
+
+
+async def maintain_partitions():
+    """Секции events/logs на ближайшие месяцы и удаление секций старше срока хранения"""
+    from app.sql import queries
+    result = await queries.maintain_partitions(
+        premake_months=settings.PARTITION_PREMAKE_MONTHS,
+        retention_months={
+            "events": settings.EVENTS_RETENTION_MONTHS,
+            "logs": settings.LOGS_RETENTION_MONTHS,
+        },
+    )
+    for table, info in result.items():
+        if info["created"]:
+            print(f"✓ Partitions created for {table}: {info['created']}")
+        for name in info["dropped"]:
+            print(f"✓ Partition dropped by retention policy: {name}")
+
+
+async def refresh_analytics_views():
+    """Обновление материализованных представлений, данные которых старше допустимого"""
+    from app.sql import queries
+    for view_name in queries.ANALYTICS_VIEWS:
+        state = await queries.refresh_materialized_view(view_name, settings.ANALYTICS_VIEWS_MAX_STALENESS)
+        if state:
+            print(f"✓ Materialized view refreshed: {view_name}")
+
+
+async def check_replicas():
+    """Отставание реплик: от него зависит, куда идут чтения"""
+    from app.db import adb
+    await adb.check_replicas()
+
+
+def build_background_tasks() -> List[PeriodicTask]:
+    """Фоновые задачи, запускаемые в lifespan приложения"""
+    from app.db import adb
+    tasks = [
+        PeriodicTask("partition-maintenance", settings.PARTITION_MAINTENANCE_INTERVAL, maintain_partitions),
+        PeriodicTask("analytics-views-refresh", settings.ANALYTICS_VIEWS_CHECK_INTERVAL, refresh_analytics_views),
+    ]
+    if adb.replicas:
+        tasks.append(PeriodicTask("replica-lag-check", settings.DATABASE_REPLICA_CHECK_INTERVAL, check_replicas))
+    return tasks
@@ -0,0 +1,167 @@
+"""
+Бенчмарк триггера сводки событий home_events_summary.
+
+Сравнивает пропускную способность пакетной вставки в events для двух вариантов
+триггера: построчного (FOR EACH ROW, как было) и уровня оператора с переходной
+таблицей (FOR EACH STATEMENT, как сейчас в init_sql).
+
+Запуск из корня репозитория:
+    python -m benchmarks.events_summary_trigger --rows 100000 --batch 1 100 1000
+
+Всё выполняется во временной схеме bench_events_summary, которая удаляется в конце;
+рабочие таблицы не затрагиваются.
+"""
+import argparse
+import random
+import time
+from datetime import datetime, timedelta
+
+from psycopg2.extras import execute_values
+
+from app.db import db
+
+SCHEMA = "bench_events_summary"
+
+SETUP_SQL = f"""
+DROP SCHEMA IF EXISTS {SCHEMA} CASCADE;
+CREATE SCHEMA {SCHEMA};
+SET search_path TO {SCHEMA};
+
+CREATE TABLE devices (
+    id SERIAL PRIMARY KEY,
+    home_id INT NOT NULL
+);
+
+CREATE TABLE events (
+    id SERIAL PRIMARY KEY,
+    device_id INTEGER NOT NULL REFERENCES devices(id),
+    timestamp TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+    event_type VARCHAR(64) NOT NULL,
+    value VARCHAR(255)
+);
+CREATE INDEX ON events(device_id, timestamp);
+
+CREATE TABLE home_events_summary (
+    home_id INT PRIMARY KEY,
+    events_total INT NOT NULL DEFAULT 0
+);
+
+CREATE FUNCTION summary_per_row() RETURNS TRIGGER AS $$
+DECLARE
+    v_home_id INT;
+BEGIN
+    SELECT home_id INTO v_home_id FROM devices WHERE id = NEW.device_id;
+    IF v_home_id IS NULL THEN
+        RETURN NEW;
+    END IF;
+    INSERT INTO home_events_summary (home_id, events_total)
+    VALUES (v_home_id, 1)
+    ON CONFLICT (home_id) DO UPDATE
+        SET events_total = home_events_summary.events_total + 1;
+    RETURN NEW;
+END;
+$$ LANGUAGE plpgsql;
+
+CREATE FUNCTION summary_per_statement() RETURNS TRIGGER AS $$
+BEGIN
+    INSERT INTO home_events_summary (home_id, events_total)
+    SELECT d.home_id, COUNT(*)::INT
+    FROM new_events e
+    JOIN devices d ON d.id = e.device_id
+    GROUP BY d.home_id
+    ORDER BY d.home_id
+    ON CONFLICT (home_id) DO UPDATE
+        SET events_total = home_events_summary.events_total + EXCLUDED.events_total;
+    RETURN NULL;
+END;
+$$ LANGUAGE plpgsql;
+"""
+
+TRIGGERS = {
+    "per-row": """
+        CREATE TRIGGER trg_summary AFTER INSERT ON events
+        FOR EACH ROW EXECUTE FUNCTION summary_per_row();
+    """,
+    "per-statement": """
+        CREATE TRIGGER trg_summary AFTER INSERT ON events
+        REFERENCING NEW TABLE AS new_events
+        FOR EACH STATEMENT EXECUTE FUNCTION summary_per_statement();
+    """,
+}
+
+
+def make_rows(device_ids, count: int, seed: int):
+    rnd = random.Random(seed)
+    now = datetime.utcnow()
+    event_types = ["on", "off", "temperature_change", "motion_detected", "door_open", "door_close"]
+    return [
+        (rnd.choice(device_ids), now - timedelta(seconds=rnd.randint(0, 86400 * 30)), rnd.choice(event_types), None)
+        for _ in range(count)
+    ]
+
+
+def run_variant(conn, variant: str, rows, batch: int) -> float:
+    """Вставить rows пакетами по batch строк (commit после каждого пакета), вернуть строк/сек"""
+    cur = conn.cursor()
+    cur.execute("DROP TRIGGER IF EXISTS trg_summary ON events")
+    cur.execute("TRUNCATE events, home_events_summary")
+    cur.execute(TRIGGERS[variant])
+    conn.commit()
+
+    started = time.perf_counter()
+    for i in range(0, len(rows), batch):
+        execute_values(
+            cur,
+            "INSERT INTO events (device_id, timestamp, event_type, value) VALUES %s",
+            rows[i:i + batch],
+            page_size=batch,
+        )
+        conn.commit()
+    elapsed = time.perf_counter() - started
+
+    cur.execute("SELECT COALESCE(SUM(events_total), 0) FROM home_events_summary")
+    total = cur.fetchone()[0]
+    if total != len(rows):
+        raise RuntimeError(f"{variant}: summary total {total} != inserted {len(rows)}")
+    cur.close()
+    return len(rows) / elapsed
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--rows", type=int, default=100_000, help="сколько событий вставлять на прогон")
+    parser.add_argument("--batch", type=int, nargs="+", default=[100, 1000], help="размеры пакетов INSERT")
+    parser.add_argument("--homes", type=int, default=10)
+    parser.add_argument("--devices-per-home", type=int, default=20)
+    parser.add_argument("--seed", type=int, default=42)
+    args = parser.parse_args()
+
+    conn = db.get_connection()
+    try:
+        cur = conn.cursor()
+        cur.execute(SETUP_SQL)
+        execute_values(
+            cur,
+            "INSERT INTO devices (home_id) VALUES %s",
+            [(h,) for h in range(1, args.homes + 1) for _ in range(args.devices_per_home)],
+        )
+        cur.execute("SELECT id FROM devices")
+        device_ids = [row[0] for row in cur.fetchall()]
+        conn.commit()
+        rows = make_rows(device_ids, args.rows, args.seed)
+
+        print(f"{'batch':>8} {'per-row, rows/s':>18} {'per-statement, rows/s':>24} {'speedup':>9}")
+        for batch in args.batch:
+            per_row = run_variant(conn, "per-row", rows, batch)
+            per_statement = run_variant(conn, "per-statement", rows, batch)
+            print(f"{batch:>8} {per_row:>18,.0f} {per_statement:>24,.0f} {per_statement / per_row:>8.2f}x")
+    finally:
+        conn.rollback()
+        cur = conn.cursor()
+        cur.execute(f"DROP SCHEMA IF EXISTS {SCHEMA} CASCADE")
+        conn.commit()
+        conn.close()
+
+
+if __name__ == "__main__":
+    main()
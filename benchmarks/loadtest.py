@@ -0,0 +1,407 @@
+"""
+Нагрузочный тест HTTP API: парк устройств и пользователи дашбордов.
+
+Подготовка: вход администратором (при первом запуске он создаётся через
+/users/init-admin), создание домов с устройствами и жильцов, вход каждого
+жильца через /auth/login. Дальше в течение --duration секунд работают
+виртуальные пользователи двух видов:
+
+  устройства — POST /events/, POST /events/batch, PATCH /devices/{id}/status;
+  дашборды   — списки устройств (с If-None-Match) и событий, снимок дома,
+               аналитика.
+
+Каждый виртуальный пользователь выбирает операции по весам (--mix) своим
+генератором random.Random, зависящим только от --seed, поэтому при том же
+seed последовательность запросов повторяется. Итог — пропускная способность
+и задержки p50/p95/p99 по эндпоинтам; результаты пишутся в JSON (--output),
+два файла сравниваются командой compare.
+
+Запуск против локального стенда (docker-compose up или uvicorn app.main:app):
+    python -m benchmarks.loadtest run --duration 60 --devices 50 --dashboards 10 --seed 1 --output before.json
+    python -m benchmarks.loadtest compare before.json after.json
+"""
+import argparse
+import asyncio
+import json
+import math
+import random
+import subprocess
+import sys
+import time
+import uuid
+from datetime import datetime
+from typing import Any, Dict, List, Optional, Tuple
+
+import httpx
+
+# операция -> (вид пользователя, вес по умолчанию)
+OPERATIONS: Dict[str, Tuple[str, float]] = {
+    "event": ("device", 70),
+    "event_batch": ("device", 10),
+    "status": ("device", 20),
+    "devices_list": ("dashboard", 30),
+    "events_list": ("dashboard", 25),
+    "snapshot": ("dashboard", 15),
+    "analytics_home_summary": ("dashboard", 10),
+    "analytics_device_stats": ("dashboard", 10),
+    "analytics_home_events": ("dashboard", 10),
+}
+
+PASSWORD = "loadtest-password"
+
+
+def percentile(sorted_values: List[float], p: float) -> float:
+    """Перцентиль по ближайшему рангу"""
+    if not sorted_values:
+        return 0.0
+    rank = max(1, math.ceil(p / 100 * len(sorted_values)))
+    return sorted_values[rank - 1]
+
+
+class Stats:
+    """Задержки и коды ответов по эндпоинтам (метод + шаблон пути)"""
+
+    def __init__(self):
+        self.recording = False
+        self.reset()
+
+    def reset(self):
+        self.latencies: Dict[str, List[float]] = {}
+        self.statuses: Dict[str, Dict[str, int]] = {}
+        self.errors: Dict[str, int] = {}
+
+    def record(self, endpoint: str, status: str, elapsed_ms: float, error: bool):
+        if not self.recording:
+            return
+        self.latencies.setdefault(endpoint, []).append(elapsed_ms)
+        codes = self.statuses.setdefault(endpoint, {})
+        codes[status] = codes.get(status, 0) + 1
+        if error:
+            self.errors[endpoint] = self.errors.get(endpoint, 0) + 1
+
+    def summary(self, duration: float) -> Dict[str, Dict[str, Any]]:
+        result = {}
+        for endpoint in sorted(self.latencies):
+            values = sorted(self.latencies[endpoint])
+            result[endpoint] = {
+                "requests": len(values),
+                "errors": self.errors.get(endpoint, 0),
+                "rps": round(len(values) / duration, 2),
+                "mean_ms": round(sum(values) / len(values), 2),
+                "p50_ms": round(percentile(values, 50), 2),
+                "p95_ms": round(percentile(values, 95), 2),
+                "p99_ms": round(percentile(values, 99), 2),
+                "max_ms": round(values[-1], 2),
+                "statuses": dict(sorted(self.statuses[endpoint].items())),
+            }
+        return result
+
+
+class Client:
+    """HTTP-клиент с замером задержек; 304 — не ошибка (дашборд опрашивает с ETag)"""
+
+    def __init__(self, http: httpx.AsyncClient, stats: Stats):
+        self.http = http
+        self.stats = stats
+
+    async def request(self, method: str, path: str, endpoint: str, token: Optional[str] = None, **kwargs) -> httpx.Response:
+        headers = kwargs.pop("headers", {})
+        if token:
+            headers["Authorization"] = f"Bearer {token}"
+        started = time.perf_counter()
+        try:
+            response = await self.http.request(method, path, headers=headers, **kwargs)
+        except httpx.HTTPError as e:
+            self.stats.record(f"{method} {endpoint}", type(e).__name__, (time.perf_counter() - started) * 1000, True)
+            raise
+        elapsed_ms = (time.perf_counter() - started) * 1000
+        self.stats.record(f"{method} {endpoint}", str(response.status_code), elapsed_ms, response.status_code >= 400)
+        return response
+
+
+async def login(client: Client, email: str, password: str) -> Optional[str]:
+    response = await client.request("POST", "/auth/login", "/auth/login", data={"username": email, "password": password})
+    return response.json()["access_token"] if response.status_code == 200 else None
+
+
+def checked(response: httpx.Response) -> Any:
+    if response.status_code >= 400:
+        raise SystemExit(f"✗ Setup failed: {response.request.method} {response.request.url} -> {response.status_code} {response.text}")
+    return response.json()
+
+
+async def setup(client: Client, args) -> List[Dict[str, Any]]:
+    """Дома с устройствами и жильцами; возвращает [{home_id, token, devices}]"""
+    token = await login(client, args.admin_email, args.admin_password)
+    if token is None:
+        checked(await client.request(
+            "POST", "/users/init-admin", "/users/init-admin",
+            json={"email": args.admin_email, "password": args.admin_password},
+        ))
+        token = await login(client, args.admin_email, args.admin_password)
+    if token is None:
+        raise SystemExit(f"✗ Cannot log in as {args.admin_email}")
+
+    run_id = uuid.uuid4().hex[:8]
+    device_types = ["light", "thermostat", "camera"]
+    homes = []
+    for index in range(args.homes):
+        home = checked(await client.request(
+            "POST", "/homes/", "/homes/", token, json={"name": f"loadtest-{run_id}-{index}", "address": "load test"},
+        ))
+        devices = await asyncio.gather(*(
+            client.request(
+                "POST", "/devices/", "/devices/", token,
+                json={"home_id": home["id"], "type": device_types[i % 3], "name": f"device-{i}", "status": "off"},
+            )
+            for i in range(args.devices_per_home)
+        ))
+        email = f"loadtest-{run_id}-{index}@example.com"
+        checked(await client.request(
+            "POST", "/users/", "/users/", token,
+            json={"email": email, "password": PASSWORD, "role": "user", "home_id": home["id"]},
+        ))
+        homes.append({
+            "home_id": home["id"],
+            "email": email,
+            "devices": [checked(response)["id"] for response in devices],
+        })
+
+    # вход жильцов — тоже часть нагрузки на /auth/login
+    tokens = await asyncio.gather(*(login(client, home["email"], PASSWORD) for home in homes))
+    for home, home_token in zip(homes, tokens):
+        if home_token is None:
+            raise SystemExit(f"✗ Cannot log in as {home['email']}")
+        home["token"] = home_token
+    return homes
+
+
+def parse_mix(value: Optional[str]) -> Dict[str, float]:
+    weights = {name: weight for name, (_, weight) in OPERATIONS.items()}
+    if value:
+        for item in value.split(","):
+            name, _, weight = item.partition("=")
+            if name.strip() not in OPERATIONS:
+                raise SystemExit(f"✗ Unknown operation in --mix: {name!r} (known: {', '.join(OPERATIONS)})")
+            weights[name.strip()] = float(weight)
+    return weights
+
+
+class VirtualUser:
+    """Устройство или дашборд одного дома со своим генератором случайных чисел"""
+
+    def __init__(self, kind: str, index: int, home: Dict[str, Any], weights: Dict[str, float], args):
+        self.kind = kind
+        self.home = home
+        self.args = args
+        self.rnd = random.Random(f"{args.seed}:{kind}:{index}")
+        self.operations = [name for name, (group, _) in OPERATIONS.items() if group == kind and weights[name] > 0]
+        self.weights = [weights[name] for name in self.operations]
+        # устройство шлёт события от своего имени, дашборд смотрит весь дом
+        self.device_id = self.rnd.choice(home["devices"])
+        self.etag: Optional[str] = None
+
+    async def run(self, client: Client, deadline: float):
+        interval = self.args.device_interval if self.kind == "device" else self.args.dashboard_interval
+        # разносим старт, чтобы пользователи не шли строем
+        await asyncio.sleep(self.rnd.uniform(0, interval))
+        while time.monotonic() < deadline:
+            operation = self.rnd.choices(self.operations, self.weights)[0]
+            try:
+                await getattr(self, operation)(client)
+            except httpx.HTTPError:
+                pass
+            if interval:
+                await asyncio.sleep(self.rnd.uniform(0.5, 1.5) * interval)
+
+    # -------------------- устройства --------------------
+
+    async def event(self, client: Client):
+        await client.request(
+            "POST", "/events/", "/events/", self.home["token"],
+            json={"device_id": self.device_id, "event_type": "temperature_change", "value": f"{self.rnd.uniform(15, 30):.1f}°C"},
+        )
+
+    async def event_batch(self, client: Client):
+        events = [
+            {"device_id": self.device_id, "event_type": "temperature_change", "value": f"{self.rnd.uniform(15, 30):.1f}°C"}
+            for _ in range(self.args.batch_size)
+        ]
+        await client.request("POST", "/events/batch", "/events/batch", self.home["token"], json=events)
+
+    async def status(self, client: Client):
+        await client.request(
+            "PATCH", f"/devices/{self.device_id}/status", "/devices/{device_id}/status", self.home["token"],
+            json={"status": self.rnd.choice(["on", "off"])},
+        )
+
+    # -------------------- дашборды --------------------
+
+    def _device(self) -> int:
+        return self.rnd.choice(self.home["devices"])
+
+    async def devices_list(self, client: Client):
+        headers = {"If-None-Match": self.etag} if self.etag else {}
+        response = await client.request(
+            "GET", f"/devices/home/{self.home['home_id']}", "/devices/home/{home_id}", self.home["token"], headers=headers,
+        )
+        self.etag = response.headers.get("etag", self.etag)
+
+    async def events_list(self, client: Client):
+        await client.request(
+            "GET", f"/events/device/{self._device()}", "/events/device/{device_id}", self.home["token"],
+            params={"limit": self.args.page_limit},
+        )
+
+    async def snapshot(self, client: Client):
+        await client.request("GET", f"/homes/{self.home['home_id']}/snapshot", "/homes/{home_id}/snapshot", self.home["token"])
+
+    async def analytics_home_summary(self, client: Client):
+        await client.request("GET", "/analytics/devices/home-summary", "/analytics/devices/home-summary", self.home["token"])
+
+    async def analytics_device_stats(self, client: Client):
+        await client.request(
+            "GET", f"/analytics/devices/{self._device()}/events-stats", "/analytics/devices/{device_id}/events-stats",
+            self.home["token"],
+        )
+
+    async def analytics_home_events(self, client: Client):
+        await client.request(
+            "GET", f"/analytics/homes/{self.home['home_id']}/events-summary", "/analytics/homes/{home_id}/events-summary",
+            self.home["token"],
+        )
+
+
+def git_revision() -> Optional[str]:
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True, check=True,
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def print_summary(endpoints: Dict[str, Dict[str, Any]]):
+    print(f"{'endpoint':<48} {'reqs':>7} {'err':>5} {'rps':>8} {'p50 ms':>8} {'p95 ms':>8} {'p99 ms':>8} {'max ms':>8}")
+    for endpoint, s in endpoints.items():
+        print(
+            f"{endpoint:<48} {s['requests']:>7} {s['errors']:>5} {s['rps']:>8.1f} "
+            f"{s['p50_ms']:>8.1f} {s['p95_ms']:>8.1f} {s['p99_ms']:>8.1f} {s['max_ms']:>8.1f}"
+        )
+
+
+async def run(args):
+    stats = Stats()
+    limits = httpx.Limits(max_connections=args.devices + args.dashboards + 10)
+    async with httpx.AsyncClient(base_url=args.base_url, timeout=args.timeout, limits=limits) as http:
+        client = Client(http, stats)
+        stats.recording = True
+        setup_started = time.monotonic()
+        homes = await setup(client, args)
+        setup_endpoints = stats.summary(time.monotonic() - setup_started)
+        stats.recording = False
+        stats.reset()
+        print(f"✓ Setup: {len(homes)} homes × {args.devices_per_home} devices ({time.monotonic() - setup_started:.1f}s)")
+
+        weights = parse_mix(args.mix)
+        users = [VirtualUser("device", i, homes[i % len(homes)], weights, args) for i in range(args.devices)]
+        users += [VirtualUser("dashboard", i, homes[i % len(homes)], weights, args) for i in range(args.dashboards)]
+        users = [user for user in users if user.operations]
+
+        started = time.monotonic()
+        deadline = started + args.warmup + args.duration
+        tasks = [asyncio.create_task(user.run(client, deadline)) for user in users]
+        await asyncio.sleep(args.warmup)
+        stats.recording = True
+        measured_from = time.monotonic()
+        await asyncio.gather(*tasks)
+        duration = time.monotonic() - measured_from
+
+    endpoints = stats.summary(duration)
+    total = sum(s["requests"] for s in endpoints.values())
+    errors = sum(s["errors"] for s in endpoints.values())
+    print_summary(endpoints)
+    print(f"total: {total} requests, {errors} errors, {total / duration:.1f} req/s over {duration:.1f}s")
+
+    if args.output:
+        result = {
+            "started_at": datetime.now().isoformat(timespec="seconds"),
+            "revision": git_revision(),
+            "config": {
+                key: value for key, value in vars(args).items()
+                if key not in ("command", "output", "admin_password")
+            },
+            "duration_seconds": round(duration, 2),
+            "total": {"requests": total, "errors": errors, "rps": round(total / duration, 2)},
+            "endpoints": endpoints,
+            "setup": setup_endpoints,
+        }
+        with open(args.output, "w", encoding="utf-8") as f:
+            json.dump(result, f, indent=2, sort_keys=True, ensure_ascii=False)
+            f.write("\n")
+        print(f"✓ Results written to {args.output}")
+    if errors and args.fail_on_errors:
+        sys.exit(1)
+
+
+def compare(args):
+    """Сравнение двух файлов результатов: rps и p95/p99 по эндпоинтам"""
+    with open(args.before, encoding="utf-8") as f:
+        before = json.load(f)
+    with open(args.after, encoding="utf-8") as f:
+        after = json.load(f)
+
+    def delta(old: float, new: float) -> str:
+        return f"{(new - old) / old * 100:+.0f}%" if old else "—"
+
+    print(f"{before.get('revision')} -> {after.get('revision')}")
+    print(f"{'endpoint':<48} {'rps':>17} {'':>6} {'p95 ms':>15} {'':>6} {'p99 ms':>15} {'':>6}")
+    for endpoint in sorted(set(before["endpoints"]) | set(after["endpoints"])):
+        old, new = before["endpoints"].get(endpoint), after["endpoints"].get(endpoint)
+        if old is None or new is None:
+            print(f"{endpoint:<48} {'only in ' + ('after' if old is None else 'before'):>17}")
+            continue
+        print(
+            f"{endpoint:<48} {old['rps']:>8.1f}→{new['rps']:<8.1f} {delta(old['rps'], new['rps']):>6} "
+            f"{old['p95_ms']:>7.1f}→{new['p95_ms']:<7.1f} {delta(old['p95_ms'], new['p95_ms']):>6} "
+            f"{old['p99_ms']:>7.1f}→{new['p99_ms']:<7.1f} {delta(old['p99_ms'], new['p99_ms']):>6}"
+        )
+
+
+def main():
+    parser = argparse.ArgumentParser(description="HTTP API load test")
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    run_parser = commands.add_parser("run", help="запустить нагрузку")
+    run_parser.add_argument("--base-url", default="http://localhost:8000")
+    run_parser.add_argument("--admin-email", default="loadtest-admin@example.com")
+    run_parser.add_argument("--admin-password", default=PASSWORD)
+    run_parser.add_argument("--homes", type=int, default=10)
+    run_parser.add_argument("--devices-per-home", type=int, default=20)
+    run_parser.add_argument("--devices", type=int, default=50, help="виртуальных устройств")
+    run_parser.add_argument("--dashboards", type=int, default=10, help="виртуальных пользователей дашборда")
+    run_parser.add_argument("--device-interval", type=float, default=0.5, help="пауза устройства между запросами, сек (0 — без пауз)")
+    run_parser.add_argument("--dashboard-interval", type=float, default=1.0, help="пауза дашборда между запросами, сек")
+    run_parser.add_argument("--mix", help="веса операций, например event=50,status=0,snapshot=30")
+    run_parser.add_argument("--batch-size", type=int, default=50, help="событий в POST /events/batch")
+    run_parser.add_argument("--page-limit", type=int, default=50, help="limit для списка событий")
+    run_parser.add_argument("--duration", type=float, default=60.0, help="длительность замера, сек")
+    run_parser.add_argument("--warmup", type=float, default=5.0, help="разогрев до замера, сек")
+    run_parser.add_argument("--timeout", type=float, default=30.0, help="таймаут запроса, сек")
+    run_parser.add_argument("--seed", type=int, default=1)
+    run_parser.add_argument("--output", help="файл результатов (JSON)")
+    run_parser.add_argument("--fail-on-errors", action="store_true", help="код выхода 1, если были ошибки")
+
+    compare_parser = commands.add_parser("compare", help="сравнить два файла результатов")
+    compare_parser.add_argument("before")
+    compare_parser.add_argument("after")
+
+    args = parser.parse_args()
+    if args.command == "run":
+        asyncio.run(run(args))
+    else:
+        compare(args)
+
+
+if __name__ == "__main__":
+    main()
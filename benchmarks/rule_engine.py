@@ -0,0 +1,120 @@
+"""
+Бенчмарк движка правил автоматики (app.rule_engine).
+
+Сравнивает проверку событий по индексу RuleSet (сигнал -> оператор -> порог)
+с перебором всех скомпилированных условий дома. База данных не нужна:
+правила и события генерируются в памяти.
+
+Запуск из корня репозитория:
+    python -m benchmarks.rule_engine --rules 10000 50000 --homes 1 100 --events 20000
+"""
+import argparse
+import random
+import time
+from typing import List, Tuple
+
+from app.rule_engine import RuleSet, compile_condition, event_signal
+
+# сигнал -> (тип события, диапазон значений)
+NUMERIC_SIGNALS = {
+    "temperature": ("temperature_change", 10, 35),
+    "humidity": ("humidity_change", 20, 90),
+    "co2": ("co2", 400, 2000),
+    "illuminance": ("illuminance", 0, 1000),
+    "power": ("power", 0, 3500),
+    "noise": ("noise", 20, 100),
+}
+BOOLEAN_SIGNALS = ["motion_detected", "door_open", "window_open", "smoke_detected"]
+OPERATORS = [">", ">=", "<", "<=", "==", "!="]
+
+
+def generate_rules(count: int, homes: int, rnd: random.Random) -> List[dict]:
+    rules = []
+    for rule_id in range(1, count + 1):
+        kind = rnd.random()
+        if kind < 0.6:
+            signal = rnd.choice(list(NUMERIC_SIGNALS))
+            _, low, high = NUMERIC_SIGNALS[signal]
+            condition = f"{signal} {rnd.choice(OPERATORS)} {rnd.randint(low, high)}"
+        elif kind < 0.9:
+            signal = rnd.choice(BOOLEAN_SIGNALS)
+            condition = f"{signal} {rnd.choice(['==', '!='])} {rnd.choice(['true', 'false'])}"
+        else:
+            condition = f"time == {rnd.randint(0, 23):02d}:00"
+        rules.append({"id": rule_id, "home_id": rnd.randint(1, homes), "condition": condition, "action": "log_event"})
+    return rules
+
+
+def generate_events(count: int, homes: int, rnd: random.Random) -> List[Tuple[int, str, str]]:
+    events = []
+    for _ in range(count):
+        if rnd.random() < 0.7:
+            event_type, low, high = NUMERIC_SIGNALS[rnd.choice(list(NUMERIC_SIGNALS))]
+            value = f"{rnd.uniform(low, high):.1f}"
+        else:
+            event_type = rnd.choice(BOOLEAN_SIGNALS + ["door_close"])
+            value = None
+        events.append((rnd.randint(1, homes), event_type, value))
+    return events
+
+
+def run_indexed(rule_sets, events) -> Tuple[float, int]:
+    started = time.perf_counter()
+    matched = 0
+    for home_id, event_type, value in events:
+        signal, raw = event_signal(event_type, value)
+        matched += len(rule_sets[home_id].match(signal, raw))
+    return time.perf_counter() - started, matched
+
+
+def run_scan(compiled, events) -> Tuple[float, int]:
+    started = time.perf_counter()
+    matched = 0
+    for home_id, event_type, value in events:
+        signal, raw = event_signal(event_type, value)
+        for condition in compiled[home_id]:
+            if condition.signal == signal and condition(raw):
+                matched += 1
+    return time.perf_counter() - started, matched
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Rule engine benchmark")
+    parser.add_argument("--rules", type=int, nargs="+", default=[10000, 50000], help="правил всего")
+    parser.add_argument("--homes", type=int, nargs="+", default=[1, 100], help="домов, между которыми распределены правила")
+    parser.add_argument("--events", type=int, default=20000, help="событий на прогон")
+    parser.add_argument("--scan-events", type=int, default=500, help="событий для прогона перебором")
+    parser.add_argument("--seed", type=int, default=42)
+    args = parser.parse_args()
+
+    print(f"{'rules':>8} {'homes':>6} {'compile ms':>11} {'indexed ev/s':>13} {'scan ev/s':>10} {'speedup':>8} {'matches/ev':>11}")
+    for rules_count in args.rules:
+        for homes in args.homes:
+            rnd = random.Random(args.seed)
+            rules = generate_rules(rules_count, homes, rnd)
+            events = generate_events(args.events, homes, rnd)
+
+            started = time.perf_counter()
+            rule_sets = {home_id: RuleSet(r for r in rules if r["home_id"] == home_id) for home_id in range(1, homes + 1)}
+            compile_ms = (time.perf_counter() - started) * 1000
+            compiled = {home_id: [] for home_id in range(1, homes + 1)}
+            for rule in rules:
+                compiled[rule["home_id"]].append(compile_condition(rule["condition"]))
+
+            indexed_time, indexed_matched = run_indexed(rule_sets, events)
+            scan_events = events[:args.scan_events]
+            scan_time, scan_matched = run_scan(compiled, scan_events)
+            _, expected = run_indexed(rule_sets, scan_events)
+            if expected != scan_matched:
+                raise SystemExit(f"✗ Index and scan disagree: {expected} != {scan_matched}")
+
+            indexed_rate = len(events) / indexed_time
+            scan_rate = len(scan_events) / scan_time
+            print(
+                f"{rules_count:>8} {homes:>6} {compile_ms:>11.1f} {indexed_rate:>13.0f} {scan_rate:>10.0f} "
+                f"{indexed_rate / scan_rate:>7.1f}x {indexed_matched / len(events):>11.1f}"
+            )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,146 @@
+"""
+Бенчмарк сериализации списков: RealDictRow -> Pydantic (response_model) -> JSON
+против быстрого пути app.db.fetch_rows + RowEncoder.
+
+Для каждого списочного эндпоинта выполняет тот же запрос, что и обработчик,
+и сериализует ответ двумя способами: как FastAPI с response_model
+(serialize_response + JSONResponse) и через RowEncoder. Показывает строки
+в секунду для полного пути (запрос + сериализация) и отдельно для сериализации,
+а также проверяет, что оба способа дают одинаковый JSON.
+
+Старый путь выполняет тот же SQL, что и *_rows-функции app.sql.queries, но
+через adb.execute_query (dict_row) — как обработчики до быстрого пути, так что
+в полном пути сравнивается и выборка, и сериализация.
+
+Данные берутся из текущей базы: устройство с наибольшим числом событий,
+пользователь с наибольшим числом логов и т. д. Запуск из корня репозитория:
+    python -m benchmarks.serialization --limit 1000 --repeat 50
+"""
+import argparse
+import asyncio
+import json
+import time
+from typing import Any, Awaitable, Callable, Dict, List
+
+from fastapi.responses import JSONResponse
+from fastapi.routing import serialize_response
+from fastapi.utils import create_model_field
+
+from app.db import RowEncoder, adb, orjson
+from app.responses import DEVICE_ENCODER, EVENT_ENCODER, LOG_ENCODER, SENSOR_READING_ENCODER
+from app.schemas import DeviceRead, EventRead, LogRead, SensorReadingRead
+from app.sql import queries
+
+
+async def serialize_pydantic(field, rows: List[Any]) -> bytes:
+    """Как FastAPI: валидация по response_model, jsonable_encoder, JSONResponse"""
+    content = await serialize_response(field=field, response_content=rows, is_coroutine=True)
+    return JSONResponse(content).body
+
+
+async def keyset_dicts(table: str, conditions: List[str], params: tuple, **page) -> List[Dict[str, Any]]:
+    """Тот же запрос, что у _keyset_fetch_rows, но строками-словарями (dict_row)"""
+    query, params = queries._keyset_query(table, conditions, params, **page)
+    return await adb.execute_query(query, params)
+
+
+async def top_id(query: str) -> Any:
+    row = await adb.execute_single(query)
+    return row["id"] if row else None
+
+
+async def run_endpoint(
+    name: str,
+    model: Any,
+    encoder: RowEncoder,
+    fetch_dicts: Callable[[], Awaitable[List[Any]]],
+    fetch_rows: Callable[[], Awaitable[Any]],
+    repeat: int,
+):
+    field = create_model_field(f"Response_{name}", List[model], mode="serialization")
+
+    dict_rows = await fetch_dicts()
+    columns, tuple_rows = await fetch_rows()
+    if not dict_rows:
+        print(f"{name:<24} {'—':>6}  нет данных")
+        return
+    old_body = await serialize_pydantic(field, dict_rows)
+    new_body = encoder.encode(columns, tuple_rows)
+    if json.loads(old_body) != json.loads(new_body):
+        raise SystemExit(f"✗ {name}: fast path output differs from response_model output")
+
+    rows_total = len(dict_rows) * repeat
+
+    started = time.perf_counter()
+    for _ in range(repeat):
+        await serialize_pydantic(field, await fetch_dicts())
+    old_full = rows_total / (time.perf_counter() - started)
+
+    started = time.perf_counter()
+    for _ in range(repeat):
+        columns, rows = await fetch_rows()
+        encoder.encode(columns, rows)
+    new_full = rows_total / (time.perf_counter() - started)
+
+    started = time.perf_counter()
+    for _ in range(repeat):
+        await serialize_pydantic(field, dict_rows)
+    old_ser = rows_total / (time.perf_counter() - started)
+
+    started = time.perf_counter()
+    for _ in range(repeat):
+        encoder.encode(columns, tuple_rows)
+    new_ser = rows_total / (time.perf_counter() - started)
+
+    print(
+        f"{name:<24} {len(dict_rows):>6} {old_full:>12.0f} {new_full:>12.0f} {new_full / old_full:>6.1f}x "
+        f"{old_ser:>12.0f} {new_ser:>12.0f} {new_ser / old_ser:>6.1f}x"
+    )
+
+
+async def main():
+    parser = argparse.ArgumentParser(description="List serialization benchmark")
+    parser.add_argument("--limit", type=int, default=1000, help="строк на страницу (как ?limit=)")
+    parser.add_argument("--repeat", type=int, default=50, help="повторов на эндпоинт")
+    args = parser.parse_args()
+    page = {"limit": args.limit + 1, "before": None, "after": None, "from_dt": None, "to_dt": None}
+
+    await adb.open()
+    try:
+        home_id = await top_id("SELECT home_id AS id FROM devices GROUP BY home_id ORDER BY count(*) DESC LIMIT 1")
+        device_id = await top_id("SELECT device_id AS id FROM events GROUP BY device_id ORDER BY count(*) DESC LIMIT 1")
+        user_id = await top_id("SELECT user_id AS id FROM logs GROUP BY user_id ORDER BY count(*) DESC LIMIT 1")
+        sensor_id = await top_id(
+            "SELECT sensor_id AS id FROM sensor_readings GROUP BY sensor_id ORDER BY count(*) DESC LIMIT 1"
+        )
+
+        print(f"encoder: {'orjson ' + orjson.__version__ if orjson is not None else 'json (orjson не установлен)'}")
+        print(
+            f"{'endpoint':<24} {'rows':>6} {'old rows/s':>12} {'fast rows/s':>12} {'gain':>7} "
+            f"{'old ser/s':>12} {'fast ser/s':>12} {'gain':>7}"
+        )
+        endpoints = [
+            ("devices/home/{id}", DeviceRead, DEVICE_ENCODER,
+             lambda: adb.execute_query("SELECT * FROM devices WHERE home_id = %s", (home_id,)),
+             lambda: queries.get_devices_by_home_rows(home_id)),
+            ("events/device/{id}", EventRead, EVENT_ENCODER,
+             lambda: keyset_dicts("events", ["device_id = %s"], (device_id,), **page),
+             lambda: queries.get_events_by_device_rows(device_id, **page)),
+            ("logs", LogRead, LOG_ENCODER,
+             lambda: keyset_dicts("logs", [], (), **page),
+             lambda: queries.get_logs_rows(**page)),
+            ("logs/user/{id}", LogRead, LOG_ENCODER,
+             lambda: keyset_dicts("logs", ["user_id = %s"], (user_id,), **page),
+             lambda: queries.get_logs_by_user_rows(user_id, **page)),
+            ("sensors/{id}/readings", SensorReadingRead, SENSOR_READING_ENCODER,
+             lambda: keyset_dicts("sensor_readings", ["sensor_id = %s"], (sensor_id,), **page),
+             lambda: queries.get_sensor_readings_rows(sensor_id, **page)),
+        ]
+        for name, model, encoder, fetch_dicts, fetch_rows in endpoints:
+            await run_endpoint(name, model, encoder, fetch_dicts, fetch_rows, args.repeat)
+    finally:
+        await adb.close()
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -1,170 +1,104 @@
-import psycopg2
-from psycopg2.extras import execute_values
+"""
+Генератор тестовых данных: заполняет БД заново заданным объёмом данных.
+
+Запуск из корня репозитория (схема создаётся, если её ещё нет):
+    python seed.py
+    python seed.py --homes 10000 --events 20000000 --logs 2000000 --days 365 --skew 1.1 --workers 8
+
+Результат определяется параметрами, --seed и --end: при одинаковых значениях
+(кроме --workers) получаются одни и те же строки с теми же id. Без --end период
+заканчивается текущей минутой.
+
+Справочники (дома, пользователи, комнаты, устройства, датчики, правила) строятся
+в главном процессе. События, логи и показания датчиков генерируют --workers
+процессов порциями по --chunk-size строк, каждая порция загружается своим COPY.
+Порция k покрывает k-й отрезок распределения времени, поэтому id растут вместе
+с timestamp, как в рабочей базе.
+
+На время загрузки вторичные индексы events, logs и sensor_readings удалены
+(потом их строит INIT_SQL), а пользовательские триггеры events отключены (иначе
+NOTIFY на каждую строку); сводка по домам, агрегаты и последние события устройств
+затем пересчитываются из events одним проходом. Пароль у всех пользователей
+один (--password): bcrypt считается один раз.
+"""
+import argparse
+import io
+import math
+import os
 import random
+import time
 from datetime import datetime, timedelta
-from app.config import settings
+from itertools import accumulate
+from multiprocessing import Pool
+from typing import Any, Dict, List, Optional, Sequence, Tuple
+
+import psycopg2
+
+from app.db import db
 from app.security import hash_password
+from app.sql.init_sql import INIT_SQL
+from app.sql.rollups import BACKFILL_SQL, ROLLUPS
 
-# Подключение к БД
-conn = psycopg2.connect(
-    dbname=settings.DATABASE_NAME,
-    user=settings.DATABASE_USER,
-    password=settings.DATABASE_PASSWORD,
-    host=settings.DATABASE_HOST,
-    port=settings.DATABASE_PORT,
+# Таблицы с данными: очищаются перед генерацией
+DATA_TABLES = (
+    "homes", "users", "rooms", "devices", "sensors", "sensor_readings", "events", "rules", "logs",
+    "home_events_summary", "events_rollup_hourly", "events_rollup_daily", "home_versions", "device_last_event",
 )
-cur = conn.cursor()
-
-print("🌱 Начинаю заполнение БД тестовыми данными...")
-
-# ==================== HOMES ====================
-print("📍 Создаю дома...")
-homes_data = [
-    ("Дом 1 на Ленина", "ул. Ленина, 10"),
-    ("Дом 2 на Красной", "ул. Красная, 25"),
-    ("Квартира 3", "ул. Пушкина, 5"),
-    ("Офис компании", "ул. Советская, 100"),
-    ("Загородный дом", "деревня Заречье, 15"),
-]
-cur.execute("DELETE FROM homes")  # Очистка
-execute_values(cur, "INSERT INTO homes (name, address) VALUES %s", homes_data)
-conn.commit()
-cur.execute("SELECT id FROM homes ORDER BY id")
-home_rows = cur.fetchall()
-home_ids = [row[0] for row in home_rows]
-print(f"✅ Создано {len(home_ids)} домов")
-
-# ==================== USERS ====================
-print("👥 Создаю пользователей...")
-cur.execute("DELETE FROM users")
-users_data = [
-    ("admin@example.com", hash_password("admin123"), "admin", home_ids[0]),
-    ("user1@example.com", hash_password("pass1"), "user", home_ids[0]),
-    ("user2@example.com", hash_password("pass2"), "user", home_ids[1]),
-    ("user3@example.com", hash_password("pass3"), "user", home_ids[2]),
-    ("user4@example.com", hash_password("pass4"), "user", home_ids[3]),
-    ("user5@example.com", hash_password("pass5"), "user", home_ids[4]),
-]
-execute_values(cur, 
-    "INSERT INTO users (email, password_hash, role, home_id) VALUES %s", 
-    users_data)
-conn.commit()
-cur.execute("SELECT id FROM users ORDER BY id")
-user_ids = [row[0] for row in cur.fetchall()]
-print(f"✅ Создано {len(user_ids)} пользователей")
-
-# ==================== ROOMS ====================
-print("🏠 Создаю комнаты...")
-cur.execute("DELETE FROM rooms")
-rooms_data = []
-room_names = ["Гостиная", "Спальня", "Кухня", "Ванная", "Кабинет", "Коридор"]
-for home_id in home_ids:
-    for room_name in room_names:
-        rooms_data.append((home_id, room_name))
-execute_values(cur, "INSERT INTO rooms (home_id, name) VALUES %s", rooms_data)
-conn.commit()
-print(f"✅ Создано {len(rooms_data)} комнат")
-
-# ==================== DEVICES ====================
-print("🔌 Создаю устройства...")
-cur.execute("DELETE FROM devices")
-devices_data = []
-device_types = ["light", "thermostat", "camera"]
-device_names = {
+
+# Таблицы с последовательностью id: после COPY с явными id последовательность сдвигается
+SERIAL_TABLES = ("homes", "users", "rooms", "devices", "sensors", "sensor_readings", "events", "rules", "logs")
+
+# Большие таблицы: вторичные индексы на время COPY удаляются, потом INIT_SQL строит их заново
+BULK_TABLES = ("events", "logs", "sensor_readings")
+
+SECONDARY_INDEXES_SQL = """
+    SELECT i.indexrelid::regclass::TEXT
+    FROM pg_index i
+    WHERE i.indrelid = ANY(%s::REGCLASS[])
+      AND NOT EXISTS (SELECT 1 FROM pg_constraint c WHERE c.conindid = i.indexrelid)
+"""
+
+ANALYTICS_VIEWS = ("view_home_devices_summary", "view_user_activity")
+
+STREETS = ["Ленина", "Красная", "Пушкина", "Советская", "Садовая", "Лесная", "Заречная", "Мира"]
+HOME_KINDS = ["Дом", "Квартира", "Офис", "Загородный дом"]
+ROOM_NAMES = ["Гостиная", "Спальня", "Кухня", "Ванная", "Кабинет", "Коридор"]
+
+# Доли типов устройств, названия и начальные статусы
+DEVICE_TYPES = {"light": 0.5, "thermostat": 0.2, "camera": 0.3}
+DEVICE_NAMES = {
     "light": ["Основной свет", "Настольная лампа", "Подсветка", "Люстра"],
     "thermostat": ["Термостат 1", "Термостат 2"],
     "camera": ["Камера входа", "Камера гостиной", "Камера улицы"],
 }
-for home_id in home_ids:
-    for dev_type in device_types:
-        for name in device_names[dev_type]:
-            devices_data.append((home_id, dev_type, name, random.choice(["on", "off", "22°C", "idle"])))
-execute_values(cur, 
-    "INSERT INTO devices (home_id, type, name, status) VALUES %s", 
-    devices_data)
-conn.commit()
-cur.execute("SELECT id FROM devices ORDER BY id")
-device_ids = [row[0] for row in cur.fetchall()]
-print(f"✅ Создано {len(device_ids)} устройств")
-
-# ==================== SENSORS ====================
-print("📊 Создаю датчики...")
-cur.execute("DELETE FROM sensors")
-sensors_data = []
-sensor_types = ["motion", "temp", "door"]
-for device_id in device_ids[:len(device_ids)//2]:  # На половине устройств
-    for sensor_type in sensor_types:
-        value = None
-        if sensor_type == "temp":
-            value = f"{random.randint(15, 30)}°C"
-        elif sensor_type == "motion":
-            value = random.choice(["detected", "clear"])
-        elif sensor_type == "door":
-            value = random.choice(["open", "closed"])
-        sensors_data.append((device_id, sensor_type, value))
-execute_values(cur, "INSERT INTO sensors (device_id, type, value) VALUES %s", sensors_data)
-conn.commit()
-print(f"✅ Создано {len(sensors_data)} датчиков")
-
-# ==================== EVENTS ====================
-print("📝 Создаю события (1000 записей)...")
-cur.execute("DELETE FROM events")
-cur.execute("DELETE FROM home_events_summary")
-events_data = []
-event_types = ["on", "off", "temperature_change", "motion_detected", "door_open", "door_close"]
-now = datetime.utcnow()
-
-for i in range(1000):
-    device_id = random.choice(device_ids)
-    timestamp = now - timedelta(days=random.randint(0, 30), hours=random.randint(0, 23))
-    event_type = random.choice(event_types)
-    value = None
-    if event_type == "temperature_change":
-        value = f"{random.randint(15, 30)}°C"
-    events_data.append((device_id, timestamp, event_type, value))
-
-execute_values(cur, 
-    "INSERT INTO events (device_id, timestamp, event_type, value) VALUES %s", 
-    events_data)
-conn.commit()
-print(f"✅ Создано {len(events_data)} событий")
-
-# ==================== RULES ====================
-print("⚙️  Создаю правила автоматизации...")
-cur.execute("DELETE FROM rules")
-rules_data = []
-conditions = [
+DEVICE_STATUSES = {
+    "light": ["on", "off"],
+    "thermostat": ["22°C", "idle"],
+    "camera": ["on", "idle"],
+}
+# События, которые присылает устройство каждого типа
+EVENT_TYPES = {
+    "light": ["on", "off"],
+    "thermostat": ["temperature_change"],
+    "camera": ["motion_detected", "door_open", "door_close"],
+}
+SENSOR_TYPES = ["motion", "temp", "door"]
+
+CONDITIONS = [
     "temperature > 25",
     "motion_detected == true",
     "time == 22:00",
     "door_open == true",
     "humidity > 60",
 ]
-actions = [
+RULE_ACTIONS = [
     "turn_off light",
     "set_temperature 22",
     "send_notification",
     "activate_alarm",
     "log_event",
 ]
-for home_id in home_ids:
-    for _ in range(10):
-        rules_data.append((
-            home_id,
-            random.choice(conditions),
-            random.choice(actions),
-        ))
-execute_values(cur, 
-    "INSERT INTO rules (home_id, condition, action) VALUES %s", 
-    rules_data)
-conn.commit()
-print(f"✅ Создано {len(rules_data)} правил")
-
-# ==================== LOGS ====================
-print("📋 Создаю логи аудита...")
-cur.execute("DELETE FROM logs")
-logs_data = []
-actions = [
+LOG_ACTIONS = [
     "Created device",
     "Updated device status",
     "Created rule",
@@ -173,33 +107,374 @@ actions = [
     "Logged in",
     "Changed settings",
 ]
-now = datetime.utcnow()
-
-for i in range(500):
-    user_id = random.choice(user_ids)
-    timestamp = now - timedelta(days=random.randint(0, 30), hours=random.randint(0, 23))
-    action = random.choice(actions)
-    logs_data.append((user_id, action, timestamp))
-
-execute_values(cur, 
-    "INSERT INTO logs (user_id, action, timestamp) VALUES %s", 
-    logs_data)
-conn.commit()
-print(f"✅ Создано {len(logs_data)} логов")
-
-# ==================== ИТОГ ====================
-cur.close()
-conn.close()
-
-print("\n" + "="*50)
-print("✨ Заполнение завершено!")
-print("="*50)
-print(f"✅ Домов: {len(home_ids)}")
-print(f"✅ Пользователей: {len(user_ids)}")
-print(f"✅ Комнат: {len(rooms_data)}")
-print(f"✅ Устройств: {len(device_ids)}")
-print(f"✅ Датчиков: {len(sensors_data)}")
-print(f"✅ Событий: {len(events_data)}")
-print(f"✅ Правил: {len(rules_data)}")
-print(f"✅ Логов: {len(logs_data)}")
-print("="*50)
+
+# Распределение "recent": плотность растёт к концу периода в e^3 ≈ 20 раз
+RECENT_GROWTH = 3.0
+
+NULL = "\\N"
+
+# Состояние процесса-генератора: параметры из главного процесса и своё подключение
+_worker: Dict[str, Any] = {}
+
+
+def time_quantile(u: float, distribution: str) -> float:
+    """Доля периода (0..1), на которую приходится квантиль u распределения времени"""
+    if distribution == "recent":
+        return math.log1p(u * math.expm1(RECENT_GROWTH)) / RECENT_GROWTH
+    return u
+
+
+def popularity(rng: random.Random, count: int, skew: float) -> Optional[List[float]]:
+    """
+    Накопленные веса для выбора из count объектов по закону Ципфа с показателем skew,
+    None при skew == 0 (равномерно). Популярные объекты раскиданы случайно, а не идут первыми.
+    """
+    if skew <= 0 or count == 0:
+        return None
+    ranks = list(range(1, count + 1))
+    rng.shuffle(ranks)
+    return list(accumulate(rank ** -skew for rank in ranks))
+
+
+def copy_rows(cur, table: str, columns: Sequence[str], lines: List[str]):
+    """Загрузить готовые строки в формате COPY text"""
+    cur.copy_expert(f"COPY {table} ({', '.join(columns)}) FROM STDIN", io.StringIO("".join(lines)))
+
+
+def month_ranges(begin: datetime, end: datetime) -> List[Tuple[datetime, datetime]]:
+    """Календарные месяцы (начало, начало следующего), покрывающие [begin, end]"""
+    months = []
+    month = datetime(begin.year, begin.month, 1)
+    while month <= end:
+        following = datetime(month.year + month.month // 12, month.month % 12 + 1, 1)
+        months.append((month, following))
+        month = following
+    return months
+
+
+def chunk_tasks(table: str, total: int, chunk_size: int) -> List[Tuple[str, int, int, int]]:
+    """Порции таблицы: (таблица, номер порции, первая строка, число строк)"""
+    return [
+        (table, index, start, min(chunk_size, total - start))
+        for index, start in enumerate(range(0, total, chunk_size))
+    ]
+
+
+# ==================== СПРАВОЧНИКИ ====================
+
+def build_reference(args, password_hash: str) -> Dict[str, Any]:
+    """Дома, пользователи, комнаты, устройства, датчики и правила — строки COPY и то, что нужно воркерам"""
+    rng = random.Random(f"{args.seed}:reference")
+    homes, users, rooms, devices, sensors, rules = [], [], [], [], [], []
+    device_types, sensor_types = [], []
+
+    users.append(f"1\tadmin@example.com\t{password_hash}\tadmin\t1\n")
+    for home_id in range(1, args.homes + 1):
+        kind = rng.choice(HOME_KINDS)
+        homes.append(f"{home_id}\t{kind} {home_id}\tул. {rng.choice(STREETS)}, {rng.randint(1, 150)}\n")
+        for _ in range(args.users_per_home):
+            user_id = len(users) + 1
+            users.append(f"{user_id}\tuser{user_id - 1}@example.com\t{password_hash}\tuser\t{home_id}\n")
+        for name in ROOM_NAMES:
+            rooms.append(f"{len(rooms) + 1}\t{home_id}\t{name}\n")
+        # число устройств равномерно от 1 до 2N-1, в среднем --devices-per-home
+        for _ in range(rng.randint(1, 2 * args.devices_per_home - 1)):
+            device_id = len(devices) + 1
+            device_type = rng.choices(list(DEVICE_TYPES), weights=list(DEVICE_TYPES.values()))[0]
+            devices.append(
+                f"{device_id}\t{home_id}\t{device_type}\t{rng.choice(DEVICE_NAMES[device_type])}\t"
+                f"{rng.choice(DEVICE_STATUSES[device_type])}\n"
+            )
+            device_types.append(device_type)
+            # датчики — на каждом втором устройстве, как раньше на половине
+            if device_id % 2:
+                for sensor_type in SENSOR_TYPES:
+                    if sensor_type == "temp":
+                        value = f"{rng.randint(15, 30)}°C"
+                    elif sensor_type == "motion":
+                        value = rng.choice(["detected", "clear"])
+                    else:
+                        value = rng.choice(["open", "closed"])
+                    sensors.append(f"{len(sensors) + 1}\t{device_id}\t{sensor_type}\t{value}\n")
+                    sensor_types.append(sensor_type)
+        for _ in range(args.rules_per_home):
+            rules.append(f"{len(rules) + 1}\t{home_id}\t{rng.choice(CONDITIONS)}\t{rng.choice(RULE_ACTIONS)}\n")
+
+    return {
+        "tables": [
+            ("homes", ("id", "name", "address"), homes),
+            ("users", ("id", "email", "password_hash", "role", "home_id"), users),
+            ("rooms", ("id", "home_id", "name"), rooms),
+            ("devices", ("id", "home_id", "type", "name", "status"), devices),
+            ("sensors", ("id", "device_id", "type", "value"), sensors),
+            ("rules", ("id", "home_id", "condition", "action"), rules),
+        ],
+        "device_types": device_types,
+        "sensor_types": sensor_types,
+        "users": len(users),
+    }
+
+
+# ==================== ВОРКЕРЫ ====================
+
+def init_worker(plan: Dict[str, Any]):
+    _worker.update(plan)
+    conn = _worker["conn"] = db.get_connection()
+    cur = conn.cursor()
+    try:
+        # без проверок внешних ключей на каждую строку (ссылки генератор строит сам);
+        # доступно суперпользователю, иначе COPY просто медленнее
+        cur.execute("SET session_replication_role = replica")
+    except psycopg2.errors.InsufficientPrivilege:
+        conn.rollback()
+    # потеря последних транзакций при сбое сервера для генератора не страшна
+    cur.execute("SET synchronous_commit = off")
+    conn.commit()
+    cur.close()
+
+
+def sorted_timestamps(rng: random.Random, count: int, start: int, total: int) -> List[datetime]:
+    """Время count строк начиная со строки start из total: отрезок квантилей, по возрастанию"""
+    begin, span, distribution = _worker["begin"], _worker["span"], _worker["time_distribution"]
+    low, high = start / total, (start + count) / total
+    quantiles = sorted(low + (high - low) * rng.random() for _ in range(count))
+    return [begin + timedelta(seconds=span * time_quantile(u, distribution)) for u in quantiles]
+
+
+def generate_events(rng: random.Random, start: int, count: int) -> List[str]:
+    device_types = _worker["device_types"]
+    device_ids = rng.choices(range(1, len(device_types) + 1), cum_weights=_worker["device_weights"], k=count)
+    lines = []
+    for offset, (device_id, timestamp) in enumerate(
+        zip(device_ids, sorted_timestamps(rng, count, start, _worker["events"]))
+    ):
+        event_type = rng.choice(EVENT_TYPES[device_types[device_id - 1]])
+        value = f"{rng.randint(15, 30)}°C" if event_type == "temperature_change" else NULL
+        lines.append(f"{start + offset + 1}\t{device_id}\t{timestamp}\t{event_type}\t{value}\n")
+    return lines
+
+
+def generate_logs(rng: random.Random, start: int, count: int) -> List[str]:
+    user_ids = rng.choices(range(1, _worker["users"] + 1), cum_weights=_worker["user_weights"], k=count)
+    return [
+        f"{start + offset + 1}\t{user_id}\t{rng.choice(LOG_ACTIONS)}\t{timestamp}\n"
+        for offset, (user_id, timestamp) in enumerate(
+            zip(user_ids, sorted_timestamps(rng, count, start, _worker["logs"]))
+        )
+    ]
+
+
+def generate_sensor_readings(rng: random.Random, start: int, count: int) -> List[str]:
+    # строки идут по моментам снятия, внутри момента — по датчикам
+    sensor_types = _worker["sensor_types"]
+    readings, interval, end = _worker["readings_per_sensor"], _worker["reading_interval"], _worker["end"]
+    lines = []
+    for row in range(start, start + count):
+        slot, sensor_index = divmod(row, len(sensor_types))
+        timestamp = end - interval * (readings - slot)
+        if sensor_types[sensor_index] == "temp":
+            lines.append(f"{row + 1}\t{sensor_index + 1}\t{timestamp}\t{round(rng.uniform(15, 30), 1)}\t°C\n")
+        else:
+            lines.append(f"{row + 1}\t{sensor_index + 1}\t{timestamp}\t{float(rng.random() < 0.3)}\t{NULL}\n")
+    return lines
+
+
+GENERATORS = {
+    "events": (generate_events, ("id", "device_id", "timestamp", "event_type", "value")),
+    "logs": (generate_logs, ("id", "user_id", "action", "timestamp")),
+    "sensor_readings": (generate_sensor_readings, ("id", "sensor_id", "timestamp", "value", "unit")),
+}
+
+
+def load_chunk(task: Tuple[str, int, int, int]) -> Tuple[str, int]:
+    """Сгенерировать порцию и загрузить её одним COPY; вернуть (таблица, строк)"""
+    table, index, start, count = task
+    generate, columns = GENERATORS[table]
+    lines = generate(random.Random(f"{_worker['seed']}:{table}:{index}"), start, count)
+    conn = _worker["conn"]
+    cur = conn.cursor()
+    copy_rows(cur, table, columns, lines)
+    conn.commit()
+    cur.close()
+    return table, count
+
+
+def backfill_month(month: Tuple[datetime, datetime]) -> Tuple[str, int]:
+    """Агрегаты событий за месяц — одна секция events (как python -m app.sql.rollups backfill)"""
+    conn = _worker["conn"]
+    cur = conn.cursor()
+    for table, unit in ROLLUPS.items():
+        cur.execute(BACKFILL_SQL.format(table=table, unit=unit), {"from": month[0], "to": month[1]})
+    conn.commit()
+    cur.close()
+    return "rollup months", 1
+
+
+# ==================== ГЛАВНЫЙ ПРОЦЕСС ====================
+
+def run_parallel(pool: Pool, func, tasks: Sequence[Any], totals: Dict[str, int]):
+    """Выполнить задачи в пуле, печатая прогресс по таблицам примерно каждые 10%"""
+    done = dict.fromkeys(totals, 0)
+    reported = dict.fromkeys(totals, 0)
+    started = time.perf_counter()
+    for table, rows in pool.imap_unordered(func, tasks):
+        done[table] += rows
+        if done[table] - reported[table] >= totals[table] / 10 or done[table] == totals[table]:
+            reported[table] = done[table]
+            print(f"   {table}: {done[table]:,}/{totals[table]:,} ({time.perf_counter() - started:.0f} с)", flush=True)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--homes", type=int, default=5)
+    parser.add_argument("--users-per-home", type=int, default=1)
+    parser.add_argument("--devices-per-home", type=int, default=9, help="в среднем; от 1 до 2N-1 на дом")
+    parser.add_argument("--rules-per-home", type=int, default=10)
+    parser.add_argument("--events", type=int, default=1000)
+    parser.add_argument("--logs", type=int, default=500)
+    parser.add_argument("--readings-per-sensor", type=int, default=48)
+    parser.add_argument("--reading-interval", type=float, default=60.0, help="минут между показаниями датчика")
+    parser.add_argument("--days", type=float, default=30.0, help="период событий и логов")
+    parser.add_argument("--end", type=datetime.fromisoformat, default=None, help="конец периода (UTC)")
+    parser.add_argument(
+        "--time-distribution", choices=["uniform", "recent"], default="uniform",
+        help="recent — плотность растёт к концу периода (в ~20 раз)",
+    )
+    parser.add_argument(
+        "--skew", type=float, default=0.0,
+        help="показатель Ципфа для выбора устройств событий и авторов логов; 0 — равномерно",
+    )
+    parser.add_argument("--password", default="admin123", help="пароль всех пользователей")
+    parser.add_argument("--seed", default="smart-home")
+    parser.add_argument("--workers", type=int, default=os.cpu_count() or 1)
+    parser.add_argument("--chunk-size", type=int, default=100_000)
+    args = parser.parse_args()
+    if args.homes < 1 or args.devices_per_home < 1:
+        parser.error("--homes and --devices-per-home must be positive")
+
+    end = args.end or datetime.utcnow().replace(second=0, microsecond=0)
+    begin = end - timedelta(days=args.days)
+    started = time.perf_counter()
+
+    db.open()
+    try:
+        db.init_schema()
+        conn = db.get_connection()
+        cur = conn.cursor()
+
+        print("🌱 Начинаю заполнение БД тестовыми данными...")
+        cur.execute(f"TRUNCATE {', '.join(DATA_TABLES)} RESTART IDENTITY CASCADE")
+        # секции на весь период, чтобы строки не оседали в default-секции
+        months = month_ranges(begin, end)
+        for table in ("events", "logs"):
+            cur.execute("SELECT create_month_partitions(%s, %s, %s)", (table, begin.date(), len(months)))
+
+        # построить индекс один раз после загрузки быстрее, чем обновлять его на каждую строку
+        cur.execute(SECONDARY_INDEXES_SQL, (list(BULK_TABLES),))
+        for (index_name,) in cur.fetchall():
+            cur.execute(f"DROP INDEX {index_name}")
+
+        print("📍 Создаю дома, пользователей, комнаты, устройства, датчики и правила...")
+        reference = build_reference(args, hash_password(args.password))
+        counts = {}
+        for table, columns, lines in reference["tables"]:
+            copy_rows(cur, table, columns, lines)
+            counts[table] = len(lines)
+        conn.commit()
+
+        rng = random.Random(f"{args.seed}:popularity")
+        plan = {
+            "seed": args.seed,
+            "begin": begin,
+            "end": end,
+            "span": (end - begin).total_seconds(),
+            "time_distribution": args.time_distribution,
+            "events": args.events,
+            "logs": args.logs,
+            "users": reference["users"],
+            "device_types": reference["device_types"],
+            "sensor_types": reference["sensor_types"],
+            "device_weights": popularity(rng, len(reference["device_types"]), args.skew),
+            "user_weights": popularity(rng, reference["users"], args.skew),
+            "readings_per_sensor": args.readings_per_sensor,
+            "reading_interval": timedelta(minutes=args.reading_interval),
+        }
+        totals = {
+            "events": args.events,
+            "logs": args.logs,
+            "sensor_readings": len(reference["sensor_types"]) * args.readings_per_sensor,
+        }
+        counts.update(totals)
+        tasks = [task for table, total in totals.items() for task in chunk_tasks(table, total, args.chunk_size)]
+        # крупные порции вперёд — меньше простоя воркеров в конце
+        tasks.sort(key=lambda task: -task[3])
+
+        print(f"📝 Создаю события, логи и показания датчиков ({args.workers} процессов)...")
+        # триггеры events (сводка, агрегаты, последнее событие, NOTIFY) — пересчёт после загрузки
+        cur.execute("ALTER TABLE events DISABLE TRIGGER USER")
+        conn.commit()
+        with Pool(args.workers, initializer=init_worker, initargs=(plan,)) as pool:
+            try:
+                run_parallel(pool, load_chunk, tasks, {table: total for table, total in totals.items() if total})
+            finally:
+                # и при ошибке загрузки: схема возвращается к виду INIT_SQL
+                print("🔧 Строю индексы и включаю триггеры...")
+                conn.rollback()
+                cur.execute(INIT_SQL)
+                cur.execute("ALTER TABLE events ENABLE TRIGGER USER")
+                conn.commit()
+
+            print("🔄 Пересчитываю агрегаты событий...")
+            run_parallel(pool, backfill_month, months, {"rollup months": len(months)})
+
+        cur.execute("""
+            INSERT INTO home_events_summary (home_id, events_total)
+            SELECT d.home_id, COUNT(*)::INT
+            FROM events e
+            JOIN devices d ON d.id = e.device_id
+            GROUP BY d.home_id
+        """)
+        cur.execute("""
+            INSERT INTO device_last_event (device_id, event_id, timestamp, event_type, value)
+            SELECT d.id, e.id, e.timestamp, e.event_type, e.value
+            FROM devices d
+            CROSS JOIN LATERAL (
+                SELECT id, timestamp, event_type, value
+                FROM events
+                WHERE device_id = d.id
+                ORDER BY timestamp DESC, id DESC
+                LIMIT 1
+            ) e
+        """)
+        for table in SERIAL_TABLES:
+            cur.execute(
+                f"SELECT setval(pg_get_serial_sequence('{table}', 'id'), COALESCE(MAX(id), 0) + 1, false) FROM {table}"
+            )
+        conn.commit()
+
+        print("🔄 Обновление материализованных представлений и статистики...")
+        for view_name in ANALYTICS_VIEWS:
+            cur.execute(f"REFRESH MATERIALIZED VIEW {view_name}")
+            cur.execute(
+                "UPDATE materialized_view_refreshes SET refreshed_at = LOCALTIMESTAMP WHERE view_name = %s",
+                (view_name,),
+            )
+        conn.commit()
+        conn.autocommit = True
+        cur.execute("ANALYZE")
+        cur.close()
+        conn.close()
+    finally:
+        db.close()
+
+    print("\n" + "=" * 50)
+    print(f"✨ Заполнение завершено за {time.perf_counter() - started:.1f} с")
+    print("=" * 50)
+    for table in ("homes", "users", "rooms", "devices", "sensors", "sensor_readings", "events", "rules", "logs"):
+        print(f"✅ {table}: {counts[table]:,}")
+    print(f"🔑 admin@example.com / user1@example.com ..., пароль: {args.password}")
+    print("=" * 50)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,62 @@
+import asyncio
+from datetime import datetime
+
+from app.audit import AuditLogWriter
+from app.sql import queries
+
+
+def test_failing_record_is_dropped_and_queue_drains(monkeypatch):
+    written = []
+
+    async def insert_logs_batch(records):
+        # как VARCHAR(255): запись со слишком длинным action ломает весь INSERT
+        if any(len(action) > 255 for _, action, _ in records):
+            raise ValueError("value too long for type character varying(255)")
+        written.extend(records)
+        return len(records)
+
+    monkeypatch.setattr(queries, "insert_logs_batch", insert_logs_batch)
+    writer = AuditLogWriter(batch_size=8, flush_interval=0.01, max_queue=4, max_retries=2)
+    now = datetime(2026, 1, 1)
+
+    async def scenario():
+        writer.start()
+        for i in range(20):
+            action = "x" * 300 if i == 5 else f"action {i}"
+            await asyncio.wait_for(writer.write(1, action, now), timeout=5)
+        await asyncio.wait_for(writer.stop(), timeout=5)
+
+    asyncio.run(scenario())
+
+    assert [action for _, action, _ in written] == [f"action {i}" for i in range(20) if i != 5]
+    stats = writer.get_stats()
+    assert stats["records_lost"] == 1
+    assert stats["records_written"] == 19
+    assert stats["batches_split"] > 0
+
+
+def test_transient_error_is_retried_without_loss(monkeypatch):
+    calls = []
+
+    async def insert_logs_batch(records):
+        calls.append(len(records))
+        if len(calls) == 1:
+            raise ConnectionError("connection lost")
+        return len(records)
+
+    monkeypatch.setattr(queries, "insert_logs_batch", insert_logs_batch)
+    writer = AuditLogWriter(batch_size=10, flush_interval=0.01, max_queue=100, max_retries=3)
+
+    async def scenario():
+        writer.start()
+        for i in range(3):
+            await writer.write(1, f"action {i}", datetime(2026, 1, 1))
+        # пакет сбрасывается по времени, а не при остановке (там одна попытка)
+        await asyncio.sleep(0.2)
+        await writer.stop()
+
+    asyncio.run(scenario())
+
+    assert calls == [3, 3]
+    assert writer.get_stats()["records_lost"] == 0
+    assert writer.get_stats()["batches_split"] == 0
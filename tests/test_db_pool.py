@@ -0,0 +1,33 @@
+import pytest
+
+from app.db import ConnectionPool
+
+
+class FakeConnection:
+    closed = False
+
+    def close(self):
+        self.closed = True
+
+
+def test_open_failure_keeps_pool_size_consistent():
+    calls = []
+
+    def connect():
+        calls.append(1)
+        if len(calls) == 2:
+            raise ConnectionError("connection refused")
+        return FakeConnection()
+
+    pool = ConnectionPool(connect, min_size=3, max_size=5)
+    with pytest.raises(ConnectionError):
+        pool.open()
+
+    stats = pool.get_stats()
+    assert stats["pool_size"] == stats["pool_available"] == 1
+
+    # повторный open дозаполняет пул до min_size
+    pool.open()
+    stats = pool.get_stats()
+    assert stats["pool_size"] == stats["pool_available"] == 3
+    assert len(calls) == 4
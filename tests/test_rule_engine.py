@@ -0,0 +1,98 @@
+import asyncio
+
+from app.cache import TTLCache
+from app.rule_engine import RuleEngine, RuleSet, coerce_value, event_signal
+from app.sql import queries
+
+
+def make_rule_set(*conditions):
+    return RuleSet({"id": i, "condition": c, "action": f"action {i}"} for i, c in enumerate(conditions, 1))
+
+
+def test_coerce_value_numeric_with_unit():
+    assert coerce_value("22°C", "n") == 22.0
+    assert coerce_value("22°c", "n") == 22.0
+    assert coerce_value(" 55 %", "n") == 55.0
+    assert coerce_value("21,5°C", "n") == 21.5
+    assert coerce_value("30", "n") == 30.0
+
+
+def test_coerce_value_numeric_sensor_states():
+    assert coerce_value("detected", "n") == 1.0
+    assert coerce_value("Open", "n") == 1.0
+    assert coerce_value("closed", "n") == 0.0
+    rule_set = make_rule_set("motion > 0", "door_open == 1")
+    assert [rule.id for rule in rule_set.match("motion", "detected")] == [1]
+    assert rule_set.match("motion", "clear") == []
+    assert [rule.id for rule in rule_set.match("door_open", "open")] == [2]
+
+
+def test_coerce_value_not_numeric():
+    assert coerce_value("warm", "n") is None
+    assert coerce_value(None, "n") is None
+
+
+def test_coerce_value_bool_and_string():
+    assert coerce_value("On", "b") is True
+    assert coerce_value("false", "b") is False
+    assert coerce_value("maybe", "b") is None
+    assert coerce_value(" Away ", "s") == "away"
+
+
+def test_match_threshold_with_unit_suffixed_value():
+    rule_set = make_rule_set("temperature > 25", "temperature <= 22", "temperature >= 30", "humidity > 60")
+    signal, value = event_signal("temperature_change", "27°C")
+    assert [rule.id for rule in rule_set.match(signal, value)] == [1]
+    signal, value = event_signal("temperature_change", "22°C")
+    assert [rule.id for rule in rule_set.match(signal, value)] == [2]
+    signal, value = event_signal("temperature_change", "31 °C")
+    assert [rule.id for rule in rule_set.match(signal, value)] == [1, 3]
+
+
+def test_match_equality_and_booleans():
+    rule_set = make_rule_set("temperature == 22", "door_open == true", "door_open != true", 'mode == "away"')
+    assert [rule.id for rule in rule_set.match("temperature", "22°C")] == [1]
+    assert [rule.id for rule in rule_set.match(*event_signal("door_open", None))] == [2]
+    assert [rule.id for rule in rule_set.match(*event_signal("door_close", None))] == [3]
+    assert [rule.id for rule in rule_set.match("mode", "Away")] == [4]
+
+
+def test_match_ignores_non_numeric_values_and_unknown_signals():
+    rule_set = make_rule_set("temperature > 25")
+    assert rule_set.match("temperature", "hot") == []
+    assert rule_set.match("pressure", "1000") == []
+
+
+def test_invalid_conditions_are_skipped():
+    rule_set = make_rule_set("temperature > 25", "not a condition", "door_open > true")
+    assert rule_set.invalid == [2, 3]
+    assert rule_set.size == 1
+
+
+def test_process_events_fits_long_rule_action_into_log(monkeypatch):
+    logged = []
+
+    async def get_device_homes(device_ids):
+        return {device_id: 1 for device_id in device_ids}
+
+    async def get_rules_by_home(home_id):
+        return [{"id": 7, "condition": "temperature > 25", "action": "notify " + "x" * 400}]
+
+    async def create_logs(records):
+        logged.extend(records)
+        return len(records)
+
+    monkeypatch.setattr(queries, "get_device_homes", get_device_homes)
+    monkeypatch.setattr(queries, "get_rules_by_home", get_rules_by_home)
+    monkeypatch.setattr(queries, "create_logs", create_logs)
+    engine = RuleEngine(cache=TTLCache(maxsize=10, ttl=60), device_homes=TTLCache(maxsize=10, ttl=60))
+
+    event = {"id": 1, "device_id": 3, "event_type": "temperature_change", "value": "27°C"}
+    triggered = asyncio.run(engine.process_events(5, [event]))
+
+    assert [rule.id for _, rule in triggered] == [7]
+    assert len(logged) == 1
+    user_id, action, _ = logged[0]
+    assert user_id == 5
+    assert len(action) == queries.LOG_ACTION_MAX_LENGTH
+    assert action.startswith("Rule 7 triggered by event 1: notify xxx")
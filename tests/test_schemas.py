@@ -0,0 +1,23 @@
+from pydantic import ValidationError
+import pytest
+
+from app.schemas import EventBatchItem
+
+
+def test_event_batch_item_fits_events_columns():
+    item = EventBatchItem.model_validate({"device_id": 1, "event_type": "t" * 64, "value": "v" * 255})
+    assert item.value == "v" * 255
+    assert EventBatchItem.model_validate({"device_id": 1, "event_type": "on"}).value is None
+
+
+@pytest.mark.parametrize(
+    "payload, field",
+    [
+        ({"device_id": 1, "event_type": "t" * 65}, "event_type"),
+        ({"device_id": 1, "event_type": "on", "value": "v" * 256}, "value"),
+    ],
+)
+def test_event_batch_item_rejects_oversized_fields(payload, field):
+    with pytest.raises(ValidationError) as e:
+        EventBatchItem.model_validate(payload)
+    assert [err["loc"] for err in e.value.errors()] == [(field,)]